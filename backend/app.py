@@ -1,6 +1,5 @@
 from flask import Flask
 from flask_cors import CORS
-from models import db
 from routes.settings.host import host_bp
 from routes.settings.xapi import xapi_bp
 from routes.settings.storage import storage_bp
@@ -8,20 +7,90 @@ from routes.settings.vm import vm_bp
 from routes.backup import backup_bp
 from routes.settings.job import job_bp
 from routes.restore import restore_bp
-import dotenv, os
+from routes.metrics import metrics_bp
+from database import init_database
+from migrations import upgrade_schema
+from services.job_engine import job_engine
+from services.metrics import metrics
+from services.tracing import tracer
+from services.status_writer import status_writer
+from services.progress import progress_hub
+from services.scheduler import backup_scheduler
+from services.xapi_pool import xapi_pool
+from services.ssh_pool import ssh_pool
+from services.inventory import inventory_cache
+from services.export_engine import export_engine
+from services.delta_backup import delta_backup
+from services.chunk_store import chunk_store
+from services.retention import retention_pruner
+from services.pipeline import snapshot_pipeline
+from services.restore_engine import restore_engine
+from services.throttle import throttle
+from services.tasks import run_backup, run_restore
+import dotenv, os, json
 
-def create_app():
+def create_app(start_workers=True):
     dotenv.load_dotenv()
     app = Flask(__name__)
     
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///backup_tool.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'sqlite:///backup_tool.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_POOL_SIZE'] = int(os.getenv("DB_POOL_SIZE", 20))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    app.config['DB_POOL_TIMEOUT'] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv("DB_POOL_RECYCLE", 1800))
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 30000))
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config['JOB_WORKERS'] = int(os.getenv("JOB_WORKERS", 16))
+    app.config['JOB_STATUS_FLUSH_MS'] = int(os.getenv("JOB_STATUS_FLUSH_MS", 500))
+    app.config['JOB_HEARTBEAT_SECONDS'] = int(os.getenv("JOB_HEARTBEAT_SECONDS", 30))
+    app.config['JOB_STALE_SECONDS'] = int(os.getenv("JOB_STALE_SECONDS", 120))
+    app.config['MAX_EXPORTS_PER_HOST'] = int(os.getenv("MAX_EXPORTS_PER_HOST", 2))
+    app.config['MAX_EXPORTS_PER_SR'] = int(os.getenv("MAX_EXPORTS_PER_SR", 2))
+    app.config['HOST_EXPORT_LIMITS'] = json.loads(os.getenv("HOST_EXPORT_LIMITS", "{}"))
+    app.config['SR_EXPORT_LIMITS'] = json.loads(os.getenv("SR_EXPORT_LIMITS", "{}"))
+    app.config['XAPI_SESSIONS_PER_HOST'] = int(os.getenv("XAPI_SESSIONS_PER_HOST", 8))
+    app.config['XAPI_SESSION_IDLE_SECONDS'] = int(os.getenv("XAPI_SESSION_IDLE_SECONDS", 300))
+    app.config['SSH_TRANSPORTS_PER_HOST'] = int(os.getenv("SSH_TRANSPORTS_PER_HOST", 2))
+    app.config['SSH_CHANNELS_PER_TRANSPORT'] = int(os.getenv("SSH_CHANNELS_PER_TRANSPORT", 8))
+    app.config['SSH_PORT'] = int(os.getenv("SSH_PORT", 22))
+    app.config['INVENTORY_ENABLED'] = os.getenv("INVENTORY_ENABLED", "true").lower() == "true"
+    app.config['INVENTORY_IDLE_SECONDS'] = int(os.getenv("INVENTORY_IDLE_SECONDS", 900))
+    app.config['EXPORT_ENGINE'] = os.getenv("EXPORT_ENGINE", "ssh")
+    app.config['BACKUP_MOUNT_ROOT'] = os.getenv("BACKUP_MOUNT_ROOT", "/run/sr-mount")
+    app.config['EXPORT_CHUNK_SIZE'] = int(os.getenv("EXPORT_CHUNK_SIZE", 4 * 1024 * 1024))
+    app.config['EXPORT_BUFFER_CHUNKS'] = int(os.getenv("EXPORT_BUFFER_CHUNKS", 8))
+    app.config['EXPORT_COMPRESS_WORKERS'] = int(os.getenv("EXPORT_COMPRESS_WORKERS", 0))
+    app.config['EXPORT_COMPRESSION'] = os.getenv("EXPORT_COMPRESSION", "gzip")
+    app.config['RESTORE_ENGINE'] = os.getenv("RESTORE_ENGINE", "ssh")
+    app.config['RESTORE_RETRIES'] = int(os.getenv("RESTORE_RETRIES", 3))
+    app.config['RESTORE_RETRY_BACKOFF_SECONDS'] = int(os.getenv("RESTORE_RETRY_BACKOFF_SECONDS", 5))
+    app.config['BACKUP_TARGET'] = os.getenv("BACKUP_TARGET", "file")
+    app.config['CHUNK_COMPRESS_LEVEL'] = int(os.getenv("CHUNK_COMPRESS_LEVEL", 1))
+    app.config['SNAPSHOT_WORKERS_PER_HOST'] = int(os.getenv("SNAPSHOT_WORKERS_PER_HOST", 4))
+    app.config['DELTA_CHAIN_MAX'] = int(os.getenv("DELTA_CHAIN_MAX", 7))
+    app.config['DELTA_FULL_THRESHOLD'] = int(os.getenv("DELTA_FULL_THRESHOLD", 50))
+    app.config['RETENTION_ENABLED'] = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+    app.config['RETENTION_INTERVAL_SECONDS'] = int(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+    app.config['RETENTION_BATCH_SIZE'] = int(os.getenv("RETENTION_BATCH_SIZE", 200))
+    app.config['CHUNK_GC_GRACE_SECONDS'] = int(os.getenv("CHUNK_GC_GRACE_SECONDS", 3600))
+    app.config['THROTTLE_GLOBAL_BPS'] = int(os.getenv("THROTTLE_GLOBAL_BPS", 0))
+    app.config['THROTTLE_HOST_BPS'] = int(os.getenv("THROTTLE_HOST_BPS", 0))
+    app.config['THROTTLE_SR_BPS'] = int(os.getenv("THROTTLE_SR_BPS", 0))
+    app.config['THROTTLE_HOST_LIMITS'] = json.loads(os.getenv("THROTTLE_HOST_LIMITS", "{}"))
+    app.config['THROTTLE_SR_LIMITS'] = json.loads(os.getenv("THROTTLE_SR_LIMITS", "{}"))
+    app.config['THROTTLE_SCHEDULE'] = json.loads(os.getenv("THROTTLE_SCHEDULE", "[]"))
+    app.config['METRICS_ENABLED'] = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    app.config['TRACING_ENABLED'] = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    app.config['SCHEDULER_ENABLED'] = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    app.config['SCHEDULER_TIMEZONE'] = os.getenv("SCHEDULER_TIMEZONE", "Asia/Jakarta")
+    app.config['SCHEDULER_SPREAD_SECONDS'] = int(os.getenv("SCHEDULER_SPREAD_SECONDS", 300))
     
     dev_ip = os.getenv("DEV_IP")
     fe_port = os.getenv("FE_PORT")
     cors_origin = f"http://{dev_ip}:{fe_port}"
     
-    db.init_app(app)
+    init_database(app)
 
     app.register_blueprint(host_bp, url_prefix="/api")
     app.register_blueprint(xapi_bp, url_prefix="/api")
@@ -30,15 +99,40 @@ def create_app():
     app.register_blueprint(backup_bp, url_prefix="/api")
     app.register_blueprint(job_bp, url_prefix="/api")
     app.register_blueprint(restore_bp, url_prefix="/api")
+    # Served outside /api so Prometheus can scrape the conventional path.
+    app.register_blueprint(metrics_bp)
     
     
     CORS(app, resources={r"/api/*": {"origins": cors_origin}})
 
     with app.app_context():
-        db.create_all()
+        upgrade_schema()
+
+    metrics.init_app(app)
+    tracer.init_app(app)
+    xapi_pool.init_app(app, start=start_workers)
+    ssh_pool.init_app(app, start=start_workers)
+    inventory_cache.init_app(app, start=start_workers)
+    export_engine.init_app(app)
+    chunk_store.init_app(app)
+    delta_backup.init_app(app)
+    snapshot_pipeline.init_app(app)
+    restore_engine.init_app(app)
+    throttle.init_app(app)
+
+    status_writer.init_app(app, start=start_workers)
+    if start_workers:
+        progress_hub.add_listener(status_writer.on_progress)
+
+    job_engine.register("backup", run_backup)
+    job_engine.register("restore", run_restore)
+    job_engine.init_app(app, start=start_workers)
+    backup_scheduler.init_app(app, start=start_workers)
+    retention_pruner.init_app(app, start=start_workers)
 
     return app
 
 if __name__ == "__main__":
-    app = create_app()
+    # The debug reloader imports the app twice; only the serving child runs workers.
+    app = create_app(start_workers=os.getenv("WERKZEUG_RUN_MAIN") == "true")
     app.run(debug=True, host='0.0.0.0', threaded=True)
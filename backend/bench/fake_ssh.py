@@ -0,0 +1,144 @@
+import shlex
+import socket
+import threading
+import time
+import paramiko
+
+
+class FakeXe:
+    # Just enough of dom0's shell for the scripts services/tasks.py sends: mkdir, stat and the xe
+    # subcommands of the SSH backup path, all backed by the same FakeHost the XML-RPC server uses.
+    def __init__(self, host):
+        self.host = host
+
+    def run(self, script):
+        stdout, stderr = [], []
+        for line in script.splitlines():
+            argv = shlex.split(line)
+            if not argv:
+                continue
+            handler = getattr(self, "cmd_" + "_".join(argv[:2]).replace("-", "_"), None)
+            if handler is None:
+                handler = getattr(self, "cmd_" + argv[0].replace("-", "_"), None)
+            if handler is None:
+                stderr.append(f"{argv[0]}: command not found")
+                return "\n".join(stdout), "\n".join(stderr) + "\n", 127
+
+            if argv[0] == "xe" and self.host.latency:
+                time.sleep(self.host.latency)
+            options = dict(arg.split("=", 1) for arg in argv[1:] if "=" in arg)
+            try:
+                output = handler(argv, options)
+            except KeyError as e:
+                stderr.append(f"The uuid you supplied was invalid: {e}")
+                return "\n".join(stdout), "\n".join(stderr) + "\n", 1
+            if output:
+                stdout.append(output)
+        return "\n".join(stdout) + ("\n" if stdout else ""), "", 0
+
+    def _vm(self, vm_uuid):
+        ref = self.host.vm_by_uuid(vm_uuid)
+        if ref is None:
+            raise KeyError(vm_uuid)
+        return ref
+
+    def cmd_mkdir(self, argv, options):
+        return ""
+
+    def cmd_stat(self, argv, options):
+        return str(self.host.files.get(argv[-1], 0))
+
+    def cmd_xe_vm_snapshot(self, argv, options):
+        snap_ref = self.host.snapshot(self._vm(options["uuid"]), options["new-name-label"])
+        return self.host.vms[snap_ref]["uuid"]
+
+    def cmd_xe_template_param_set(self, argv, options):
+        self.host.vms[self._vm(options["uuid"])]["is_a_template"] = options.get("is-a-template") == "true"
+        return ""
+
+    def cmd_xe_vm_export(self, argv, options):
+        snap_uuid, path = options["uuid"], options["filename"]
+        self._vm(snap_uuid)
+        task_ref = self.host.create_task(f"Export of VM: {snap_uuid}")
+        self.host.files[path] = 0
+
+        def write(chunk):
+            self.host.files[path] += len(chunk)
+
+        self.host.stream(write, task_ref)
+        self.host.update_task(task_ref, status="success", progress=1.0)
+        return "Export succeeded"
+
+    def cmd_xe_snapshot_uninstall(self, argv, options):
+        self.host.destroy(self._vm(options["snapshot-uuid"]))
+        return "All objects destroyed"
+
+
+class FakeSshInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.execute, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+class FakeSshServer:
+    def __init__(self, host, port=0):
+        self.xe = FakeXe(host)
+        self.key = paramiko.RSAKey.generate(2048)
+        self.commands = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", port))
+        self._socket.listen(64)
+        self._transports = []
+        self._stopped = False
+
+    @property
+    def port(self):
+        return self._socket.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept, name="fake-ssh", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
+
+    def _accept(self):
+        while not self._stopped:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.key)
+            transport.start_server(server=FakeSshInterface(self))
+            self._transports.append(transport)
+
+    def execute(self, channel, command):
+        self.commands += 1
+        try:
+            stdout, stderr, status = self.xe.run(command)
+            if stdout:
+                channel.sendall(stdout.encode())
+            if stderr:
+                channel.sendall_stderr(stderr.encode())
+            channel.send_exit_status(status)
+        finally:
+            channel.close()
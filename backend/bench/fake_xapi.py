@@ -0,0 +1,321 @@
+import itertools
+import threading
+import time
+import uuid
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+STREAM_CHUNK = 64 * 1024
+GIB = 1024 ** 3
+
+
+def ok(value):
+    return {"Status": "Success", "Value": value}
+
+
+def failure(*details):
+    return {"Status": "Failure", "ErrorDescription": list(details)}
+
+
+class FakeHost:
+    # The state one simulated XCP-ng host exposes over both XML-RPC and SSH. Every RPC and every
+    # xe command pays `latency_ms`; exports stream `export_bytes` at `throughput_bps`.
+    def __init__(self, vm_count=100, latency_ms=2, throughput_bps=200 * 1024 ** 2, export_bytes=64 * 1024 ** 2):
+        self.latency = latency_ms / 1000
+        self.throughput_bps = throughput_bps
+        self.export_bytes = export_bytes
+        self.host_ref = "OpaqueRef:host-0"
+        self.sr_ref = "OpaqueRef:sr-0"
+        self.hosts = {self.host_ref: {"uuid": str(uuid.uuid4()), "name_label": "bench-host", "address": "127.0.0.1",
+                                      "enabled": True}}
+        self.srs = {self.sr_ref: {"uuid": str(uuid.uuid4()), "name_label": "bench-nfs", "type": "nfs",
+                                  "physical_size": str(16 * 1024 * GIB), "physical_utilisation": str(GIB),
+                                  "content_type": "user"}}
+        self.vms = {}
+        self.vbds = {}
+        self.vdis = {}
+        self.tasks = {}
+        self.files = {}
+        self.calls = 0
+        self.bytes_exported = 0
+        self._ids = itertools.count()
+        self._events = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._add_vm("Control domain on host: bench-host", is_control_domain=True)
+        for i in range(vm_count):
+            self._add_vm(f"bench-vm-{i:05d}")
+
+    def _ref(self, kind):
+        return f"OpaqueRef:{kind}-{next(self._ids)}"
+
+    def _add_vm(self, name_label, is_control_domain=False, is_a_template=False, snapshot_of=None):
+        vm_ref, vbd_ref, vdi_ref = self._ref("vm"), self._ref("vbd"), self._ref("vdi")
+        with self._cond:
+            self.vdis[vdi_ref] = {"uuid": str(uuid.uuid4()), "physical_utilisation": str(self.export_bytes),
+                                  "virtual_size": str(4 * self.export_bytes)}
+            self.vbds[vbd_ref] = {"uuid": str(uuid.uuid4()), "type": "Disk", "VDI": vdi_ref, "userdevice": "0"}
+            self.vms[vm_ref] = {
+                "uuid": str(uuid.uuid4()), "name_label": name_label, "power_state": "Running",
+                "memory_static_max": str(2 * GIB), "VCPUs_max": "2", "is_a_template": is_a_template,
+                "is_control_domain": is_control_domain, "resident_on": self.host_ref, "tags": [],
+                "VBDs": [vbd_ref], "snapshot_of": snapshot_of or "OpaqueRef:NULL"
+            }
+            self._emit("vm", "add", vm_ref, self.vms[vm_ref])
+        return vm_ref
+
+    def _emit(self, cls, operation, ref, snapshot=None):
+        with self._cond:
+            event = {"class": cls, "operation": operation, "ref": ref}
+            if snapshot is not None:
+                event["snapshot"] = dict(snapshot)
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def guest_vm_uuids(self):
+        vms = self.records(self.vms, lambda vm: not vm["is_control_domain"] and not vm["is_a_template"])
+        return [vm["uuid"] for vm in vms.values()]
+
+    def vm_by_uuid(self, vm_uuid):
+        with self._cond:
+            return next((ref for ref, vm in self.vms.items() if vm["uuid"] == vm_uuid), None)
+
+    def snapshot(self, vm_ref, label):
+        return self._add_vm(label, is_a_template=True, snapshot_of=vm_ref)
+
+    def destroy(self, vm_ref):
+        with self._cond:
+            vm = self.vms.pop(vm_ref, None)
+            if vm is None:
+                return
+            for vbd_ref in vm["VBDs"]:
+                self.vdis.pop(self.vbds.pop(vbd_ref, {}).get("VDI"), None)
+            self._emit("vm", "del", vm_ref)
+
+    def records(self, table, keep=None):
+        # A copy taken under the lock, so concurrent snapshots can't change the dict mid-marshal.
+        with self._cond:
+            return {ref: dict(record) for ref, record in table.items() if keep is None or keep(record)}
+
+    def create_task(self, label):
+        task_ref = self._ref("task")
+        with self._cond:
+            self.tasks[task_ref] = {"uuid": str(uuid.uuid4()), "name_label": label, "status": "pending",
+                                    "progress": 0.0, "result": "", "error_info": []}
+            self._emit("task", "add", task_ref, self.tasks[task_ref])
+        return task_ref
+
+    def update_task(self, task_ref, **fields):
+        with self._cond:
+            self.tasks[task_ref].update(fields)
+            self._emit("task", "mod", task_ref, self.tasks[task_ref])
+
+    def stream(self, write, task_ref=None):
+        # Paced in fixed chunks so the wire sees a steady rate rather than one burst and a long sleep.
+        sent = 0
+        started = time.monotonic()
+        last_event = started
+        chunk = b"\0" * STREAM_CHUNK
+        while sent < self.export_bytes:
+            size = min(STREAM_CHUNK, self.export_bytes - sent)
+            write(chunk[:size])
+            sent += size
+            if self.throughput_bps:
+                delay = started + sent / self.throughput_bps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if task_ref and time.monotonic() - last_event >= 0.25:
+                last_event = time.monotonic()
+                self.update_task(task_ref, progress=sent / self.export_bytes)
+        with self._cond:
+            self.bytes_exported += sent
+        return sent
+
+    def events_since(self, classes, token, timeout):
+        classes = {name.lower() for name in classes}
+        if token == "":
+            with self._cond:
+                position = len(self._events)
+                events = [{"class": cls, "operation": "add", "ref": ref, "snapshot": record}
+                          for cls, table in (("vm", self.vms), ("host", self.hosts), ("sr", self.srs))
+                          for ref, record in self.records(table).items()]
+            return {"events": [event for event in events if event["class"] in classes], "valid_ref_counts": {},
+                    "token": str(position)}
+
+        position = int(token)
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or len(self._events) > position, timeout)
+            events = self._events[position:]
+            position = len(self._events)
+        return {"events": [event for event in events if event["class"] in classes], "valid_ref_counts": {},
+                "token": str(position)}
+
+
+class XapiMethods:
+    def __init__(self, host):
+        self.host = host
+
+    def _dispatch(self, method, params):
+        host = self.host
+        with host._cond:
+            host.calls += 1
+        if host.latency:
+            time.sleep(host.latency)
+
+        if method == "session.login_with_password":
+            return ok(f"OpaqueRef:session-{uuid.uuid4()}")
+        handler = getattr(self, "rpc_" + method.replace(".", "_"), None)
+        if handler is None:
+            return failure("MESSAGE_METHOD_UNKNOWN", method)
+        try:
+            return ok(handler(*params[1:]))
+        except KeyError as e:
+            return failure("HANDLE_INVALID", str(e))
+
+    def rpc_session_logout(self):
+        return ""
+
+    def rpc_session_get_this_host(self, session):
+        return self.host.host_ref
+
+    def rpc_event_from(self, classes, token, timeout):
+        return self.host.events_since(classes, token, float(timeout))
+
+    def rpc_host_get_all_records(self):
+        return self.host.records(self.host.hosts)
+
+    def rpc_host_get_record(self, ref):
+        return self.host.hosts[ref]
+
+    def rpc_SR_get_all_records(self):
+        return self.host.records(self.host.srs)
+
+    def rpc_SR_get_by_uuid(self, sr_uuid):
+        return next(ref for ref, sr in self.host.srs.items() if sr["uuid"] == sr_uuid)
+
+    def rpc_VM_get_all(self):
+        return list(self.host.records(self.host.vms))
+
+    def rpc_VM_get_all_records(self):
+        return self.host.records(self.host.vms)
+
+    def rpc_VM_get_all_records_where(self, expression):
+        # Only the guest-VM filter the backend sends is understood.
+        return self.host.records(self.host.vms, lambda vm: not vm["is_a_template"] and not vm["is_control_domain"])
+
+    def rpc_VM_get_record(self, ref):
+        return self.host.vms[ref]
+
+    def rpc_VM_get_by_uuid(self, vm_uuid):
+        ref = self.host.vm_by_uuid(vm_uuid)
+        if ref is None:
+            raise KeyError(vm_uuid)
+        return ref
+
+    def rpc_VM_get_uuid(self, ref):
+        return self.host.vms[ref]["uuid"]
+
+    def rpc_VM_get_VBDs(self, ref):
+        return self.host.vms[ref]["VBDs"]
+
+    def rpc_VM_snapshot(self, ref, label):
+        return self.host.snapshot(ref, label)
+
+    def rpc_VM_set_is_a_template(self, ref, value):
+        self.host.vms[ref]["is_a_template"] = value
+        return ""
+
+    def rpc_VM_destroy(self, ref):
+        self.host.destroy(ref)
+        return ""
+
+    def rpc_VBD_get_record(self, ref):
+        return self.host.vbds[ref]
+
+    def rpc_VDI_get_physical_utilisation(self, ref):
+        return self.host.vdis[ref]["physical_utilisation"]
+
+    def rpc_VDI_get_uuid(self, ref):
+        return self.host.vdis[ref]["uuid"]
+
+    def rpc_VDI_destroy(self, ref):
+        self.host.vdis.pop(ref, None)
+        return ""
+
+    def rpc_task_create(self, label, description):
+        return self.host.create_task(label)
+
+    def rpc_task_get_status(self, ref):
+        return self.host.tasks[ref]["status"]
+
+    def rpc_task_get_result(self, ref):
+        return self.host.tasks[ref]["result"]
+
+    def rpc_task_get_error_info(self, ref):
+        return self.host.tasks[ref]["error_info"]
+
+    def rpc_task_destroy(self, ref):
+        self.host.tasks.pop(ref, None)
+        self.host._emit("task", "del", ref)
+        return ""
+
+
+class XapiRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ("/", "/RPC2")
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/export":
+            self.send_error(404)
+            return
+
+        host = self.server.host
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if query.get("ref") not in host.vms:
+            self.send_error(404)
+            return
+
+        # XAPI streams exports without a length and ends them by closing the connection.
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        host.stream(self.wfile.write)
+        task_ref = query.get("task_id")
+        if task_ref in host.tasks:
+            host.update_task(task_ref, status="success", progress=1.0)
+
+
+class FakeXapiServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, host, port=0):
+        super().__init__(("127.0.0.1", port), requestHandler=XapiRequestHandler, allow_none=True, logRequests=False)
+        self.host = host
+        self.register_instance(XapiMethods(host))
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-xapi", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.host.close()
+        self.shutdown()
+        self.server_close()
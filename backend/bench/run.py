@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BENCHMARKS = ("vm_list", "storage_list", "job_list", "backup_vm")
+FINAL_STATUSES = ("Success", "Failed")
+SEED_BATCH = 10000
+SEED_BACKUPS = 10
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backend against a simulated XCP-ng host.")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmarks to run")
+    parser.add_argument("--vms", type=int, default=500, help="VMs on the simulated host")
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="delay added to every XAPI call and xe command")
+    parser.add_argument("--throughput-mbps", type=float, default=200.0, help="export rate per stream, MiB/s")
+    parser.add_argument("--export-mb", type=int, default=64, help="size of each simulated VM export, MiB")
+    parser.add_argument("--requests", type=int, default=200, help="requests per listing benchmark")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients for listing benchmarks")
+    parser.add_argument("--job-rows", type=int, default=100000, help="job rows seeded for the job listing benchmark")
+    parser.add_argument("--backups", type=int, default=8, help="concurrent backup_vm runs")
+    parser.add_argument("--engine", choices=("ssh", "http"), default="ssh", help="export engine for backup_vm")
+    parser.add_argument("--no-inventory", action="store_true", help="read XAPI directly instead of the event cache")
+    parser.add_argument("--timeout", type=int, default=600, help="seconds to wait for backup jobs to finish")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results to compare against; exits 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    return parser.parse_args(argv)
+
+
+def summarize(latencies, errors, elapsed, concurrency):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 3)
+
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3) if ordered else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else None,
+        "requests_per_second": round(len(ordered) / elapsed, 2) if elapsed else None
+    }
+
+
+def hammer(app, path, requests, concurrency):
+    # One test client per worker thread; requests go through the full WSGI stack without a socket.
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def call(_):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        started = time.perf_counter()
+        response = local.client.get(path)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    return summarize(latencies, errors[0], time.perf_counter() - started, concurrency)
+
+
+def bench_vm_list(ctx):
+    path = f"/api/vm/list?host_ip={ctx['host_ip']}"
+    response = ctx["app"].test_client().get(path)
+    result = hammer(ctx["app"], path, ctx["args"].requests, ctx["args"].concurrency)
+    result["vms"] = response.get_json()["count"]
+    return result
+
+
+def bench_storage_list(ctx):
+    path = f"/api/storage/list?host_ip={ctx['host_ip']}"
+    ctx["app"].test_client().get(path)
+    return hammer(ctx["app"], path, ctx["args"].requests, ctx["args"].concurrency)
+
+
+def seed_jobs(ctx, rows):
+    from sqlalchemy import insert
+    from models import db, Backup, Job
+
+    rng = random.Random(ctx["args"].seed)
+    vm_uuids = ctx["fake"].guest_vm_uuids()
+    now = datetime.utcnow()
+
+    with ctx["app"].app_context():
+        backups = [Backup(name=f"bench-{i}", description="bench", sr_uuid=ctx["sr_uuid"], sr_name="bench-nfs",
+                          vm_uuid=vm_uuids[i % len(vm_uuids)], vm_name=f"bench-vm-{i:05d}", host_ip=ctx["host_ip"],
+                          active=False, retention=7, cron_schedule="0 1 * * *") for i in range(SEED_BACKUPS)]
+        db.session.add_all(backups)
+        db.session.commit()
+        backup_ids = [backup.id for backup in backups]
+
+        started = time.perf_counter()
+        for offset in range(0, rows, SEED_BATCH):
+            batch = []
+            for i in range(offset, min(rows, offset + SEED_BATCH)):
+                started_at = now - timedelta(minutes=rows - i)
+                is_backup = rng.random() < 0.9
+                batch.append({
+                    "job_uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+                    "type": "backup" if is_backup else "restore",
+                    "status": "Success" if rng.random() < 0.9 else "Failed",
+                    "mode": rng.choice(("full", "delta")) if is_backup else None,
+                    "output_message": "Export succeeded: 67108864 bytes written",
+                    "backup_id": rng.choice(backup_ids) if is_backup else None,
+                    "started_at": started_at,
+                    "completed_at": started_at + timedelta(seconds=rng.randint(30, 900))
+                })
+            db.session.execute(insert(Job), batch)
+            db.session.commit()
+        return backup_ids, round(time.perf_counter() - started, 3)
+
+
+def bench_job_list(ctx):
+    rows = ctx["args"].job_rows
+    backup_ids, seed_seconds = seed_jobs(ctx, rows)
+    app, requests, concurrency = ctx["app"], ctx["args"].requests, ctx["args"].concurrency
+
+    # Walk far enough in to prove keyset pages don't slow down with depth.
+    client = app.test_client()
+    cursor = None
+    for _ in range(50):
+        response = client.get("/api/job/list?limit=200" + (f"&cursor={cursor}" if cursor else "")).get_json()
+        cursor = response["next_cursor"]
+        if not cursor:
+            break
+
+    return {
+        "rows": rows,
+        "seed_seconds": seed_seconds,
+        "first_page": hammer(app, "/api/job/list", requests, concurrency),
+        "filtered": hammer(app, "/api/job/list?type=backup&status=Failed&limit=100", requests, concurrency),
+        "by_backup": hammer(app, f"/api/job/list/backup/{backup_ids[0]}", requests, concurrency),
+        "deep_page": hammer(app, f"/api/job/list?cursor={cursor}", requests, concurrency) if cursor else None
+    }
+
+
+def bench_backup_vm(ctx):
+    from models import db, Job
+
+    args, app, fake = ctx["args"], ctx["app"], ctx["fake"]
+    vm_uuids = fake.guest_vm_uuids()[:args.backups]
+    exported_before = fake.bytes_exported
+
+    def submit(vm_uuid):
+        started = time.perf_counter()
+        response = app.test_client().post("/api/xapi/backup_vm", json={
+            "host_ip": ctx["host_ip"], "vm_uuid": vm_uuid, "sr_uuid": ctx["sr_uuid"], "engine": args.engine
+        })
+        return time.perf_counter() - started, response.get_json().get("job_id")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(vm_uuids) or 1) as pool:
+        submitted = list(pool.map(submit, vm_uuids))
+    job_ids = [job_id for _, job_id in submitted if job_id is not None]
+
+    deadline = time.monotonic() + args.timeout
+    with app.app_context():
+        while True:
+            jobs = db.session.query(Job.status, Job.started_at, Job.completed_at, Job.output_message).filter(
+                Job.id.in_(job_ids)).all()
+            db.session.remove()
+            if all(job.status in FINAL_STATUSES for job in jobs) or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+    wall = time.perf_counter() - started
+
+    durations = sorted((job.completed_at - job.started_at).total_seconds() for job in jobs if job.completed_at)
+    exported = fake.bytes_exported - exported_before
+    return {
+        "jobs": len(vm_uuids),
+        "engine": args.engine,
+        "submit": summarize([latency for latency, _ in submitted], len(vm_uuids) - len(job_ids), wall, len(vm_uuids)),
+        "succeeded": sum(job.status == "Success" for job in jobs),
+        "failed": sum(job.status == "Failed" for job in jobs),
+        "timed_out": sum(job.status not in FINAL_STATUSES for job in jobs),
+        "errors": sorted({job.output_message for job in jobs if job.status == "Failed"})[:5],
+        "wall_seconds": round(wall, 3),
+        "job_seconds_p50": round(durations[len(durations) // 2], 3) if durations else None,
+        "job_seconds_max": round(durations[-1], 3) if durations else None,
+        "bytes_exported": exported,
+        "aggregate_bytes_per_second": round(exported / wall) if wall else None
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Lower is better for every metric compared; missing or zero baselines are skipped.
+    watched = ("p50_ms", "p95_ms", "wall_seconds")
+    regressions = []
+
+    def walk(current, previous, path):
+        for key, value in current.items():
+            before = previous.get(key) if isinstance(previous, dict) else None
+            if isinstance(value, dict):
+                walk(value, before, f"{path}.{key}" if path else key)
+            elif key in watched and isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                if value > before * (1 + tolerance):
+                    regressions.append({"metric": f"{path}.{key}", "baseline": before, "current": value,
+                                        "change": round(value / before - 1, 3)})
+
+    walk(results, baseline.get("results", {}), "")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = [name for name in args.only.split(",") if name]
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    from bench.fake_xapi import FakeHost, FakeXapiServer
+    from bench.fake_ssh import FakeSshServer
+
+    fake = FakeHost(args.vms, args.latency_ms, int(args.throughput_mbps * 1024 ** 2), args.export_mb * 1024 ** 2)
+    xapi = FakeXapiServer(fake).start()
+    ssh = FakeSshServer(fake).start()
+    workdir = tempfile.mkdtemp(prefix="xcp-bench-")
+
+    # The app reads its configuration from the environment, so the fake host is wired in before import.
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "BACKUP_MOUNT_ROOT": workdir,
+        "SSH_PORT": str(ssh.port),
+        "EXPORT_ENGINE": args.engine,
+        "INVENTORY_ENABLED": "false" if args.no_inventory else "true",
+        "SCHEDULER_ENABLED": "false",
+        "RETENTION_ENABLED": "false"
+    })
+    from app import create_app
+    from models import db, Host
+
+    app = create_app(start_workers=True)
+    host_ip = f"127.0.0.1:{xapi.port}"
+    with app.app_context():
+        host = Host(name="bench", host_ip=host_ip, username="root", password="bench", connected=True)
+        db.session.add(host)
+        db.session.commit()
+        host_id = host.id
+
+    ctx = {"args": args, "app": app, "fake": fake, "host_ip": host_ip, "host_id": host_id,
+           "sr_uuid": next(iter(fake.srs.values()))["uuid"]}
+    runners = {"vm_list": bench_vm_list, "storage_list": bench_storage_list,
+               "job_list": bench_job_list, "backup_vm": bench_backup_vm}
+
+    results = {}
+    for name in selected:
+        started = time.perf_counter()
+        results[name] = runners[name](ctx)
+        results[name]["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "fake_host": {"xapi_calls": fake.calls, "ssh_commands": ssh.commands},
+        "results": results
+    }
+
+    if args.baseline:
+        with open(args.baseline) as source:
+            report["regressions"] = compare(results, json.load(source), args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as out:
+            out.write(output + "\n")
+    else:
+        print(output)
+
+    ssh.stop()
+    xapi.stop()
+    # Job workers and pool reapers are daemon threads; nothing else needs shutting down.
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
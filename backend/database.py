@@ -0,0 +1,52 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from models import db
+
+
+def engine_options(app):
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() == "sqlite":
+        # A file-backed SQLite engine still pools connections; size it so job workers and
+        # request threads don't queue on the pool before they ever reach the database.
+        return {
+            "pool_size": app.config['DB_POOL_SIZE'],
+            "max_overflow": app.config['DB_MAX_OVERFLOW'],
+            "connect_args": {"check_same_thread": False}
+        }
+
+    return {
+        "pool_size": app.config['DB_POOL_SIZE'],
+        "max_overflow": app.config['DB_MAX_OVERFLOW'],
+        "pool_timeout": app.config['DB_POOL_TIMEOUT'],
+        "pool_recycle": app.config['DB_POOL_RECYCLE'],
+        "pool_pre_ping": True
+    }
+
+
+def init_database(app):
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app))
+    db.init_app(app)
+
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            event.listen(db.engine, "connect", sqlite_pragmas(app))
+
+
+def sqlite_pragmas(app):
+    busy_timeout = int(app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS value: {synchronous}")
+
+    def on_connect(dbapi_connection, connection_record):
+        # WAL lets API reads proceed while a worker commits; NORMAL only fsyncs at checkpoints,
+        # which is still crash-safe in WAL mode. The busy timeout makes writers wait instead of
+        # failing with "database is locked".
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.close()
+
+    return on_connect
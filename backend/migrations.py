@@ -0,0 +1,61 @@
+from sqlalchemy import Integer, MetaData, inspect, text
+from models import db, Backup
+
+# Arbitrary key for the Postgres advisory lock that serialises schema upgrades across processes.
+SCHEMA_LOCK_KEY = 0x78637062
+
+# Indexes replaced by later ones; dropped so they stop costing writes.
+OBSOLETE_INDEXES = ["ix_jobs_backup_type_started", "ix_jobs_restore_type_started"]
+
+
+def upgrade_schema():
+    with db.engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+        db.metadata.create_all(connection)
+        inspector = inspect(connection)
+
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+        _backup_host_ip_to_string(connection, inspector)
+
+        for name in OBSOLETE_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def _backup_host_ip_to_string(connection, inspector):
+    # backups.host_ip was declared as an integer foreign key to hosts.id but has always held the
+    # host's IP. Values that happen to be host ids are mapped to that host's IP on the way over.
+    column = next(column for column in inspector.get_columns('backups') if column['name'] == 'host_ip')
+    if not isinstance(column['type'], Integer):
+        return
+
+    host_ip = ("COALESCE((SELECT hosts.host_ip FROM hosts WHERE hosts.id = backups.host_ip), "
+               "CAST(backups.host_ip AS VARCHAR(45)))")
+
+    if connection.dialect.name == "sqlite":
+        # SQLite can't change a column's type or drop a foreign-key column, so the table is rebuilt.
+        rebuilt = Backup.__table__.to_metadata(MetaData(), name="backups_upgrade")
+        rebuilt.create(connection)
+        names = [column.name for column in Backup.__table__.columns]
+        selected = ", ".join(host_ip if name == "host_ip" else name for name in names)
+        connection.execute(text(f"INSERT INTO backups_upgrade ({', '.join(names)}) SELECT {selected} FROM backups"))
+        connection.execute(text("DROP TABLE backups"))
+        connection.execute(text("ALTER TABLE backups_upgrade RENAME TO backups"))
+        return
+
+    connection.execute(text("ALTER TABLE backups ADD COLUMN host_ip_upgrade VARCHAR(45)"))
+    connection.execute(text(f"UPDATE backups SET host_ip_upgrade = {host_ip}"))
+    connection.execute(text("ALTER TABLE backups DROP COLUMN host_ip"))
+    connection.execute(text("ALTER TABLE backups RENAME COLUMN host_ip_upgrade TO host_ip"))
+    connection.execute(text("ALTER TABLE backups ALTER COLUMN host_ip SET NOT NULL"))
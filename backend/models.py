@@ -7,6 +7,9 @@ db = SQLAlchemy()
 def generate_uuid():
     return str(uuid.uuid4())
 
+# Successful backup jobs the pruner hasn't removed; kept verbatim so the partial index below matches the queries.
+RETAINED_BACKUP_JOB = db.text("type = 'backup' AND status = 'Success' AND pruned_at IS NULL")
+
 class Host(db.Model):
     __tablename__ = 'hosts'
 
@@ -17,7 +20,8 @@ class Host(db.Model):
     password = db.Column(db.String(128), nullable=False) 
     connected = db.Column(db.Boolean, default=False, nullable=False)
 
-    backup_jobs = db.relationship('Backup', backref='host', lazy=True)
+    backup_jobs = db.relationship('Backup', backref='host', lazy=True, viewonly=True,
+                                  primaryjoin='Host.host_ip == foreign(Backup.host_ip)')
 
 class Backup(db.Model):
     __tablename__ = 'backups'
@@ -29,10 +33,16 @@ class Backup(db.Model):
     sr_name = db.Column(db.String(64), nullable=False)
     vm_uuid = db.Column(db.String(64), nullable=False)
     vm_name = db.Column(db.String(64), nullable=False)
-    host_ip = db.Column(db.Integer, db.ForeignKey('hosts.id'), nullable=False)
+    host_ip = db.Column(db.String(45), nullable=False)
     active = db.Column(db.Boolean, nullable=False)
     retention = db.Column(db.Integer, nullable=False)
+    keep_daily = db.Column(db.Integer, nullable=True)
+    keep_weekly = db.Column(db.Integer, nullable=True)
+    keep_monthly = db.Column(db.Integer, nullable=True)
     cron_schedule = db.Column(db.String(50), nullable=False)
+    backup_mode = db.Column(db.String(10), nullable=True, default="full")
+    compression = db.Column(db.String(10), nullable=True)
+    compression_level = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     restore_jobs = db.relationship('Restore', backref='backup', lazy=True)
@@ -48,22 +58,76 @@ class Restore(db.Model):
     power_on_after_restore = db.Column(db.Boolean, default=True)
     
     backup_id = db.Column(db.Integer, db.ForeignKey('backups.id'), nullable=True)
-    restored_at = db.Column(db.DateTime, default=datetime.utcnow)
+    restored_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 
 class Job(db.Model):
     __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_backup_type_id', 'backup_id', 'type', 'id'),
+        db.Index('ix_jobs_restore_type_id', 'restore_id', 'type', 'id'),
+        db.Index('ix_jobs_retained_backups', 'backup_id', 'started_at',
+                 sqlite_where=RETAINED_BACKUP_JOB, postgresql_where=RETAINED_BACKUP_JOB),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     job_uuid = db.Column(db.String(64), default=generate_uuid, unique=True)
     type = db.Column(db.String(20), nullable=False)
     status = db.Column(db.String(20), nullable=False, default="Started")
     output_message = db.Column(db.Text, nullable=True)
+    params = db.Column(db.Text, nullable=True)
+    mode = db.Column(db.String(10), nullable=True)
+    codec = db.Column(db.String(10), nullable=True)
+    engine = db.Column(db.String(10), nullable=True)
+    worker_id = db.Column(db.String(64), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    snapshot_uuid = db.Column(db.String(64), nullable=True)
+    batch_uuid = db.Column(db.String(64), nullable=True, index=True)
+    stage = db.Column(db.String(20), nullable=True)
+    stage_timings = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Float, nullable=True)
+    bytes_transferred = db.Column(db.BigInteger, nullable=True)
+    bytes_per_second = db.Column(db.BigInteger, nullable=True)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
+    pruned_at = db.Column(db.DateTime, nullable=True)
 
     backup_id = db.Column(db.Integer, db.ForeignKey('backups.id'), nullable=True)
     backup = db.relationship('Backup', backref=db.backref('jobs', lazy=True))
 
     restore_id = db.Column(db.Integer, db.ForeignKey('restores.id'), nullable=True)
     restore = db.relationship('Restore', backref=db.backref('jobs', lazy=True))
+
+    parent_job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=True)
+    parent_job = db.relationship('Job', remote_side=[id])
+
+    disks = db.relationship('JobDisk', backref='job', lazy=True)
+
+
+class JobDisk(db.Model):
+    __tablename__ = 'job_disks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=False)
+    userdevice = db.Column(db.String(8), nullable=False)
+    vdi_uuid = db.Column(db.String(64), nullable=False)
+    snapshot_vdi_uuid = db.Column(db.String(64), nullable=False)
+    virtual_size = db.Column(db.BigInteger, nullable=True)
+    changed_bytes = db.Column(db.BigInteger, nullable=True)
+    path = db.Column(db.String(255), nullable=True)
+
+
+class JobSpan(db.Model):
+    __tablename__ = 'job_spans'
+
+    # Times are integer microseconds since the epoch; seq orders spans within a job and doubles as
+    # the span id the OpenTelemetry export derives.
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=False, index=True)
+    seq = db.Column(db.SmallInteger, nullable=False)
+    parent_seq = db.Column(db.SmallInteger, nullable=True)
+    name = db.Column(db.String(30), nullable=False)
+    start_us = db.Column(db.BigInteger, nullable=False)
+    duration_us = db.Column(db.BigInteger, nullable=False)
+    error = db.Column(db.Boolean, nullable=False, default=False)
+    bytes = db.Column(db.BigInteger, nullable=True)
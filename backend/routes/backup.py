@@ -1,16 +1,58 @@
 import XenAPI
-from flask import Blueprint, request, jsonify
-from models import db, Host, Backup
+from flask import Blueprint, current_app, request, jsonify
+from models import db, Host, Backup, Job, JobSpan
+from datetime import datetime
+from statistics import median
+from sqlalchemy import func
 from pytz import timezone
-from sqlalchemy.orm import joinedload
+from services.scheduler import backup_scheduler
+from services.retention import retention_pruner
+from services.backup_history import latest_successful_jobs, latest_successful_jobs_by_backup, policy_limit
+from services.compression import CODECS, LEVEL_RANGES
+from services.cron import CronSchedule, CronError
 
 WIB = timezone('Asia/Jakarta')
+TIMINGS_LIMIT = 30
+MAX_TIMINGS_LIMIT = 500
+MAX_ACTIVE_LIMIT = 500
 backup_bp = Blueprint("backup_bp", __name__)
 
+
+def _compression_error(codec, level):
+    if codec not in (None, *CODECS):
+        return f"compression must be one of: {', '.join(CODECS)}"
+    if level is None:
+        return None
+
+    # Without a codec of its own the backup exports with the server default, so the level applies to that.
+    codec = codec or current_app.config.get('EXPORT_COMPRESSION', 'gzip')
+    if codec not in LEVEL_RANGES:
+        return f"compression_level can't be set when compression is '{codec}'"
+    low, high = LEVEL_RANGES[codec]
+    if isinstance(level, bool) or not isinstance(level, int) or not low <= level <= high:
+        return f"compression_level for {codec} must be an integer from {low} to {high}"
+    return None
+
+
+def _cron_error(expression):
+    # Parsing alone isn't enough: a schedule like "0 0 31 2 *" is well-formed but never fires.
+    try:
+        CronSchedule(expression or "").next_after(datetime.now())
+    except CronError as e:
+        return str(e)
+    return None
+
+
 @backup_bp.route('/backup/add', methods=['POST'])
 def add_backup():
     data = request.json
 
+    error = _compression_error(data.get('compression'), data.get('compression_level'))
+    if not error:
+        error = _cron_error(data.get('cron_schedule'))
+    if error:
+        return jsonify({'error': error}), 400
+
     try:
         new_backup = Backup(
             name=data['name'],
@@ -22,10 +64,17 @@ def add_backup():
             host_ip=data['host_ip'],
             active=data['active'],
             retention=data['retention'],
-            cron_schedule=data.get('cron_schedule')
+            cron_schedule=data.get('cron_schedule'),
+            backup_mode=data.get('backup_mode', 'full'),
+            keep_daily=data.get('keep_daily'),
+            keep_weekly=data.get('keep_weekly'),
+            keep_monthly=data.get('keep_monthly'),
+            compression=data.get('compression'),
+            compression_level=data.get('compression_level')
         )
         db.session.add(new_backup)
         db.session.commit()       
+        backup_scheduler.reschedule()
         
         return jsonify({'message': 'Backup job added', 'id': new_backup.id}), 201
     except Exception as e:
@@ -54,12 +103,29 @@ def list_backup():
             'active': b.active,
             'retention': b.retention,
             'cron_schedule': b.cron_schedule,
+            'backup_mode': b.backup_mode,
+            'keep_daily': b.keep_daily,
+            'keep_weekly': b.keep_weekly,
+            'keep_monthly': b.keep_monthly,
+            'compression': b.compression,
+            'compression_level': b.compression_level,
             'created_at': b.created_at.isoformat()
         }
         for b in backups
     ])
 
 
+@backup_bp.route('/backup/schedule', methods=['GET'])
+def list_backup_schedule():
+    return jsonify([
+        {
+            'backup_id': backup_id,
+            'next_run_at': datetime.fromtimestamp(fire_at, WIB).isoformat()
+        }
+        for fire_at, backup_id in backup_scheduler.upcoming()
+    ])
+
+
 @backup_bp.route('/backup/list/<int:backup_id>', methods=['GET'])
 def list_backup_by_id(backup_id):
     backup = Backup.query.get(backup_id)
@@ -79,47 +145,133 @@ def list_backup_by_id(backup_id):
         'active': backup.active,
         'retention': backup.retention,
         'cron_schedule': backup.cron_schedule,
+        'backup_mode': backup.backup_mode,
+        'keep_daily': backup.keep_daily,
+        'keep_weekly': backup.keep_weekly,
+        'keep_monthly': backup.keep_monthly,
+        'compression': backup.compression,
+        'compression_level': backup.compression_level,
         'created_at': backup.created_at.astimezone(WIB).isoformat()
     })
 
+def serialize_version(job, backup):
+    return {
+        'job_id': job.id,
+        'job_uuid': job.job_uuid,
+        'status': job.status,
+        'mode': job.mode,
+        'codec': job.codec,
+        'started_at': job.started_at.astimezone(WIB).isoformat(),
+        'completed_at': job.completed_at.astimezone(WIB).isoformat() if job.completed_at else None,
+        'backup': {
+            'id': backup.id,
+            'name': backup.name,
+            'description': backup.description,
+            'vm_name': backup.vm_name,
+            'vm_uuid': backup.vm_uuid,
+            'created_at': backup.created_at.astimezone(WIB).isoformat()
+        }
+    }
+
+
 @backup_bp.route('/backup/list/active/<int:backup_id>', methods=['GET'])
 def list_active_backups_by_id(backup_id):
-    backup = Backup.query.options(joinedload(Backup.jobs)).get(backup_id)
+    backup = db.session.get(Backup, backup_id)
 
     if not backup:
         return jsonify({'error': 'Backup not found'}), 404
-    print(backup.__dict__)
-    for job in backup.jobs:
-        print(job.__dict__)
-    successful_jobs = sorted(
-        [job for job in backup.jobs if job.type == 'backup' and job.status == 'Success'],
-        key=lambda job: job.started_at,
-        reverse=True
-    )
-
-    retained_jobs = successful_jobs[:backup.retention]
-
-    result = [
-        {
-            'job_id': job.id,
-            'job_uuid': job.job_uuid,
-            'status': job.status,
-            'output_message': job.output_message,
-            'started_at': job.started_at.astimezone(WIB).isoformat(),
-            'completed_at': job.completed_at.astimezone(WIB).isoformat() if job.completed_at else None,
-            'backup': {
-                'id': backup.id,
-                'name': backup.name,
-                'description': backup.description,
-                'vm_name': backup.vm_name,
-                'vm_uuid' : backup.vm_uuid,
-                'created_at': backup.created_at.astimezone(WIB).isoformat()
+
+    try:
+        limit = min(max(int(request.args['limit']), 1), MAX_ACTIVE_LIMIT) if request.args.get('limit') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    if limit is None:
+        limit = db.session.query(policy_limit()).filter(Backup.id == backup_id).scalar()
+
+    return jsonify([serialize_version(job, backup) for job in latest_successful_jobs(backup_id, limit)])
+
+
+@backup_bp.route('/backup/list/active', methods=['GET'])
+def list_active_backups():
+    try:
+        limit = min(max(int(request.args['limit']), 1), MAX_ACTIVE_LIMIT) if request.args.get('limit') else None
+        backup_ids = [int(i) for i in request.args['backup_ids'].split(',')] if request.args.get('backup_ids') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    jobs_by_backup = latest_successful_jobs_by_backup(limit, backup_ids)
+    backups = Backup.query.filter(Backup.id.in_(list(jobs_by_backup))).all() if jobs_by_backup else []
+
+    return jsonify({
+        str(backup.id): [serialize_version(job, backup) for job in jobs_by_backup[backup.id]]
+        for backup in backups
+    })
+
+
+@backup_bp.route('/backup/<int:backup_id>/prune', methods=['POST'])
+def prune_backup(backup_id):
+    data = request.get_json(silent=True) or {}
+
+    try:
+        result = retention_pruner.prune(backup_id, dry_run=data.get('dry_run', False))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+    if result is None:
+        return jsonify({'error': 'Backup not found'}), 404
+    return jsonify(result)
+
+
+@backup_bp.route('/backup/<int:backup_id>/timings', methods=['GET'])
+def get_backup_timings(backup_id):
+    if not db.session.get(Backup, backup_id):
+        return jsonify({'error': 'Backup not found'}), 404
+
+    limit = request.args.get('limit', TIMINGS_LIMIT, type=int)
+    if limit < 1 or limit > MAX_TIMINGS_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {MAX_TIMINGS_LIMIT}'}), 400
+
+    jobs = db.session.query(Job.id, Job.job_uuid, Job.status, Job.mode, Job.started_at, Job.completed_at).filter(
+        Job.backup_id == backup_id,
+        Job.type == "backup",
+        Job.completed_at.isnot(None)
+    ).order_by(Job.started_at.desc(), Job.id.desc()).limit(limit).all()
+
+    # Repeated spans (a transfer per disk, a second cleanup) are summed per job.
+    totals = {}
+    if jobs:
+        for job_id, name, duration_us, transferred in db.session.query(
+            JobSpan.job_id, JobSpan.name, func.sum(JobSpan.duration_us), func.sum(JobSpan.bytes)
+        ).filter(JobSpan.job_id.in_([job.id for job in jobs])).group_by(JobSpan.job_id, JobSpan.name):
+            totals.setdefault(job_id, {})[name] = {
+                'seconds': round(duration_us / 1e6, 3),
+                'bytes': int(transferred) if transferred is not None else None
             }
+
+    history = [{
+        'job_uuid': job.job_uuid,
+        'status': job.status,
+        'mode': job.mode,
+        'started_at': job.started_at.astimezone(WIB).isoformat(),
+        'total_seconds': round((job.completed_at - job.started_at).total_seconds(), 3),
+        'spans': totals.get(job.id, {})
+    } for job in reversed(jobs)]
+
+    # The newest successful run against the window's median shows which span regressed.
+    succeeded = [entry for entry in history if entry['status'] == "Success"]
+    summary = {}
+    for name in sorted({name for entry in succeeded for name in entry['spans']}):
+        values = [entry['spans'][name]['seconds'] for entry in succeeded if name in entry['spans']]
+        latest = succeeded[-1]['spans'].get(name, {}).get('seconds')
+        typical = median(values)
+        summary[name] = {
+            'median_seconds': round(typical, 3),
+            'latest_seconds': latest,
+            'latest_vs_median': round(latest / typical, 2) if latest is not None and typical else None
         }
-        for job in retained_jobs
-    ]
 
-    return jsonify(result)
+    return jsonify({'backup_id': backup_id, 'jobs': history, 'summary': summary})
 
 
 @backup_bp.route('/backup/update/<int:backup_id>', methods=['PATCH'])
@@ -127,12 +279,22 @@ def update_backup(backup_id):
     backup = Backup.query.get_or_404(backup_id)
     data = request.json
 
-    for field in ['name', 'description', 'active', 'retention', 'cron_schedule']:
+    error = _compression_error(data.get('compression', backup.compression),
+                               data.get('compression_level', backup.compression_level))
+    if not error and 'cron_schedule' in data:
+        error = _cron_error(data['cron_schedule'])
+    if error:
+        return jsonify({'error': error}), 400
+
+    for field in ['name', 'description', 'active', 'retention', 'cron_schedule', 'backup_mode',
+                  'keep_daily', 'keep_weekly', 'keep_monthly', 'compression', 'compression_level']:
         if field in data:
             setattr(backup, field, data[field])
 
     try:
         db.session.commit()
+        backup_scheduler.reschedule()
+        retention_pruner.request(backup_id)
         return jsonify({'message': 'Backup updated'})
     except Exception as e:
         db.session.rollback()
@@ -145,6 +307,7 @@ def delete_backup(backup_id):
     try:
         db.session.delete(backup)
         db.session.commit()
+        backup_scheduler.reschedule()
         return jsonify({'message': 'Backup deleted'})
     except Exception as e:
         db.session.rollback()
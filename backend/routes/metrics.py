@@ -0,0 +1,12 @@
+from flask import Blueprint, Response, jsonify
+from services.metrics import metrics
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
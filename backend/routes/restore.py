@@ -1,6 +1,9 @@
+import base64
 from flask import Blueprint, request, jsonify
+from sqlalchemy import and_, or_
 from models import db, Restore, Backup
 from pytz import timezone
+from datetime import datetime
 
 WIB = timezone('Asia/Jakarta')
 restore_bp = Blueprint("restore_bp", __name__)
@@ -27,46 +30,93 @@ def add_restore():
         return jsonify({'error': str(e)}), 400
 
 
+RESTORE_PAGE_SIZE = 100
+MAX_RESTORE_PAGE_SIZE = 500
+
+
+def restore_rows():
+    # One outer join with only the columns the list needs, instead of lazy-loading r.backup per row.
+    return db.session.query(
+        Restore.id,
+        Restore.sr_uuid,
+        Restore.host_ip,
+        Restore.preserve,
+        Restore.power_on_after_restore,
+        Restore.backup_id,
+        Restore.restored_at,
+        Backup.vm_name,
+        Backup.name.label('backup_name'),
+        Backup.sr_name
+    ).outerjoin(Backup, Backup.id == Restore.backup_id)
+
+
+def serialize_restore(r):
+    return {
+        'id': r.id,
+        'sr_uuid': r.sr_uuid,
+        'host_ip': r.host_ip,
+        'preserve': r.preserve,
+        'power_on_after_restore': r.power_on_after_restore,
+        'backup_id': r.backup_id,
+        'vm_name': r.vm_name,
+        'backup_name': r.backup_name,
+        'sr_name': r.sr_name,
+        'restored_at': r.restored_at.astimezone(WIB).isoformat() if r.restored_at else None
+    }
+
+
+def _encode_cursor(restored_at, restore_id):
+    stamp = restored_at.isoformat() if restored_at else ""
+    return base64.urlsafe_b64encode(f"{stamp}|{restore_id}".encode()).decode()
+
+
+def _decode_cursor(cursor):
+    restored_at, restore_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(restored_at) if restored_at else None, int(restore_id)
+
+
 @restore_bp.route('/restore/list', methods=['GET'])
 def list_restore():
-    restores = Restore.query.all()
-
-    return jsonify([
-        {
-            'id': r.id,
-            'sr_uuid': r.sr_uuid,
-            'host_ip': r.host_ip,
-            'preserve': r.preserve,
-            'power_on_after_restore': r.power_on_after_restore,
-            'backup_id': r.backup_id,
-            'vm_name': r.backup.vm_name,
-            'backup_name': r.backup.name if r.backup else None,
-            'sr_name': r.backup.sr_name if r.backup else None,
-            'restored_at': r.restored_at.astimezone(WIB).isoformat() if r.restored_at else None
-        }
-        for r in restores
-    ])
+    # Newest first, keyset-paginated on (restored_at, id); restored_at is only set on insert, so rows
+    # never move between pages. Rows without one sort last.
+    try:
+        limit = min(max(int(request.args.get('limit', RESTORE_PAGE_SIZE)), 1), MAX_RESTORE_PAGE_SIZE)
+        cursor = _decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    query = restore_rows()
+    if cursor is not None:
+        restored_at, restore_id = cursor
+        if restored_at is None:
+            query = query.filter(Restore.restored_at.is_(None), Restore.id < restore_id)
+        else:
+            query = query.filter(or_(Restore.restored_at < restored_at,
+                                     and_(Restore.restored_at == restored_at, Restore.id < restore_id),
+                                     Restore.restored_at.is_(None)))
+    if since is not None:
+        query = query.filter(Restore.restored_at >= since)
+
+    rows = query.order_by(Restore.restored_at.desc().nulls_last(), Restore.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return jsonify({
+        'message': f'Found {len(rows)} restore(s)',
+        'restores': [serialize_restore(r) for r in rows],
+        'next_cursor': _encode_cursor(rows[-1].restored_at, rows[-1].id) if has_more else None
+    })
 
 
 @restore_bp.route('/restore/list/<int:restore_id>', methods=['GET'])
 def list_restore_by_id(restore_id):
-    restore = Restore.query.get(restore_id)
+    restore = restore_rows().filter(Restore.id == restore_id).first()
 
     if not restore:
         return jsonify({'error': 'Restore not found'}), 404
 
-    return jsonify({
-        'id': restore.id,
-        'sr_uuid': restore.sr_uuid,
-        'host_ip': restore.host_ip,
-        'preserve': restore.preserve,
-        'power_on_after_restore': restore.power_on_after_restore,
-        'vm_name': restore.backup.vm_name,
-        'backup_id': restore.backup_id,
-        'backup_name': restore.backup.name if restore.backup else None,
-        'sr_name': restore.backup.sr_name if restore.backup else None,
-        'restored_at': restore.restored_at.astimezone(WIB).isoformat()
-    })
+    return jsonify(serialize_restore(restore))
 
 
 @restore_bp.route('/restore/update/<int:restore_id>', methods=['PATCH'])
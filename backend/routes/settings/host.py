@@ -1,6 +1,9 @@
 import XenAPI
 from flask import Blueprint, request, jsonify
 from models import db, Host
+from services.xapi_pool import xapi_pool
+from services.ssh_pool import ssh_pool
+from services.inventory import inventory_cache
 
 host_bp = Blueprint("host_bp", __name__)
 
@@ -99,6 +102,9 @@ def update_host(host_ip):
 
     try:
         db.session.commit()
+        xapi_pool.discard(host.id)
+        ssh_pool.discard(host.id)
+        inventory_cache.discard(host.id)
         return jsonify({
             "message": "Host updated successfully.",
             "host": {
@@ -126,6 +132,9 @@ def delete_host(host_ip):
     try:
         db.session.delete(host)
         db.session.commit()
+        xapi_pool.discard(host_ip)
+        ssh_pool.discard(host_ip)
+        inventory_cache.discard(host_ip)
         return jsonify({"message": "Host deleted successfully."}), 200
     except Exception as e:
         db.session.rollback()
@@ -149,12 +158,19 @@ def list_active_hosts():
         }), 404
 
     try:
-        session = XenAPI.Session(f"http://{host_ip}")
-        session.login_with_password(host_record.username, host_record.password)
+        cached = inventory_cache.snapshot(host_record)
+        if cached:
+            version, records = cached
+            if version in request.if_none_match:
+                return "", 304
+            host_records = records["host"]
+        else:
+            version = None
+            with xapi_pool.session(host_record) as session:
+                host_records = session.xenapi.host.get_all_records()
 
         hosts = []
-        for host_ref in session.xenapi.host.get_all():
-            rec = session.xenapi.host.get_record(host_ref)
+        for rec in host_records.values():
             hosts.append({
                 "uuid": rec.get("uuid"),
                 "name_label": rec.get("name_label"),
@@ -163,13 +179,15 @@ def list_active_hosts():
                 "live": rec.get("live")
             })
 
-        session.logout()
-
-        return jsonify({
+        response = jsonify({
             "hosts": hosts,
             "count": len(hosts),
+            "version": version,
             "code": 200
-        }), 200
+        })
+        if version:
+            response.set_etag(version)
+        return response, 200
 
     except Exception as e:
         return jsonify({
@@ -1,67 +1,212 @@
 import XenAPI
-from flask import Blueprint, request, jsonify
+import base64
+import json
+import queue
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from datetime import datetime
-from models import db, Job, Backup, Restore
+from models import db, Job, JobSpan, Backup, Restore
 from uuid import uuid4
+from services.job_engine import job_engine
+from services.progress import progress_hub
+from services.throttle import throttle
+from services.tracing import otlp_spans
+
+SSE_KEEPALIVE_SECONDS = 15
 
 job_bp = Blueprint("job_bp", __name__)
 
-@job_bp.route('/job/list/backup/<backup_id>', methods=['GET'])
-def list_backup_jobs_by_id(backup_id):
+JOB_COLUMNS = {
+    'id': Job.id,
+    'uuid': Job.job_uuid,
+    'type': Job.type,
+    'status': Job.status,
+    'mode': Job.mode,
+    'codec': Job.codec,
+    'stage': Job.stage,
+    'stage_timings': Job.stage_timings,
+    'progress': Job.progress,
+    'bytes_transferred': Job.bytes_transferred,
+    'bytes_per_second': Job.bytes_per_second,
+    'backup_id': Job.backup_id,
+    'restore_id': Job.restore_id,
+    'started_at': Job.started_at,
+    'completed_at': Job.completed_at,
+    'pruned_at': Job.pruned_at,
+    'output_message': Job.output_message
+}
+DEFAULT_JOB_FIELDS = ['id', 'uuid', 'type', 'status', 'mode', 'started_at', 'completed_at']
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(job_id):
+    return base64.urlsafe_b64encode(str(job_id).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+def _list_jobs(default_fields, **filters):
+    # Keyset pagination on id, newest first, so deep pages cost the same as the first one. started_at
+    # is rewritten when a queued job is claimed, so paging on it would move jobs between pages.
+    args = request.args
+    fields = args.get('fields', '').split(',') if args.get('fields') else list(default_fields)
+    if args.get('include_output', '').lower() == 'true' and 'output_message' not in fields:
+        fields.append('output_message')
+
+    unknown = [name for name in fields if name not in JOB_COLUMNS]
+    if unknown:
+        return jsonify({'error': f"Unknown field(s): {', '.join(unknown)}"}), 400
+
     try:
-        jobs = Job.query.filter_by(type='backup', backup_id=backup_id).all()
-
-        job_list = [
-            {
-                'id': job.id,
-                'uuid': job.job_uuid,
-                'type': job.type,
-                'status': job.status,
-                'backup_id': job.backup_id,
-                'started_at': job.started_at.isoformat() if job.started_at else None,
-                'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-                'output_message': job.output_message
-            }
-            for job in jobs
-        ]
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        since = datetime.fromisoformat(args['since']) if args.get('since') else None
+        until = datetime.fromisoformat(args['until']) if args.get('until') else None
+        cursor = _decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
 
-        return jsonify({
-            'message': f'Found {len(job_list)} job(s) for backup_id: {backup_id}',
-            'jobs': job_list
-        }), 200
+    query = db.session.query(Job.id, *(JOB_COLUMNS[name] for name in fields)).filter_by(**filters)
+    if args.get('status'):
+        query = query.filter(Job.status.in_(args['status'].split(',')))
+    if since:
+        query = query.filter(Job.started_at >= since)
+    if until:
+        query = query.filter(Job.started_at < until)
+    if cursor is not None:
+        query = query.filter(Job.id < cursor)
+
+    rows = query.order_by(Job.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    jobs = []
+    for row in rows:
+        job = {}
+        for name, value in zip(fields, row[1:]):
+            if name == 'stage_timings' and value:
+                value = json.loads(value)
+            job[name] = value.isoformat() if isinstance(value, datetime) else value
+        jobs.append(job)
+
+    return jsonify({
+        'message': f'Found {len(jobs)} job(s)',
+        'jobs': jobs,
+        'next_cursor': _encode_cursor(rows[-1].id) if has_more else None
+    }), 200
+
+
+@job_bp.route('/job/list', methods=['GET'])
+def list_jobs():
+    filters = {}
+    for name in ('type', 'backup_id', 'restore_id'):
+        if request.args.get(name):
+            filters[name] = request.args[name]
 
+    try:
+        return _list_jobs(DEFAULT_JOB_FIELDS + ['backup_id', 'restore_id'], **filters)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@job_bp.route('/job/list/restore/<restore_id>', methods=['GET'])
-def list_restore_jobs_by_id(restore_id):
+@job_bp.route('/job/list/backup/<backup_id>', methods=['GET'])
+def list_backup_jobs_by_id(backup_id):
     try:
-        jobs = Job.query.filter_by(type='restore', restore_id=restore_id).all()
-
-        job_list = [
-            {
-                'id': job.id,
-                'uuid': job.job_uuid,
-                'type': job.type,
-                'status': job.status,
-                'restore_id': job.restore_id,
-                'started_at': job.started_at.isoformat() if job.started_at else None,
-                'completed_at': job.completed_at.isoformat() if job.completed_at else None,
-                'output_message': job.output_message
-            }
-            for job in jobs
-        ]
+        return _list_jobs(DEFAULT_JOB_FIELDS + ['backup_id'], backup_id=backup_id, type='backup')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        return jsonify({
-            'message': f'Found {len(job_list)} job(s) for restore_id: {restore_id}',
-            'jobs': job_list
-        }), 200
 
+@job_bp.route('/job/list/restore/<restore_id>', methods=['GET'])
+def list_restore_jobs_by_id(restore_id):
+    try:
+        return _list_jobs(DEFAULT_JOB_FIELDS + ['restore_id'], restore_id=restore_id, type='restore')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@job_bp.route('/job/queue', methods=['GET'])
+def get_job_queue():
+    return jsonify(job_engine.stats()), 200
+
+
+@job_bp.route('/job/throttle', methods=['GET'])
+def get_job_throttle():
+    return jsonify(throttle.snapshot()), 200
+
+
+@job_bp.route('/job/<job_uuid>', methods=['GET'])
+def get_job_by_uuid(job_uuid):
+    job = Job.query.filter_by(job_uuid=job_uuid).first()
+
+    if not job:
+        return jsonify({'error': f'No job found with uuid: {job_uuid}'}), 404
+
+    return jsonify({
+        'id': job.id,
+        'uuid': job.job_uuid,
+        'type': job.type,
+        'status': job.status,
+        'stage': job.stage,
+        'stage_timings': json.loads(job.stage_timings) if job.stage_timings else None,
+        'progress': job.progress,
+        'bytes_transferred': job.bytes_transferred,
+        'bytes_per_second': job.bytes_per_second,
+        'backup_id': job.backup_id,
+        'restore_id': job.restore_id,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'output_message': job.output_message
+    }), 200
+
+
+@job_bp.route('/job/<job_uuid>/spans', methods=['GET'])
+def get_job_spans(job_uuid):
+    job = Job.query.filter_by(job_uuid=job_uuid).first()
+
+    if not job:
+        return jsonify({'error': f'No job found with uuid: {job_uuid}'}), 404
+
+    spans = JobSpan.query.filter_by(job_id=job.id).order_by(JobSpan.seq).all()
+    return jsonify(otlp_spans(job, spans)), 200
+
+
+@job_bp.route('/jobs/<job_uuid>/events', methods=['GET'])
+def stream_job_events(job_uuid):
+    if not db.session.query(Job.id).filter_by(job_uuid=job_uuid).scalar():
+        return jsonify({'error': f'No job found with uuid: {job_uuid}'}), 404
+
+    # Subscribe before re-reading the status so a job finishing in between isn't missed.
+    subscriber = progress_hub.subscribe(job_uuid)
+    status, output = db.session.query(Job.status, Job.output_message).filter_by(job_uuid=job_uuid).one()
+    db.session.remove()
+
+    def generate():
+        try:
+            yield f"data: {json.dumps({'event': 'status', 'job_uuid': job_uuid, 'status': status})}\n\n"
+            if status not in ('Queued', 'Running'):
+                yield f"data: {json.dumps({'event': 'done', 'job_uuid': job_uuid, 'status': status, 'output': output})}\n\n"
+                return
+
+            while True:
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"data: {json.dumps(event)}\n\n"
+                if event.get('event') == 'done':
+                    return
+        finally:
+            progress_hub.unsubscribe(job_uuid, subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 
 @job_bp.route('/job/add', methods=['POST'])
 def add_job():
@@ -1,6 +1,7 @@
-import XenAPI
 from flask import Blueprint, request, jsonify
 from models import db, Host
+from services.xapi_pool import xapi_pool
+from services.inventory import inventory_cache
 
 storage_bp = Blueprint("storage_bp", __name__)
 
@@ -16,10 +17,17 @@ def list_storage_host():
         return jsonify({"error": f"No host found with IP: {host_ip}"}), 404
 
     try:
-        session = XenAPI.Session(f"http://{host.host_ip}")
-        session.login_with_password(host.username, host.password)
+        cached = inventory_cache.snapshot(host)
+        if cached:
+            version, records = cached
+            if version in request.if_none_match:
+                return "", 304
+            sr_refs = records["sr"]
+        else:
+            version = None
+            with xapi_pool.session(host) as session:
+                sr_refs = session.xenapi.SR.get_all_records()
 
-        sr_refs = session.xenapi.SR.get_all_records()
         sr_list = []
 
         for sr_ref, sr in sr_refs.items():
@@ -35,12 +43,15 @@ def list_storage_host():
                 "content_type": sr["content_type"]
             })
 
-        session.logout()
-        return jsonify({
+        response = jsonify({
             "host_ip": host.host_ip,
             "total_srs": len(sr_list),
-            "storage_repositories": sr_list
-        }), 200
+            "storage_repositories": sr_list,
+            "version": version
+        })
+        if version:
+            response.set_etag(version)
+        return response, 200
 
     except Exception as e:
         return jsonify({
@@ -1,9 +1,13 @@
-import XenAPI
 from flask import Blueprint, request, jsonify
 from models import db, Host
+from services.xapi_pool import xapi_pool
+from services.inventory import inventory_cache
 
 vm_bp = Blueprint("vm_bp", __name__)
 
+# Evaluated by XAPI so templates and dom0 never cross the wire.
+VM_FILTER = 'field "is_a_template"="false" and field "is_control_domain"="false"'
+
 
 @vm_bp.route("/vm/list", methods=["GET"])
 def list_vms():
@@ -20,55 +24,29 @@ def list_vms():
         }), 404
 
     try:
-        session = XenAPI.Session(f"http://{host_ip}")
-        session.login_with_password(host_record.username, host_record.password)
-
-        vm_data = []
-        host_cache = {}
-
-        for vm_ref in session.xenapi.VM.get_all():
-            record = session.xenapi.VM.get_record(vm_ref)
-
-            if record.get("is_a_template") or record.get("is_control_domain"):
-                continue
-
-            host_ref = record.get("resident_on")
-            host_info = {}
-
-            if host_ref:
-                if host_ref not in host_cache:
-                    try:
-                        host_rec = session.xenapi.host.get_record(host_ref)
-                        host_cache[host_ref] = {
-                            "name_label": host_rec.get("name_label"),
-                            "address": host_rec.get("address"),
-                            "uuid": host_rec.get("uuid")
-                        }
-                    except Exception:
-                        host_cache[host_ref] = {
-                            "name_label": None,
-                            "address": None,
-                            "uuid": None  # In case of error, set UUID to None
-                        }
-
-                host_info = host_cache[host_ref]
-
-            vm_data.append({
-                "uuid": record["uuid"],
-                "name_label": record["name_label"],
-                "power_state": record["power_state"],
-                "memory_static_max": int(record["memory_static_max"]),
-                "VCPUs_max": int(record["VCPUs_max"]),
-                "host_uuid": host_info.get("uuid")
-            })
-
-        session.logout()
-
-        return jsonify({
+        cached = inventory_cache.snapshot(host_record)
+        if cached:
+            version, records = cached
+            if version in request.if_none_match:
+                return "", 304
+            vm_data = project_vms(records["vm"], records["host"])
+        else:
+            version = None
+            with xapi_pool.session(host_record) as session:
+                vm_data = project_vms(
+                    session.xenapi.VM.get_all_records_where(VM_FILTER),
+                    session.xenapi.host.get_all_records()
+                )
+
+        response = jsonify({
             "vms": vm_data,
             "count": len(vm_data),
+            "version": version,
             "code": 200
-        }), 200
+        })
+        if version:
+            response.set_etag(version)
+        return response, 200
 
     except Exception as e:
         return jsonify({
@@ -76,3 +54,20 @@ def list_vms():
             "details": str(e),
             "code": 502
         }), 502
+
+
+def project_vms(vm_records, host_records):
+    host_uuids = {host_ref: host_rec.get("uuid") for host_ref, host_rec in host_records.items()}
+
+    return [
+        {
+            "uuid": record["uuid"],
+            "name_label": record["name_label"],
+            "power_state": record["power_state"],
+            "memory_static_max": int(record["memory_static_max"]),
+            "VCPUs_max": int(record["VCPUs_max"]),
+            "host_uuid": host_uuids.get(record.get("resident_on"))
+        }
+        for record in vm_records.values()
+        if not record.get("is_a_template") and not record.get("is_control_domain")
+    ]
@@ -1,13 +1,16 @@
 from uuid import uuid4
-import XenAPI
-import os
-import time
-import re
-import paramiko
+import json
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from models import Backup, Host, Job, Restore
 from models import db
+from services.job_engine import job_engine
+from sqlalchemy import func
+from services.tasks import dom0_artifact_path, queue_backup_job, queue_backup_batch
+from services.backup_history import latest_successful_job
+from services.xapi_pool import xapi_pool
+from services.inventory import inventory_cache
+from routes.settings.vm import VM_FILTER
 
 
 xapi_bp = Blueprint("xapi_bp", __name__)
@@ -33,9 +36,8 @@ def xapi_test_connection():
         }), 404
 
     try:
-        session = XenAPI.Session(f"http://{host_ip}")
-        session.login_with_password(host_record.username, host_record.password)
-        session.logout()
+        with xapi_pool.session(host_record) as session:
+            session.xenapi.session.get_this_host(session.handle)
 
         host_record.connected = True
         db.session.commit()
@@ -60,93 +62,156 @@ def backup_vm():
     vm_uuid = data.get("vm_uuid")
     sr_uuid = data.get("sr_uuid")
     backup_id = data.get("backup_id")
-    print(host_ip, vm_uuid, sr_uuid, backup_id)
+    weight = data.get("weight", 1)
+    engine = data.get("engine")
+    mode = data.get("mode")
 
     if not all([host_ip, vm_uuid, sr_uuid]):
         return jsonify({"status": "error", "message": "Missing one or more required fields"}), 400
 
+    if engine not in (None, "ssh", "http"):
+        return jsonify({"status": "error", "message": "engine must be 'ssh' or 'http'"}), 400
+
+    if mode not in (None, "full", "delta"):
+        return jsonify({"status": "error", "message": "mode must be 'full' or 'delta'"}), 400
+
+    if mode is None and backup_id:
+        mode = db.session.query(Backup.backup_mode).filter_by(id=backup_id).scalar()
+
     host = Host.query.filter_by(host_ip=host_ip).first()
     if not host:
         return jsonify({"status": "error", "message": f"No host found with IP {host_ip}"}), 404
 
-    username = host.username
-    password = host.password
-
-    job = Job(
-        job_uuid=str(uuid4()),
-        type="backup",
-        status="Running",
-        started_at=datetime.utcnow(),
-        output_message="Backup job started...",
-        backup_id=backup_id
-    )
-    db.session.add(job)
-    db.session.commit()
+    job = queue_backup_job(host_ip, vm_uuid, sr_uuid, backup_id, weight, engine, mode)
 
-    backup_name = f"{job.job_uuid}"
-    backup_dir = f"/run/sr-mount/{sr_uuid}/xcp-backups/{vm_uuid}"
-    os.makedirs(backup_dir, exist_ok=True)
-    export_path = f"{backup_dir}/{backup_name}.xva"
+    export_path = dom0_artifact_path(sr_uuid, vm_uuid, job.job_uuid)
 
-    commands = [
-        f"xe vm-snapshot uuid={vm_uuid} new-name-label={backup_name}",
-        f"SNAP_UUID=$(xe snapshot-list name-label={backup_name} --minimal)",
-        "xe template-param-set is-a-template=false ha-always-run=false uuid=$SNAP_UUID",
-        f"mkdir -p {backup_dir}",
-        f"xe vm-export uuid=$SNAP_UUID filename={export_path} --compress",
-        "xe snapshot-uninstall snapshot-uuid=$SNAP_UUID force=true"
-    ]
+    return jsonify({
+        "status": "accepted",
+        "message": f"Backup queued, will be written to: {export_path}",
+        "job_id": job.id,
+        "job_uuid": job.job_uuid,
+        "job_status": job.status,
+        "output": job.output_message,
+        "backup_path": export_path
+    }), 202
 
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(host_ip, username=username, password=password)
+@xapi_bp.route("/xapi/backup_batch", methods=["POST"])
+def backup_batch():
+    data = request.get_json() or {}
 
-        full_script = "\n".join(commands)
-        stdin, stdout, stderr = ssh.exec_command(full_script)
+    backup_ids = data.get("backup_ids")
+    tag = data.get("tag")
+    host_ip = data.get("host_ip")
+    weight = data.get("weight", 1)
+    engine = data.get("engine")
+    mode = data.get("mode")
 
-        stdout_result = stdout.read().decode()
-        stderr_result = stderr.read().decode()
-        ssh.close()
+    if not any([backup_ids, tag, host_ip]):
+        return jsonify({"status": "error", "message": "Provide backup_ids, tag or host_ip to select backups"}), 400
 
-        job.output_message = stdout_result.strip(
-        ) if not stderr_result else stderr_result.strip()
-        job.status = "Success" if not stderr_result else "Failed"
-        job.completed_at = datetime.utcnow()
+    if backup_ids is not None and (not isinstance(backup_ids, list) or
+                                   any(isinstance(i, bool) or not isinstance(i, int) for i in backup_ids)):
+        return jsonify({"status": "error", "message": "backup_ids must be a list of integers"}), 400
 
-        db.session.commit()
+    if engine not in (None, "ssh", "http"):
+        return jsonify({"status": "error", "message": "engine must be 'ssh' or 'http'"}), 400
 
-        if stderr_result:
-            return jsonify({
-                "status": "error",
-                "message": f"Backup failed with error: {stderr_result.strip()}",
-                "job_id": job.id,
-                "job_status": job.status,
-                "output": job.output_message
-            }), 500
+    if mode not in (None, "full", "delta"):
+        return jsonify({"status": "error", "message": "mode must be 'full' or 'delta'"}), 400
 
-        return jsonify({
-            "status": "success",
-            "message": f"Backup completed at: {export_path}",
-            "job_id": job.id,
-            "job_status": job.status,
-            "output": job.output_message,
-            "backup_path": export_path
-        }), 200
+    query = db.session.query(Backup.id, Backup.host_ip, Backup.vm_uuid, Backup.sr_uuid, Backup.backup_mode)
+    if backup_ids:
+        query = query.filter(Backup.id.in_(backup_ids))
+    else:
+        query = query.filter(Backup.active.is_(True))
+    if host_ip:
+        query = query.filter(Backup.host_ip == host_ip)
+    backups = query.order_by(Backup.id).all()
+    missing = sorted(set(backup_ids or []) - {backup.id for backup in backups})
 
+    try:
+        if tag:
+            tagged = tagged_vms({backup.host_ip for backup in backups}, tag)
+            backups = [backup for backup in backups if backup.vm_uuid in tagged]
     except Exception as e:
-        job.status = "Failed"
-        job.output_message = str(e)
-        job.completed_at = datetime.utcnow()
-        db.session.commit()
+        return jsonify({"status": "error", "message": f"Failed to resolve tag '{tag}'", "details": str(e)}), 502
+
+    if not backups:
+        return jsonify({"status": "error", "message": "No backups matched the selection"}), 404
+
+    known_hosts = {row.host_ip for row in db.session.query(Host.host_ip).filter(
+        Host.host_ip.in_({backup.host_ip for backup in backups})
+    )}
+    unknown_hosts = sorted({str(backup.host_ip) for backup in backups if backup.host_ip not in known_hosts})
+    if unknown_hosts:
+        return jsonify({"status": "error", "message": f"No host found with IP {', '.join(unknown_hosts)}"}), 404
+
+    batch_uuid, jobs = queue_backup_batch(backups, weight, engine, mode)
+
+    return jsonify({
+        "status": "accepted",
+        "message": f"{len(jobs)} backup(s) queued.",
+        "batch_uuid": batch_uuid,
+        "missing_backup_ids": missing,
+        "jobs": [
+            {"backup_id": job.backup_id, "job_id": job.id, "job_uuid": job.job_uuid, "job_status": job.status}
+            for job in jobs
+        ]
+    }), 202
+
+
+@xapi_bp.route("/xapi/backup_batch/<batch_uuid>", methods=["GET"])
+def backup_batch_status(batch_uuid):
+    counts = dict(db.session.query(Job.status, func.count(Job.id)).filter(
+        Job.batch_uuid == batch_uuid
+    ).group_by(Job.status).all())
+
+    if not counts:
+        return jsonify({"status": "error", "message": f"No batch found with uuid: {batch_uuid}"}), 404
+
+    if counts.get("Queued") or counts.get("Running"):
+        status = "Running"
+    elif counts.get("Failed"):
+        status = "Failed" if not counts.get("Success") else "Partial"
+    else:
+        status = "Success"
+
+    jobs = db.session.query(
+        Job.backup_id, Job.job_uuid, Job.status, Job.progress, Job.started_at, Job.completed_at
+    ).filter(Job.batch_uuid == batch_uuid).order_by(Job.id).all()
+
+    return jsonify({
+        "batch_uuid": batch_uuid,
+        "status": status,
+        "total": sum(counts.values()),
+        "counts": counts,
+        "jobs": [
+            {
+                "backup_id": job.backup_id,
+                "job_uuid": job.job_uuid,
+                "status": job.status,
+                "progress": job.progress,
+                "started_at": job.started_at.isoformat() if job.started_at else None,
+                "completed_at": job.completed_at.isoformat() if job.completed_at else None
+            }
+            for job in jobs
+        ]
+    }), 200
+
+
+def tagged_vms(host_ips, tag):
+    vm_uuids = set()
+    for host in Host.query.filter(Host.host_ip.in_(host_ips)).all():
+        cached = inventory_cache.snapshot(host)
+        if cached:
+            records = cached[1]["vm"]
+        else:
+            with xapi_pool.session(host) as session:
+                records = session.xenapi.VM.get_all_records_where(VM_FILTER)
+        vm_uuids.update(record["uuid"] for record in records.values() if tag in record.get("tags", ()))
+    return vm_uuids
 
-        return jsonify({
-            "status": "error",
-            "message": "Backup failed due to exception.",
-            "job_id": job.id,
-            "job_status": job.status,
-            "output": job.output_message
-        }), 500
 
 @xapi_bp.route("/xapi/restore", methods=["POST"])
 def restore_vm():
@@ -159,6 +224,7 @@ def restore_vm():
     backup_id = data.get("backup_id")
     vm_uuid = data.get("vm_uuid", 0)
     is_latest_backup = data.get("is_latest_backup", True)
+    engine = data.get("engine")
 
     if not all([host_ip, sr_uuid, restore_id]):
         return jsonify({
@@ -172,138 +238,62 @@ def restore_vm():
             "message": "If you are not using the latest backup, you must provide a restore_id."
         }), 400
 
+    if engine not in (None, "ssh", "http"):
+        return jsonify({"status": "error", "message": "engine must be 'ssh' or 'http'"}), 400
+
     host = Host.query.filter_by(host_ip=host_ip).first()
     if not host:
         return jsonify({"status": "error", "message": f"No host found with IP {host_ip}"}), 404
 
     if is_latest_backup:
-        latest_backup_job = Job.query.filter_by(type="backup", backup_id=backup_id).order_by(Job.id.desc()).first()
-        print(latest_backup_job.restore)
+        latest_backup_job = latest_successful_job(backup_id)
 
         if not latest_backup_job:
             return jsonify({
                 "status": "error",
-                "message": "No backup jobs found for the specified backup ID."
-            }), 404
-
-        if not latest_backup_job.backup:
-            return jsonify({
-                "status": "error",
-                "message": "No backup job found for the latest backup job."
+                "message": "No successful backup jobs found for the specified backup ID."
             }), 404
 
-        vm_uuid = latest_backup_job.backup.vm_uuid
+        vm_uuid = db.session.query(Backup.vm_uuid).filter_by(id=backup_id).scalar()
         job_uuid = latest_backup_job.job_uuid
 
-    preserve = db.session.query(Restore.preserve).filter_by(id=restore_id).scalar()
-    if preserve is None:
+    restore = db.session.query(Restore.preserve, Restore.power_on_after_restore).filter_by(id=restore_id).first()
+    if restore is None:
         return jsonify({
             "status": "error",
             "message": "No restore entry found for the given restore_id."
         }), 404
 
-    username = host.username
-    password = host.password
+    params = {
+        "host_ip": host_ip,
+        "sr_uuid": sr_uuid,
+        "vm_uuid": vm_uuid,
+        "job_uuid": job_uuid,
+        "preserve": bool(restore.preserve),
+        "power_on": bool(restore.power_on_after_restore)
+    }
+    if engine:
+        params["engine"] = engine
 
     job = Job(
         job_uuid=str(uuid4()),
         type="restore",
-        status="Running",
+        status="Queued",
         started_at=datetime.utcnow(),
-        output_message="Restore job started...",
-        restore_id=restore_id
+        output_message="Restore job queued...",
+        restore_id=restore_id,
+        params=json.dumps(params)
     )
     db.session.add(job)
     db.session.commit()
 
-    xva_path = f"/var/run/sr-mount/{sr_uuid}/xcp-backups/{vm_uuid}/{job_uuid}.xva"
-
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(host_ip, username=username, password=password)
-
-        command = (
-            f"xe vm-import filename={xva_path} "
-            f"sr-uuid={sr_uuid} preserve={preserve}"
-        )
-
-        stdin, stdout, stderr = ssh.exec_command(command)
-        stdout_result = stdout.read().decode().strip()
-        stderr_result = stderr.read().decode().strip()
-        ssh.close()
-
-        job.completed_at = datetime.utcnow()
-        job.output_message = stdout_result if not stderr_result else stderr_result
-        job.status = "Success" if not stderr_result else "Failed"
-        db.session.commit()
-
-        if stderr_result:
-            return jsonify({
-                "status": "error",
-                "message": f"Restore failed: {stderr_result}",
-                "job_id": job.id,
-                "job_status": job.status,
-                "output": job.output_message
-            }), 500
-
-        return jsonify({
-            "status": "success",
-            "message": "VM restore completed successfully.",
-            "job_id": job.id,
-            "job_status": job.status,
-            "output": job.output_message
-        }), 200
+    job_engine.submit(job)
 
-    except Exception as e:
-        job.completed_at = datetime.utcnow()
-        job.status = "Failed"
-        job.output_message = str(e)
-        db.session.commit()
-
-        return jsonify({
-            "status": "error",
-            "message": "Restore operation failed due to exception.",
-            "job_id": job.id,
-            "job_status": job.status,
-            "output": job.output_message
-        }), 500
-
-
-# @xapi_bp.route("/xapi/backup_vm_stream", methods=["POST"])
-# def backup_vm_stream():
-#     data = request.get_json()
-#     # extract host_ip, username, password, vm_uuid, sr_uuid as before...
-
-#     def generate():
-#         ssh = paramiko.SSHClient()
-#         ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-#         ssh.connect(host_ip, username=username, password=password)
-
-#         # Set up all the commands with task tracking
-#         backup_name = f"backup-{datetime.now().strftime('%Y%m%dT%H%M%S')}"
-#         backup_dir = f"/run/sr-mount/{sr_uuid}/xcp-backups/{backup_name}"
-#         export_path = f"{backup_dir}/{backup_name}.xva"
-
-#         # Step-by-step commands
-#         setup_cmds = [
-#             f"xe vm-snapshot uuid={vm_uuid} new-name-label={backup_name}",
-#             f"SNAP_UUID=$(xe snapshot-list name-label={backup_name} --minimal)",
-#             "xe template-param-set is-a-template=false ha-always-run=false uuid=$SNAP_UUID",
-#             f"mkdir -p {backup_dir}",
-#             "TASK_ID=$(xe task-create name-label=backup-task description='Exporting backup')",
-#             f"xe vm-export uuid=$SNAP_UUID filename={export_path} --compress async=true task-uuid=$TASK_ID"
-#         ]
-#         monitor_cmd = "while true; do xe task-show uuid=$TASK_ID | grep progress; sleep 1; done"
-
-#         full_script = "\n".join(setup_cmds + [monitor_cmd])
-
-#         stdin, stdout, stderr = ssh.exec_command(full_script)
-
-#         for line in iter(stdout.readline, ""):
-#             yield f"data: {line.strip()}\n\n"
-#             time.sleep(1)
-
-#         ssh.close()
-
-#     return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return jsonify({
+        "status": "accepted",
+        "message": "VM restore queued.",
+        "job_id": job.id,
+        "job_uuid": job.job_uuid,
+        "job_status": job.status,
+        "output": job.output_message
+    }), 202
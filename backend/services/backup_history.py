@@ -0,0 +1,46 @@
+from sqlalchemy import func
+from models import db, Backup, Job, RETAINED_BACKUP_JOB
+
+JOB_COLUMNS = (Job.id, Job.job_uuid, Job.status, Job.mode, Job.codec, Job.backup_id, Job.started_at, Job.completed_at)
+
+
+def policy_limit():
+    # Upper bound on how many jobs a backup's retention policy can keep.
+    return (Backup.retention + func.coalesce(Backup.keep_daily, 0)
+            + func.coalesce(Backup.keep_weekly, 0) + func.coalesce(Backup.keep_monthly, 0))
+
+
+def latest_successful_jobs(backup_id, limit):
+    return db.session.query(*JOB_COLUMNS).filter(
+        Job.backup_id == backup_id,
+        RETAINED_BACKUP_JOB
+    ).order_by(Job.started_at.desc(), Job.id.desc()).limit(limit).all()
+
+
+def latest_successful_job(backup_id):
+    rows = latest_successful_jobs(backup_id, 1)
+    return rows[0] if rows else None
+
+
+def latest_successful_jobs_by_backup(limit=None, backup_ids=None):
+    # One windowed pass over the retained-jobs partial index instead of a query per backup.
+    rank = func.row_number().over(
+        partition_by=Job.backup_id,
+        order_by=(Job.started_at.desc(), Job.id.desc())
+    ).label("rank")
+
+    ranked = db.session.query(Job.id.label("job_id"), rank).filter(RETAINED_BACKUP_JOB)
+    if backup_ids is not None:
+        ranked = ranked.filter(Job.backup_id.in_(backup_ids))
+    ranked = ranked.subquery()
+
+    query = db.session.query(*JOB_COLUMNS).join(ranked, ranked.c.job_id == Job.id)
+    if limit is None:
+        query = query.join(Backup, Backup.id == Job.backup_id).filter(ranked.c.rank <= policy_limit())
+    else:
+        query = query.filter(ranked.c.rank <= limit)
+
+    grouped = {}
+    for row in query.order_by(Job.backup_id, ranked.c.rank):
+        grouped.setdefault(row.backup_id, []).append(row)
+    return grouped
@@ -0,0 +1,283 @@
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from services.job_engine import JobError
+
+TAR_BLOCK = 512
+INLINE_MAX = 16 * 1024
+LEASE_SUFFIX = ".writing"
+LEASE_TOUCH_SECONDS = 60
+
+# Gear table for content-defined cut points; seeded so every process agrees on the boundaries.
+GEAR = [random.Random(0x5eed + i).getrandbits(32) for i in range(256)]
+
+
+def gear_cut(data, min_size, avg_size, max_size):
+    if len(data) <= min_size:
+        return len(data)
+
+    mask = (1 << (avg_size.bit_length() - 1)) - 1
+    end = min(len(data), max_size)
+    fingerprint = 0
+    for i in range(min_size, end):
+        fingerprint = ((fingerprint << 1) + GEAR[data[i]]) & 0xFFFFFFFF
+        if not fingerprint & mask:
+            return i + 1
+    return end
+
+
+def tar_member_size(header):
+    # Padded data length of a tar member, or None for the end-of-archive block and anything that isn't tar.
+    if not any(header):
+        return None
+    stored = header[148:156].split(b"\0")[0].strip()
+    try:
+        checksum = int(stored or b"x", 8)
+        size = int(header[124:136].split(b"\0")[0].strip() or b"0", 8)
+    except ValueError:
+        return None
+    if checksum != sum(header[:148]) + 8 * 32 + sum(header[156:]):
+        return None
+    return -(-size // TAR_BLOCK) * TAR_BLOCK
+
+
+class ManifestWriter:
+    # XVAs are tar streams of 1 MiB disk blocks, so member data is cut on member boundaries and
+    # identical blocks from cloned VMs hash the same. Anything that isn't tar falls back to gear CDC.
+    def __init__(self, store, chunk_dir, manifest_path):
+        self.store = store
+        self.chunk_dir = chunk_dir
+        self.path = manifest_path
+        self.size = 0
+        self.new_bytes = 0
+        self._buffer = bytearray()
+        self._entries = []
+        self._pending = deque()
+        self._mode = "header"
+        self._remaining = 0
+        self._pool = ThreadPoolExecutor(max_workers=store.workers)
+        # The lease lists every chunk this export has stored so far; collect() treats it as a live
+        # manifest, so an export running longer than the GC grace period keeps its early chunks.
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        self.lease_path = f"{manifest_path}{LEASE_SUFFIX}"
+        self._lease = open(self.lease_path, "a")
+        self._lease_lock = threading.Lock()
+        self._lease_touched = time.monotonic()
+
+    def write(self, data):
+        self.size += len(data)
+        self._buffer += data
+        if time.monotonic() - self._lease_touched > LEASE_TOUCH_SECONDS:
+            os.utime(self.lease_path)
+            self._lease_touched = time.monotonic()
+        self._drain(final=False)
+        return len(data)
+
+    def _drain(self, final):
+        buffer = self._buffer
+        while buffer:
+            if self._mode == "header":
+                if len(buffer) < TAR_BLOCK:
+                    break
+                size = tar_member_size(bytes(buffer[:TAR_BLOCK]))
+                if size is None:
+                    # Not tar (or past the end-of-archive marker): chunk whatever follows by content.
+                    self._mode = "stream"
+                    continue
+                self._emit(bytes(buffer[:TAR_BLOCK]))
+                del buffer[:TAR_BLOCK]
+                if size:
+                    self._mode, self._remaining = "data", size
+                continue
+
+            limit = self._remaining if self._mode == "data" else len(buffer)
+            if self._mode == "data" and limit <= self.store.max_chunk:
+                if len(buffer) < limit:
+                    break
+                cut = limit
+            else:
+                if len(buffer) < self.store.max_chunk and not final:
+                    break
+                cut = gear_cut(buffer[:min(limit, self.store.max_chunk)], self.store.min_chunk,
+                               self.store.avg_chunk, self.store.max_chunk)
+
+            self._emit(bytes(buffer[:cut]))
+            del buffer[:cut]
+            if self._mode == "data":
+                self._remaining -= cut
+                if not self._remaining:
+                    self._mode = "header"
+
+        if final and buffer:
+            self._emit(bytes(buffer))
+            buffer.clear()
+
+    def _emit(self, data):
+        if len(data) <= INLINE_MAX:
+            if self._pending and self._pending[-1][0] == "i":
+                self._pending[-1][1].extend(data)
+            else:
+                self._pending.append(("i", bytearray(data)))
+        else:
+            self._pending.append(("c", self._pool.submit(self._put, data)))
+
+        while len(self._pending) > self.store.workers * 4:
+            self._resolve(self._pending.popleft())
+
+    def _put(self, data):
+        result = self.store.put(self.chunk_dir, data)
+        with self._lease_lock:
+            self._lease.write(f"{result[0]}\n")
+            self._lease.flush()
+            self._lease_touched = time.monotonic()
+        return result
+
+    def _release(self):
+        self._lease.close()
+        if os.path.exists(self.lease_path):
+            os.remove(self.lease_path)
+
+    def _resolve(self, entry):
+        kind, value = entry
+        if kind == "i":
+            self._entries.append(["i", base64.b64encode(bytes(value)).decode()])
+        else:
+            digest, length, written = value.result()
+            self.new_bytes += written
+            self._entries.append(["c", digest, length])
+
+    def commit(self):
+        try:
+            self._drain(final=True)
+            while self._pending:
+                self._resolve(self._pending.popleft())
+        finally:
+            self._pool.shutdown()
+
+        partial = f"{self.path}.partial"
+        with gzip.open(partial, "wt") as out:
+            json.dump({"version": 1, "size": self.size, "entries": self._entries}, out)
+        os.replace(partial, self.path)
+        self._release()
+        return self.new_bytes
+
+    def abort(self):
+        self._pool.shutdown(cancel_futures=True)
+        partial = f"{self.path}.partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        self._release()
+
+
+class ChunkStore:
+    def __init__(self, mount_root="/run/sr-mount", min_chunk=256 * 1024, avg_chunk=1024 * 1024,
+                 max_chunk=4 * 1024 * 1024, compress_level=1, workers=None):
+        self.mount_root = mount_root
+        self.min_chunk = min_chunk
+        self.avg_chunk = avg_chunk
+        self.max_chunk = max_chunk
+        self.compress_level = compress_level
+        self.workers = workers or os.cpu_count() or 2
+
+    def init_app(self, app):
+        self.mount_root = app.config.get('BACKUP_MOUNT_ROOT', self.mount_root)
+        self.compress_level = app.config.get('CHUNK_COMPRESS_LEVEL', self.compress_level)
+        self.workers = app.config.get('EXPORT_COMPRESS_WORKERS') or self.workers
+        app.extensions['chunk_store'] = self
+
+    def chunk_dir(self, sr_uuid):
+        return os.path.join(self.mount_root, sr_uuid, "xcp-backups", ".chunks")
+
+    def manifest_path(self, sr_uuid, vm_uuid, job_uuid):
+        return os.path.join(self.mount_root, sr_uuid, "xcp-backups", vm_uuid, f"{job_uuid}.manifest")
+
+    def writer(self, sr_uuid, vm_uuid, job_uuid):
+        return ManifestWriter(self, self.chunk_dir(sr_uuid), self.manifest_path(sr_uuid, vm_uuid, job_uuid))
+
+    def _chunk_path(self, chunk_dir, digest):
+        return os.path.join(chunk_dir, digest[:2], digest[2:4], digest)
+
+    def put(self, chunk_dir, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(chunk_dir, digest)
+        try:
+            # Refreshing the mtime keeps a concurrent collect() from sweeping a chunk we are about to reference.
+            os.utime(path)
+            return digest, len(data), 0
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, self.compress_level)
+        # Concurrent writers of the same chunk race harmlessly: the rename is atomic and the content identical.
+        partial = f"{path}.{uuid.uuid4().hex}"
+        with open(partial, "wb") as out:
+            out.write(compressed)
+        os.replace(partial, path)
+        return digest, len(data), len(compressed)
+
+    def collect(self, sr_uuid, grace_seconds=3600):
+        # Mark and sweep: anything no manifest or live lease references is garbage, except chunks
+        # young enough to belong to an export whose lease hasn't recorded them yet.
+        chunk_dir = self.chunk_dir(sr_uuid)
+        if not os.path.isdir(chunk_dir):
+            return 0
+
+        backups_dir = os.path.join(self.mount_root, sr_uuid, "xcp-backups")
+        cutoff = time.time() - grace_seconds
+        referenced = set()
+        for manifest_path in glob.glob(os.path.join(backups_dir, "*", "*.manifest")):
+            with gzip.open(manifest_path, "rt") as source:
+                referenced.update(entry[1] for entry in json.load(source)["entries"] if entry[0] == "c")
+
+        lease_cutoff = time.time() - max(grace_seconds, LEASE_TOUCH_SECONDS * 2)
+        for lease_path in glob.glob(os.path.join(backups_dir, "*", f"*.manifest{LEASE_SUFFIX}")):
+            # Writers touch their lease at least every LEASE_TOUCH_SECONDS, so one left idle past the
+            # grace period belongs to an export that died without cleaning up.
+            if os.path.getmtime(lease_path) < lease_cutoff:
+                os.remove(lease_path)
+                continue
+            with open(lease_path) as source:
+                referenced.update(line.strip() for line in source if line.strip())
+        removed = 0
+        for directory, _, names in os.walk(chunk_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name not in referenced and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def manifest_size(self, manifest_path):
+        with gzip.open(manifest_path, "rt") as source:
+            return json.load(source)["size"]
+
+    def read(self, sr_uuid, manifest_path):
+        chunk_dir = self.chunk_dir(sr_uuid)
+        with gzip.open(manifest_path, "rt") as source:
+            manifest = json.load(source)
+
+        for entry in manifest["entries"]:
+            if entry[0] == "i":
+                yield base64.b64decode(entry[1])
+                continue
+
+            _, digest, length = entry
+            with open(self._chunk_path(chunk_dir, digest), "rb") as source:
+                data = zlib.decompress(source.read())
+            if len(data) != length or hashlib.sha256(data).hexdigest() != digest:
+                raise JobError(f"Chunk {digest} in {manifest_path} is corrupt")
+            yield data
+
+
+chunk_store = ChunkStore()
@@ -0,0 +1,33 @@
+import gzip
+from functools import partial
+from services.job_engine import JobError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = ("none", "gzip", "zstd")
+DEFAULT_LEVELS = {"gzip": 6, "zstd": 3}
+LEVEL_RANGES = {"gzip": (0, 9), "zstd": (1, 22)}
+
+# What xe vm-export is told for each codec; dom0 does the compression itself on the SSH engine.
+XE_EXPORT_FLAGS = {"none": "", "gzip": "--compress", "zstd": "compress=zstd"}
+
+
+def _zstd_compress(level, data):
+    # Compressors aren't thread-safe, so each pool worker gets its own; every chunk becomes an
+    # independent frame and the concatenation is still a valid .zst stream.
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def compressor(codec, level=None):
+    if codec == "none":
+        return None
+    if codec == "gzip":
+        return partial(gzip.compress, compresslevel=DEFAULT_LEVELS["gzip"] if level is None else level)
+    if codec == "zstd":
+        if zstandard is None:
+            raise JobError("zstd compression requires the 'zstandard' package")
+        return partial(_zstd_compress, DEFAULT_LEVELS["zstd"] if level is None else level)
+    raise JobError(f"Unknown compression codec '{codec}'")
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"], start=1)}
+DAY_NAMES = {name: i for i, name in enumerate(["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"])}
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+
+class CronError(ValueError):
+    pass
+
+
+def _parse_value(value, names):
+    value = value.upper()
+    if value in names:
+        return names[value]
+    if not value.isdigit():
+        raise CronError(f"Invalid cron value '{value}'")
+    return int(value)
+
+
+def _parse_field(field, low, high, names=None):
+    names = names or {}
+    values = set()
+
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise CronError(f"Invalid cron step '{step_text}'")
+            step = int(step_text)
+
+        if part in ("*", "?"):
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _parse_value(start_text, names), _parse_value(end_text, names)
+        else:
+            start = _parse_value(part, names)
+            end = high if step > 1 else start
+
+        if start < low or end > high or start > end:
+            raise CronError(f"Cron field '{field}' out of range {low}-{high}")
+
+        values.update(range(start, end + 1, step))
+
+    return values
+
+
+class CronSchedule:
+    def __init__(self, expression):
+        expression = MACROS.get(expression.strip().lower(), expression)
+        fields = expression.split()
+        if len(fields) != 5:
+            raise CronError(f"Expected 5 cron fields, got {len(fields)}: '{expression}'")
+
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12, MONTH_NAMES)
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7, DAY_NAMES)}
+        self.any_day = fields[2] in ("*", "?")
+        self.any_weekday = fields[4] in ("*", "?")
+
+    def _day_matches(self, dt):
+        in_days = dt.day in self.days
+        in_weekdays = (dt.isoweekday() % 7) in self.weekdays
+        # Standard cron: when both day fields are restricted, either may match.
+        if not self.any_day and not self.any_weekday:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, after):
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+
+        while dt < limit:
+            if dt.month not in self.months:
+                year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+                dt = datetime(year, month, 1)
+                continue
+            if not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+
+        raise CronError(f"Cron expression '{self.expression}' never fires")
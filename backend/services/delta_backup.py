@@ -0,0 +1,184 @@
+import base64
+import os
+import XenAPI
+from models import Job, JobDisk
+from services.export_engine import export_engine
+from services.job_engine import JobError
+from services.progress import progress_hub
+from services.stages import StageClock
+from services.xapi_pool import xapi_pool
+
+CBT_BLOCK_SIZE = 64 * 1024
+
+
+class DeltaBackupEngine:
+    def __init__(self, chain_max=7, full_threshold=50):
+        self.chain_max = chain_max
+        self.full_threshold = full_threshold
+
+    def init_app(self, app):
+        self.chain_max = app.config.get('DELTA_CHAIN_MAX', self.chain_max)
+        self.full_threshold = app.config.get('DELTA_FULL_THRESHOLD', self.full_threshold)
+        app.extensions['delta_backup'] = self
+
+    def delta_dir(self, sr_uuid, vm_uuid, job_uuid):
+        return os.path.join(export_engine.mount_root, sr_uuid, "xcp-backups", vm_uuid, job_uuid)
+
+    def chain(self, job):
+        jobs = [job]
+        while jobs[-1].mode == "delta":
+            parent = jobs[-1].parent_job
+            if parent is None:
+                raise JobError(f"Backup chain for job {job.job_uuid} is broken")
+            jobs.append(parent)
+        return list(reversed(jobs))
+
+    def _parent(self, job):
+        if job.backup_id is None:
+            return None
+
+        return Job.query.filter(
+            Job.backup_id == job.backup_id,
+            Job.type == "backup",
+            Job.status == "Success",
+            Job.snapshot_uuid.isnot(None)
+        ).order_by(Job.completed_at.desc(), Job.id.desc()).first()
+
+    def _disks(self, session, vm_ref):
+        disks = {}
+        for vbd_ref in session.xenapi.VM.get_VBDs(vm_ref):
+            vbd = session.xenapi.VBD.get_record(vbd_ref)
+            if vbd["type"] == "Disk" and vbd["VDI"] != "OpaqueRef:NULL":
+                disks[vbd["userdevice"]] = vbd["VDI"]
+        return disks
+
+    def prepare(self, session, vm_ref):
+        # CBT has to be on before the snapshot is taken or the next delta has nothing to diff against.
+        disks = self._disks(session, vm_ref)
+        for vdi_ref in disks.values():
+            if not session.xenapi.VDI.get_cbt_enabled(vdi_ref):
+                session.xenapi.VDI.enable_cbt(vdi_ref)
+        return disks
+
+    def _bases(self, session, parent, source_disks, snap_disks):
+        # A delta needs every disk to line up with a snapshot VDI the parent kept on the SR.
+        parent_disks = {disk.userdevice: disk for disk in parent.disks}
+        if set(parent_disks) != set(snap_disks):
+            return None
+
+        bases = {}
+        for userdevice, source_ref in source_disks.items():
+            disk = parent_disks[userdevice]
+            if session.xenapi.VDI.get_uuid(source_ref) != disk.vdi_uuid:
+                return None
+            try:
+                bases[userdevice] = session.xenapi.VDI.get_by_uuid(disk.snapshot_vdi_uuid)
+            except XenAPI.Failure:
+                return None
+        return bases
+
+    def _changed_bytes(self, session, base_ref, snap_ref):
+        bitmap = base64.b64decode(session.xenapi.VDI.list_changed_blocks(base_ref, snap_ref))
+        return int.from_bytes(bitmap, "big").bit_count() * CBT_BLOCK_SIZE
+
+    def backup(self, job, host, params):
+        vm_uuid = params["vm_uuid"]
+        sr_uuid = params["sr_uuid"]
+        parent = self._parent(job)
+
+        clock = StageClock(job.job_uuid, job.stage_timings)
+
+        with xapi_pool.session(host) as session:
+            vm_ref = session.xenapi.VM.get_by_uuid(vm_uuid)
+            if job.snapshot_uuid:
+                source_disks = self._disks(session, vm_ref)
+                snap_ref = session.xenapi.VM.get_by_uuid(job.snapshot_uuid)
+            else:
+                with clock.stage("snapshot"):
+                    source_disks = self.prepare(session, vm_ref)
+                    snap_ref = export_engine.snapshot(session, vm_ref, job.job_uuid)
+            try:
+                snap_uuid = session.xenapi.VM.get_uuid(snap_ref)
+                snap_disks = self._disks(session, snap_ref)
+                bases = None
+                if parent is not None and len(self.chain(parent)) <= self.chain_max:
+                    bases = self._bases(session, parent, source_disks, snap_disks)
+
+                disks = []
+                for userdevice, snap_vdi in snap_disks.items():
+                    disks.append(JobDisk(
+                        userdevice=userdevice,
+                        vdi_uuid=session.xenapi.VDI.get_uuid(source_disks[userdevice]),
+                        snapshot_vdi_uuid=session.xenapi.VDI.get_uuid(snap_vdi),
+                        virtual_size=int(session.xenapi.VDI.get_virtual_size(snap_vdi)),
+                        changed_bytes=self._changed_bytes(session, bases[userdevice], snap_vdi) if bases else None
+                    ))
+
+                changed = sum(disk.changed_bytes or 0 for disk in disks)
+                capacity = sum(disk.virtual_size for disk in disks) or 1
+                if bases and changed * 100 > capacity * self.full_threshold:
+                    bases = None
+
+                with clock.stage("export"):
+                    if bases:
+                        output = self._export_delta(session, host, job, sr_uuid, vm_uuid, disks, snap_disks, bases, changed)
+                    else:
+                        sink = export_engine.sink(sr_uuid, vm_uuid, job.job_uuid)
+                        written = export_engine.export(session, host, snap_ref, snap_uuid, sink, job.job_uuid,
+                                                       export_engine.disk_usage(session, snap_ref),
+                                                       params.get("compression"), params.get("compression_level"))
+                        for disk in disks:
+                            disk.changed_bytes = None
+                        output = f"Full export succeeded: {written} bytes written to {sink.path}"
+            except BaseException:
+                with clock.stage("cleanup"):
+                    export_engine.discard_snapshot(session, snap_ref)
+                raise
+
+            # Only the newest snapshot is needed as the next base; older ones would just pin SR space.
+            if parent is not None:
+                with clock.stage("cleanup"):
+                    try:
+                        export_engine.destroy_snapshot(session, session.xenapi.VM.get_by_uuid(parent.snapshot_uuid))
+                    except XenAPI.Failure:
+                        pass
+                parent.snapshot_uuid = None
+
+        job.mode = "delta" if bases else "full"
+        job.codec = None if bases else export_engine.stream_codec(params.get("compression"))
+        job.engine = "http"
+        job.parent_job_id = parent.id if bases else None
+        job.snapshot_uuid = snap_uuid
+        job.disks = disks
+        return f"{snap_uuid}\n{output}"
+
+    def _export_delta(self, session, host, job, sr_uuid, vm_uuid, disks, snap_disks, bases, changed):
+        directory = self.delta_dir(sr_uuid, vm_uuid, job.job_uuid)
+        progress_hub.start(job.job_uuid, changed)
+
+        written = 0
+        for disk in disks:
+            if not disk.changed_bytes:
+                continue
+            disk.path = os.path.join(directory, f"{disk.userdevice}.vhd")
+            written += export_engine.export_vdi(session, host, snap_disks[disk.userdevice], bases[disk.userdevice],
+                                                disk.path, job.job_uuid, offset=written)
+
+        return f"Delta export succeeded: {changed} changed bytes, {written} bytes written to {directory}"
+
+    def apply(self, host, vm_uuid, deltas, job_uuid):
+        paths = [(disk.userdevice, disk.path) for delta in deltas for disk in delta.disks if disk.path]
+        progress_hub.start(job_uuid, sum(os.path.getsize(path) for _, path in paths) or None)
+
+        with xapi_pool.session(host) as session:
+            vm_disks = self._disks(session, session.xenapi.VM.get_by_uuid(vm_uuid))
+            applied = 0
+            for userdevice, path in paths:
+                if userdevice not in vm_disks:
+                    raise JobError(f"Restored VM {vm_uuid} has no disk at device {userdevice}")
+                applied += export_engine.import_vdi(session, host, vm_disks[userdevice], path, job_uuid, offset=applied)
+
+        return f"Applied {len(deltas)} delta(s), {applied} bytes to VM {vm_uuid}"
+
+
+delta_backup = DeltaBackupEngine()
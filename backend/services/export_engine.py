@@ -0,0 +1,329 @@
+import http.client
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from services.chunk_store import chunk_store
+from services.compression import compressor
+from services.job_engine import JobError
+from services.progress import progress_hub
+from services.stages import StageClock
+from services.throttle import throttle
+from services.tracing import tracer
+from services.xapi_pool import xapi_pool
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._partial = f"{path}.partial"
+        self._out = open(self._partial, "wb")
+
+    def write(self, data):
+        self.written += len(data)
+        return self._out.write(data)
+
+    def commit(self):
+        self._out.close()
+        os.replace(self._partial, self.path)
+        return self.written
+
+    def abort(self):
+        self._out.close()
+        if os.path.exists(self._partial):
+            os.remove(self._partial)
+
+
+class HttpExportEngine:
+    def __init__(self, mount_root="/run/sr-mount", chunk_size=4 * 1024 * 1024, buffer_chunks=8,
+                 compress_workers=None, codec="gzip", target="file"):
+        self.mount_root = mount_root
+        self.target = target
+        self.chunk_size = chunk_size
+        self.buffer_chunks = buffer_chunks
+        self.compress_workers = compress_workers or os.cpu_count() or 2
+        self.codec = codec
+
+    def init_app(self, app):
+        self.mount_root = app.config.get('BACKUP_MOUNT_ROOT', self.mount_root)
+        self.chunk_size = app.config.get('EXPORT_CHUNK_SIZE', self.chunk_size)
+        self.buffer_chunks = app.config.get('EXPORT_BUFFER_CHUNKS', self.buffer_chunks)
+        self.compress_workers = app.config.get('EXPORT_COMPRESS_WORKERS') or self.compress_workers
+        self.target = app.config.get('BACKUP_TARGET', self.target)
+        self.codec = app.config.get('EXPORT_COMPRESSION', self.codec)
+        app.extensions['export_engine'] = self
+
+    def artifact_path(self, sr_uuid, vm_uuid, job_uuid):
+        return os.path.join(self.mount_root, sr_uuid, "xcp-backups", vm_uuid, f"{job_uuid}.xva")
+
+    def sink(self, sr_uuid, vm_uuid, job_uuid):
+        if self.target == "chunks":
+            return chunk_store.writer(sr_uuid, vm_uuid, job_uuid)
+        return FileSink(self.artifact_path(sr_uuid, vm_uuid, job_uuid))
+
+    def snapshot(self, session, vm_ref, label):
+        snap_ref = session.xenapi.VM.snapshot(vm_ref, label)
+        try:
+            with tracer.span("template-param-set"):
+                session.xenapi.VM.set_is_a_template(snap_ref, False)
+        except BaseException:
+            self.discard_snapshot(session, snap_ref)
+            raise
+        return snap_ref
+
+    def stream_codec(self, codec=None):
+        # The chunk store compresses per chunk after dedup, so it has to see the raw XVA.
+        return None if self.target == "chunks" else codec or self.codec
+
+    def backup(self, host, vm_uuid, sr_uuid, job_uuid, snapshot_uuid=None, clock=None, codec=None, level=None):
+        clock = clock or StageClock(job_uuid)
+        with xapi_pool.session(host) as session:
+            if snapshot_uuid:
+                snap_ref = session.xenapi.VM.get_by_uuid(snapshot_uuid)
+            else:
+                with clock.stage("snapshot"):
+                    snap_ref = self.snapshot(session, session.xenapi.VM.get_by_uuid(vm_uuid), job_uuid)
+            try:
+                snap_uuid = session.xenapi.VM.get_uuid(snap_ref)
+                sink = self.sink(sr_uuid, vm_uuid, job_uuid)
+                with clock.stage("export"):
+                    written = self.export(session, host, snap_ref, snap_uuid, sink, job_uuid,
+                                          self.disk_usage(session, snap_ref), codec, level)
+            except BaseException:
+                with clock.stage("cleanup"):
+                    self.discard_snapshot(session, snap_ref)
+                raise
+
+            with clock.stage("cleanup"):
+                self.destroy_snapshot(session, snap_ref)
+
+        return f"{snap_uuid}\nExport succeeded: {written} bytes written to {sink.path}"
+
+    def export(self, session, host, vm_ref, vm_uuid, sink, job_uuid, total_bytes=None, codec=None, level=None):
+        codec = self.stream_codec(codec)
+        compress = compressor(codec, level) if codec else None
+        progress_hub.start(job_uuid, total_bytes)
+        query = {"ref": vm_ref, "use_compression": "false"}
+        return self._download(session, host, "/export", query, f"Export of VM: {vm_uuid}", sink, job_uuid,
+                              compress=compress)
+
+    def export_vdi(self, session, host, vdi_ref, base_ref, target, job_uuid, offset=0):
+        # With a base, XAPI emits a VHD holding only the blocks that differ from it.
+        query = {"vdi": vdi_ref, "format": "vhd"}
+        if base_ref:
+            query["base"] = base_ref
+        label = f"Export of VDI: {session.xenapi.VDI.get_uuid(vdi_ref)}"
+        return self._download(session, host, "/export_raw_vdi", query, label, FileSink(target), job_uuid,
+                              offset=offset)
+
+    def import_vdi(self, session, host, vdi_ref, path, job_uuid, offset=0):
+        size = os.path.getsize(path)
+
+        with self._task(session, f"Import of VDI: {session.xenapi.VDI.get_uuid(vdi_ref)}", job_uuid) as task_ref:
+            query = urlencode({"session_id": session.handle, "vdi": vdi_ref, "format": "vhd", "task_id": task_ref})
+            self._upload(host, f"/import_raw_vdi?{query}", self.read_file(path), size, job_uuid, offset)
+
+        return size
+
+    def import_vm(self, session, host, sr_ref, chunks, size, preserve, job_uuid):
+        # XAPI sniffs gzip and zstd archives itself, so compressed XVAs go over the wire as stored.
+        with self._task(session, "Import of VM", job_uuid) as task_ref:
+            query = urlencode({
+                "session_id": session.handle,
+                "sr_id": sr_ref,
+                "restore": "true" if preserve else "false",
+                "task_id": task_ref
+            })
+            self._upload(host, f"/import?{query}", chunks, size, job_uuid)
+            result = self._wait(session, task_ref)
+
+        return re.findall(r"OpaqueRef:[^<\s]+", result or "")
+
+    def read_file(self, path, retries=3):
+        # Backup SRs are usually NFS; a failed read reopens the file and retries the same range
+        # instead of failing the whole transfer.
+        position = 0
+        attempt = 0
+        source = open(path, "rb")
+        try:
+            while True:
+                try:
+                    chunk = source.read(self.chunk_size)
+                except OSError:
+                    if attempt >= retries:
+                        raise
+                    attempt += 1
+                    time.sleep(attempt)
+                    source.close()
+                    source = open(path, "rb")
+                    source.seek(position)
+                    continue
+                if not chunk:
+                    return
+                attempt = 0
+                position += len(chunk)
+                yield chunk
+        finally:
+            source.close()
+
+    def _upload(self, host, path, chunks, size, job_uuid, offset=0):
+        connection = http.client.HTTPConnection(host.host_ip, timeout=300)
+        try:
+            connection.putrequest("PUT", path)
+            connection.putheader("Content-Length", str(size))
+            connection.endheaders()
+
+            sent = 0
+            with tracer.span("transfer") as span:
+                for chunk in chunks:
+                    throttle.consume(job_uuid, len(chunk))
+                    connection.send(chunk)
+                    sent += len(chunk)
+                    progress_hub.report(job_uuid, bytes_written=offset + sent)
+                span["bytes"] = sent
+
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                raise JobError(f"XAPI import returned HTTP {response.status} {response.reason}")
+        finally:
+            connection.close()
+
+    def _wait(self, session, task_ref, timeout=600):
+        deadline = time.monotonic() + timeout
+        while session.xenapi.task.get_status(task_ref) == "pending":
+            if time.monotonic() > deadline:
+                raise JobError("Timed out waiting for XAPI to finish the import")
+            time.sleep(0.5)
+        return session.xenapi.task.get_result(task_ref)
+
+    def _download(self, session, host, handler, query, label, sink, job_uuid, compress=None, offset=0):
+        try:
+            with self._task(session, label, job_uuid) as task_ref:
+                query = urlencode({"session_id": session.handle, **query, "task_id": task_ref})
+                connection = http.client.HTTPConnection(host.host_ip, timeout=300)
+                try:
+                    with tracer.span("transfer") as span:
+                        connection.request("GET", f"{handler}?{query}")
+                        response = connection.getresponse()
+                        if response.status != 200:
+                            raise JobError(f"XAPI {handler} returned HTTP {response.status} {response.reason}")
+                        span["bytes"] = self._pump(response, sink, job_uuid, compress, offset)
+                finally:
+                    connection.close()
+
+            return sink.commit()
+        except BaseException:
+            sink.abort()
+            raise
+
+    @contextmanager
+    def _task(self, session, label, job_uuid):
+        task_ref = session.xenapi.task.create(label, job_uuid)
+        try:
+            yield task_ref
+            status = session.xenapi.task.get_status(task_ref)
+            if status not in ("success", "pending"):
+                raise JobError(f"{label} ended with {status}: {session.xenapi.task.get_error_info(task_ref)}")
+        finally:
+            try:
+                session.xenapi.task.destroy(task_ref)
+            except Exception:
+                pass
+
+    def _pump(self, response, out, job_uuid, compress=None, offset=0):
+        # Reader thread fills a bounded buffer; compression fans out across cores as independent
+        # gzip members or zstd frames (both concatenate into a valid stream), and writes stay in order.
+        chunks = queue.Queue(maxsize=self.buffer_chunks)
+        read_error = []
+        # Set when the consumer gives up, so a reader blocked on a full buffer doesn't wait forever.
+        stop = threading.Event()
+
+        def put(chunk):
+            while not stop.is_set():
+                try:
+                    chunks.put(chunk, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read():
+            try:
+                while not stop.is_set():
+                    chunk = response.read(self.chunk_size)
+                    throttle.consume(job_uuid, len(chunk))
+                    if not put(chunk) or not chunk:
+                        return
+            except BaseException as e:
+                read_error.append(e)
+                put(b"")
+
+        reader = threading.Thread(target=read, name=f"export-reader-{job_uuid}", daemon=True)
+        reader.start()
+
+        read_bytes = 0
+        pending = deque()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.compress_workers) as pool:
+                while True:
+                    chunk = chunks.get()
+                    if not chunk:
+                        break
+                    read_bytes += len(chunk)
+                    if compress is None:
+                        out.write(chunk)
+                        progress_hub.report(job_uuid, bytes_written=offset + read_bytes)
+                        continue
+                    pending.append(pool.submit(compress, chunk))
+
+                    while pending and (pending[0].done() or len(pending) >= self.compress_workers * 2):
+                        out.write(pending.popleft().result())
+                    progress_hub.report(job_uuid, bytes_written=offset + read_bytes)
+
+                while pending:
+                    out.write(pending.popleft().result())
+        finally:
+            stop.set()
+            reader.join()
+
+        if read_error:
+            raise read_error[0]
+
+        progress_hub.report(job_uuid, bytes_written=offset + read_bytes)
+        return read_bytes
+
+    def disk_usage(self, session, vm_ref):
+        total = 0
+        for vbd_ref in session.xenapi.VM.get_VBDs(vm_ref):
+            vbd = session.xenapi.VBD.get_record(vbd_ref)
+            if vbd["type"] == "Disk" and vbd["VDI"] != "OpaqueRef:NULL":
+                total += int(session.xenapi.VDI.get_physical_utilisation(vbd["VDI"]))
+        return total or None
+
+    def discard_snapshot(self, session, snap_ref):
+        # Cleanup on a failure path: an uninstall error must never replace the error that got us here.
+        try:
+            self.destroy_snapshot(session, snap_ref)
+        except Exception:
+            pass
+
+    def destroy_snapshot(self, session, snap_ref):
+        # Equivalent of `xe snapshot-uninstall force=true`: drop the snapshot's disks, then the record.
+        with tracer.span("uninstall"):
+            for vbd_ref in session.xenapi.VM.get_VBDs(snap_ref):
+                vbd = session.xenapi.VBD.get_record(vbd_ref)
+                if vbd["type"] == "Disk" and vbd["VDI"] != "OpaqueRef:NULL":
+                    session.xenapi.VDI.destroy(vbd["VDI"])
+            session.xenapi.VM.destroy(snap_ref)
+
+
+export_engine = HttpExportEngine()
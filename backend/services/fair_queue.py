@@ -0,0 +1,102 @@
+import threading
+from collections import Counter, deque
+
+
+class QueuedItem:
+    def __init__(self, value, flow, weight, host, sr, finish):
+        self.value = value
+        self.flow = flow
+        self.weight = weight
+        self.host = host
+        self.sr = sr
+        self.finish = finish
+
+
+# Self-clocked weighted fair queue: each flow (one backup or restore definition) is
+# served in proportion to its weight, and an item is only handed out while its host
+# and SR are under their limits, so a saturated host never blocks work for idle ones.
+class FairQueue:
+    def __init__(self, host_limit=2, sr_limit=2, host_overrides=None, sr_overrides=None):
+        self.host_limit = host_limit
+        self.sr_limit = sr_limit
+        self.host_overrides = host_overrides or {}
+        self.sr_overrides = sr_overrides or {}
+        self._cond = threading.Condition()
+        self._flows = {}
+        self._last_finish = {}
+        self._virtual_time = 0.0
+        self._running_hosts = Counter()
+        self._running_srs = Counter()
+        self._closed = False
+
+    def put(self, value, flow, weight=1, host=None, sr=None):
+        weight = max(float(weight or 1), 0.01)
+        with self._cond:
+            start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+            finish = start + 1.0 / weight
+            self._last_finish[flow] = finish
+            self._flows.setdefault(flow, deque()).append(QueuedItem(value, flow, weight, host, sr, finish))
+            self._cond.notify_all()
+
+    def _host_free(self, host):
+        return host is None or self._running_hosts[host] < self.host_overrides.get(host, self.host_limit)
+
+    def _sr_free(self, sr):
+        return sr is None or self._running_srs[sr] < self.sr_overrides.get(sr, self.sr_limit)
+
+    def _pick(self):
+        best = None
+        for items in self._flows.values():
+            head = items[0]
+            if not (self._host_free(head.host) and self._sr_free(head.sr)):
+                continue
+            if best is None or head.finish < best.finish:
+                best = head
+        return best
+
+    def get(self):
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                item = self._pick()
+                if item is not None:
+                    break
+                self._cond.wait()
+
+            flow = self._flows[item.flow]
+            flow.popleft()
+            self._virtual_time = max(self._virtual_time, item.finish)
+            if not flow:
+                del self._flows[item.flow]
+                # A drained flow restarts at the virtual time anyway, so its finish tag can go; per-job
+                # and per-batch flows would otherwise accumulate for the life of the process.
+                if self._last_finish.get(item.flow, 0.0) <= self._virtual_time:
+                    del self._last_finish[item.flow]
+            if item.host is not None:
+                self._running_hosts[item.host] += 1
+            if item.sr is not None:
+                self._running_srs[item.sr] += 1
+            return item
+
+    def release(self, item):
+        with self._cond:
+            if item.host is not None:
+                self._running_hosts[item.host] -= 1
+            if item.sr is not None:
+                self._running_srs[item.sr] -= 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "queued": sum(len(items) for items in self._flows.values()),
+                "flows": len(self._flows),
+                "running_per_host": {k: v for k, v in self._running_hosts.items() if v},
+                "running_per_sr": {k: v for k, v in self._running_srs.items() if v},
+            }
@@ -0,0 +1,201 @@
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+import XenAPI
+from services.xapi_pool import xapi_pool
+
+WATCHED_CLASSES = ["vm", "sr", "host"]
+# Tasks are subscribed to for progress listeners but never cached.
+EVENT_CLASSES = WATCHED_CLASSES + ["task"]
+
+
+class HostInventory:
+    def __init__(self, host, classes, poll_timeout, retire):
+        self.host = host
+        self.classes = classes
+        self.poll_timeout = poll_timeout
+        self.records = {name: {} for name in classes}
+        self.task_listeners = {}
+        self.ready = threading.Event()
+        # Set once a connection attempt fails and cleared on the next success, so readers can skip
+        # waiting on a host that is known to be unreachable.
+        self.backing_off = False
+        self._state = threading.Condition()
+        self.last_read = time.monotonic()
+        self._epoch = uuid.uuid4().hex[:8]
+        self._serial = 0
+        self._lock = threading.Lock()
+        self._retire = retire
+        self._stopped = False
+        self._thread = threading.Thread(target=self._watch, name=f"inventory-{host.host_ip}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+
+    def _should_stop(self):
+        return self._stopped or self._retire(self)
+
+    def _dispatch_tasks(self, events):
+        listeners = list(self.task_listeners.values())
+        if not listeners:
+            return
+        for event in events:
+            if event["class"] != "task" or event["operation"] == "del" or "snapshot" not in event:
+                continue
+            for listener in listeners:
+                try:
+                    listener(event["snapshot"])
+                except Exception:
+                    pass
+
+    def _connected(self):
+        with self._state:
+            self.ready.set()
+            self.backing_off = False
+            self._state.notify_all()
+
+    def _failed(self):
+        with self._state:
+            self.ready.clear()
+            self.backing_off = True
+            self._state.notify_all()
+
+    def wait_ready(self, timeout):
+        with self._state:
+            self._state.wait_for(lambda: self.ready.is_set() or self.backing_off, timeout)
+            return self.ready.is_set()
+
+    @property
+    def version(self):
+        return f"{self._epoch}-{self._serial}"
+
+    def snapshot(self):
+        self.last_read = time.monotonic()
+        with self._lock:
+            return self.version, self.records
+
+    def _apply(self, events, full):
+        # Copy-on-write: readers keep whatever tables they were handed, writers swap in new ones.
+        with self._lock:
+            records = {name: {} for name in self.classes} if full else dict(self.records)
+            copied = set(records) if full else set()
+            for event in events:
+                name = event["class"]
+                if name not in records:
+                    continue
+                if name not in copied:
+                    records[name] = dict(records[name])
+                    copied.add(name)
+                if event["operation"] == "del":
+                    records[name].pop(event["ref"], None)
+                elif "snapshot" in event:
+                    records[name][event["ref"]] = event["snapshot"]
+            self.records = records
+            if copied:
+                self._serial += 1
+
+    def _watch(self):
+        backoff = 1
+        try:
+            while not self._should_stop():
+                try:
+                    with xapi_pool.session(self.host) as session:
+                        token = ""
+                        while not self._should_stop():
+                            result = getattr(session.xenapi.event, "from")(EVENT_CLASSES, token, float(self.poll_timeout))
+                            self._apply(result["events"], full=(token == ""))
+                            self._dispatch_tasks(result["events"])
+                            token = result["token"]
+                            self._connected()
+                            backoff = 1
+                except XenAPI.Failure as e:
+                    # EVENTS_LOST means our token fell out of XAPI's buffer; a fresh token resyncs everything.
+                    if not e.details or e.details[0] != "EVENTS_LOST":
+                        self._failed()
+                        time.sleep(backoff)
+                        backoff = min(backoff * 2, 60)
+                except Exception:
+                    self._failed()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+        finally:
+            self.ready.clear()
+
+
+class InventoryCache:
+    def __init__(self, poll_timeout=30, idle_seconds=900, ready_timeout=10):
+        self.enabled = True
+        self.poll_timeout = poll_timeout
+        self.idle_seconds = idle_seconds
+        self.ready_timeout = ready_timeout
+        self._watchers = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, start=True):
+        self.enabled = start and app.config.get('INVENTORY_ENABLED', True)
+        self.idle_seconds = app.config.get('INVENTORY_IDLE_SECONDS', self.idle_seconds)
+        app.extensions['inventory_cache'] = self
+
+    def _retire(self, watcher):
+        # Decided under the cache lock so a reader or tracker can't attach to a watcher that is exiting.
+        with self._lock:
+            if watcher.task_listeners or time.monotonic() - watcher.last_read < self.idle_seconds:
+                return False
+            if self._watchers.get(watcher.host.id) is watcher:
+                del self._watchers[watcher.host.id]
+            return True
+
+    def _watcher(self, host):
+        watcher = self._watchers.get(host.id)
+        current = (host.host_ip, host.username, host.password)
+        if watcher is not None and (watcher.host.host_ip, watcher.host.username, watcher.host.password) != current:
+            watcher.stop()
+            watcher = None
+
+        if watcher is None:
+            detached = SimpleNamespace(id=host.id, host_ip=host.host_ip, username=host.username, password=host.password)
+            watcher = HostInventory(detached, WATCHED_CLASSES, self.poll_timeout, self._retire)
+            self._watchers[host.id] = watcher
+            watcher.start()
+
+        watcher.last_read = time.monotonic()
+        return watcher
+
+    def watcher(self, host):
+        with self._lock:
+            return self._watcher(host)
+
+    def snapshot(self, host):
+        if not self.enabled:
+            return None
+
+        # Only a watcher's first connection is waited for; once it is retrying, callers fall back at once.
+        watcher = self.watcher(host)
+        if not watcher.wait_ready(self.ready_timeout):
+            return None
+        return watcher.snapshot()
+
+    def track_tasks(self, host, key, listener):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._watcher(host).task_listeners[key] = listener
+
+    def untrack_tasks(self, host_id, key):
+        with self._lock:
+            watcher = self._watchers.get(host_id)
+        if watcher is not None:
+            watcher.task_listeners.pop(key, None)
+
+    def discard(self, host_id):
+        with self._lock:
+            watcher = self._watchers.pop(host_id, None)
+        if watcher is not None:
+            watcher.stop()
+
+
+inventory_cache = InventoryCache()
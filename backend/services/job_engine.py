@@ -0,0 +1,220 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from models import db, Job
+from services.fair_queue import FairQueue
+from services.metrics import metrics, job_duration_seconds, backup_bytes
+from services.progress import progress_hub
+from services.status_writer import status_writer
+from services.throttle import throttle
+from services.tracing import tracer
+
+
+class JobError(Exception):
+    pass
+
+
+class JobEngine:
+    def __init__(self, max_workers=16, heartbeat_seconds=30, stale_seconds=120):
+        self.max_workers = max_workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        # Identifies this process on the jobs it claims, so processes sharing a database only ever
+        # fail each other's jobs once their heartbeats stop.
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.app = None
+        self._handlers = {}
+        self._listeners = []
+        self._queue = FairQueue()
+        self._threads = []
+        self._heartbeat = None
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+
+    def init_app(self, app, start=True):
+        self.app = app
+        self.max_workers = app.config.get('JOB_WORKERS', self.max_workers)
+        self.heartbeat_seconds = app.config.get('JOB_HEARTBEAT_SECONDS', self.heartbeat_seconds)
+        self.stale_seconds = app.config.get('JOB_STALE_SECONDS', self.stale_seconds)
+        self._queue = FairQueue(
+            host_limit=app.config.get('MAX_EXPORTS_PER_HOST', 2),
+            sr_limit=app.config.get('MAX_EXPORTS_PER_SR', 2),
+            host_overrides=app.config.get('HOST_EXPORT_LIMITS'),
+            sr_overrides=app.config.get('SR_EXPORT_LIMITS')
+        )
+        app.extensions['job_engine'] = self
+
+        metrics.gauge("xcp_job_queue_depth", "Jobs waiting for a worker.", lambda: self.stats()["queued"])
+        metrics.gauge("xcp_job_workers", "Job worker threads.", lambda: len(self._threads))
+        metrics.gauge("xcp_job_workers_busy", "Job worker threads currently running a job.", lambda: self._busy)
+
+        if start:
+            self.start()
+
+    def register(self, job_type, handler):
+        self._handlers[job_type] = handler
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def submit(self, job):
+        params = json.loads(job.params or "{}")
+        owner_id = job.backup_id if job.type == "backup" else job.restore_id
+        flow = (job.type, owner_id) if owner_id is not None else (job.type, "job", job.id)
+
+        self._queue.put(
+            job.id,
+            flow=flow,
+            weight=params.get("weight", 1),
+            host=params.get("host_ip"),
+            sr=params.get("sr_uuid")
+        )
+
+    def stats(self):
+        return self._queue.snapshot()
+
+    def start(self):
+        if self._threads:
+            return
+
+        with self.app.app_context():
+            self._recover()
+
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def stop(self):
+        self._queue.close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _recover(self):
+        # Running jobs whose owner stopped heartbeating can't be resumed; queued ones are picked up again.
+        self._fail_stale()
+
+        for job in Job.query.filter_by(status="Queued").order_by(Job.id):
+            self.submit(job)
+
+    def _fail_stale(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        failed = Job.query.filter(
+            Job.status == "Running",
+            or_(Job.worker_id.is_(None), Job.worker_id != self.worker_id),
+            or_(Job.heartbeat_at < cutoff, Job.heartbeat_at.is_(None) & (Job.started_at < cutoff))
+        ).update({
+            "status": "Failed",
+            "output_message": "Interrupted: the worker running this job stopped responding.",
+            "completed_at": datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+        return failed
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self.app.app_context():
+                try:
+                    Job.query.filter_by(status="Running", worker_id=self.worker_id).update(
+                        {"heartbeat_at": datetime.utcnow()}, synchronize_session=False
+                    )
+                    db.session.commit()
+                    failed = self._fail_stale()
+                    if failed:
+                        self.app.logger.warning("Failed %d job(s) abandoned by another worker", failed)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("Failed to record job heartbeats")
+                finally:
+                    db.session.remove()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            with self._busy_lock:
+                self._busy += 1
+            with self.app.app_context():
+                try:
+                    self._run(item.value)
+                finally:
+                    db.session.remove()
+                    self._queue.release(item)
+                    with self._busy_lock:
+                        self._busy -= 1
+
+    def _run(self, job_id):
+        now = datetime.utcnow()
+        claimed = Job.query.filter_by(id=job_id, status="Queued").update({
+            "status": "Running",
+            "started_at": now,
+            "worker_id": self.worker_id,
+            "heartbeat_at": now
+        })
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = db.session.get(Job, job_id)
+        handler = self._handlers.get(job.type)
+        progress_hub.publish(job.job_uuid, {"event": "status", "job_uuid": job.job_uuid, "status": "Running"})
+
+        params = json.loads(job.params or "{}")
+        throttle.bind(job.job_uuid, params.get("host_ip"), params.get("sr_uuid"))
+        try:
+            if handler is None:
+                raise JobError(f"No handler registered for job type '{job.type}'")
+            with tracer.span(job.type, job.job_uuid):
+                output = handler(job, params)
+            status = "Success"
+        except Exception as e:
+            db.session.rollback()
+            output = str(e)
+            status = "Failed"
+        finally:
+            throttle.release(job.job_uuid)
+
+        job = db.session.get(Job, job_id)
+        for field, value in status_writer.take(job.job_uuid).items():
+            setattr(job, field, value)
+        if status == "Success":
+            job.progress = 100.0
+        job.status = status
+        job.output_message = output
+        job.completed_at = datetime.utcnow()
+        with tracer.span("db-commit", job.job_uuid):
+            db.session.commit()
+
+        # Spans go in after the status commit so that commit can be one of them.
+        spans = tracer.rows(job)
+        if spans:
+            db.session.add_all(spans)
+            db.session.commit()
+
+        progress_hub.finish(job.job_uuid, status, output)
+
+        job_duration_seconds.observe((job.completed_at - job.started_at).total_seconds(), type=job.type, status=status)
+        if job.type == "backup" and status == "Success" and job.bytes_transferred:
+            backup_bytes.observe(job.bytes_transferred, mode=job.mode or "full")
+
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception:
+                self.app.logger.exception("Job listener failed for %s", job.job_uuid)
+
+
+job_engine = JobEngine()
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from types import SimpleNamespace
+from models import db, Host, Job
+from services.delta_backup import delta_backup
+from services.export_engine import export_engine
+from services.job_engine import job_engine
+from services.progress import progress_hub
+from services.tracing import tracer
+from services.xapi_pool import xapi_pool
+
+
+class SnapshotPipeline:
+    # Snapshots are quick metadata operations, so a batch takes them all before any export starts
+    # instead of leaving the last VM's snapshot waiting behind the per-host export limit.
+    def __init__(self, workers_per_host=4):
+        self.app = None
+        self.workers_per_host = workers_per_host
+
+    def init_app(self, app):
+        self.app = app
+        self.workers_per_host = app.config.get('SNAPSHOT_WORKERS_PER_HOST', self.workers_per_host)
+        app.extensions['snapshot_pipeline'] = self
+
+    def submit(self, job_ids):
+        thread = threading.Thread(target=self._run, args=(job_ids,), name="snapshot-pipeline", daemon=True)
+        thread.start()
+        return thread
+
+    def _run(self, job_ids):
+        with self.app.app_context():
+            try:
+                self.snapshot_jobs(job_ids)
+            finally:
+                db.session.remove()
+
+    def snapshot_jobs(self, job_ids):
+        jobs = Job.query.filter(Job.id.in_(job_ids), Job.status == "Queued").order_by(Job.id).all()
+        params = {job.id: json.loads(job.params or "{}") for job in jobs}
+        hosts = {
+            host.host_ip: SimpleNamespace(id=host.id, host_ip=host.host_ip, username=host.username, password=host.password)
+            for host in Host.query.filter(Host.host_ip.in_({params[job.id]["host_ip"] for job in jobs})).all()
+        }
+
+        pools = {host_ip: ThreadPoolExecutor(max_workers=self.workers_per_host, thread_name_prefix=f"snapshot-{host_ip}")
+                 for host_ip in hosts}
+        futures = {}
+        for job in jobs:
+            job_params = params[job.id]
+            host = hosts.get(job_params["host_ip"])
+            if host is None:
+                self._fail(job, f"No host found with IP {job_params['host_ip']}")
+                continue
+            future = pools[host.host_ip].submit(self._snapshot, host, job_params["vm_uuid"], job.job_uuid,
+                                                job_params.get("mode") == "delta")
+            futures[future] = job
+
+        try:
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    snapshot_uuid, seconds = future.result()
+                except Exception as e:
+                    self._fail(job, f"Snapshot failed: {e}")
+                    continue
+
+                job.snapshot_uuid = snapshot_uuid
+                job.stage = "snapshot"
+                job.stage_timings = json.dumps({"snapshot": seconds})
+                db.session.commit()
+                job_engine.submit(job)
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+    def _snapshot(self, host, vm_uuid, job_uuid, delta):
+        started = time.monotonic()
+        with tracer.span("snapshot", job_uuid), xapi_pool.session(host) as session:
+            vm_ref = session.xenapi.VM.get_by_uuid(vm_uuid)
+            if delta:
+                delta_backup.prepare(session, vm_ref)
+            snap_ref = export_engine.snapshot(session, vm_ref, job_uuid)
+            return session.xenapi.VM.get_uuid(snap_ref), round(time.monotonic() - started, 3)
+
+    def _fail(self, job, message):
+        job.status = "Failed"
+        job.output_message = message
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        spans = tracer.rows(job)
+        if spans:
+            db.session.add_all(spans)
+            db.session.commit()
+        progress_hub.finish(job.job_uuid, "Failed", message)
+
+
+snapshot_pipeline = SnapshotPipeline()
@@ -0,0 +1,100 @@
+import queue
+import threading
+import time
+
+
+class JobProgress:
+    def __init__(self, job_uuid, total_bytes=None):
+        self.job_uuid = job_uuid
+        self.total_bytes = total_bytes
+        self.started = time.monotonic()
+        self.percent = 0.0
+        self.bytes_written = 0
+        self.throughput_bps = 0.0
+        self._last_sample = (self.started, 0)
+
+    def update(self, percent=None, bytes_written=None):
+        now = time.monotonic()
+        if bytes_written is not None:
+            last_time, last_bytes = self._last_sample
+            if now > last_time and bytes_written >= last_bytes:
+                rate = (bytes_written - last_bytes) / (now - last_time)
+                # Smooth bursty chunk arrivals so the UI doesn't flicker.
+                self.throughput_bps = rate if not self.throughput_bps else 0.3 * rate + 0.7 * self.throughput_bps
+            self._last_sample = (now, bytes_written)
+            self.bytes_written = bytes_written
+            if percent is None and self.total_bytes:
+                percent = min(bytes_written * 100.0 / self.total_bytes, 100.0)
+        if percent is not None:
+            self.percent = round(percent, 1)
+
+        return {
+            "event": "progress",
+            "job_uuid": self.job_uuid,
+            "percent": self.percent,
+            "bytes_written": self.bytes_written,
+            "throughput_bps": round(self.throughput_bps),
+            "elapsed_seconds": round(now - self.started, 1)
+        }
+
+
+class ProgressHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._latest = {}
+        self._jobs = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def start(self, job_uuid, total_bytes=None):
+        with self._lock:
+            progress = self._jobs[job_uuid] = JobProgress(job_uuid, total_bytes)
+        return progress
+
+    def report(self, job_uuid, percent=None, bytes_written=None):
+        with self._lock:
+            progress = self._jobs.get(job_uuid)
+        if progress is None:
+            return
+        self.publish(job_uuid, progress.update(percent=percent, bytes_written=bytes_written))
+
+    def publish(self, job_uuid, event):
+        with self._lock:
+            self._latest[job_uuid] = event
+            subscribers = list(self._subscribers.get(job_uuid, ()))
+        for listener in self._listeners:
+            listener(job_uuid, event)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def finish(self, job_uuid, status, message=None):
+        self.publish(job_uuid, {"event": "done", "job_uuid": job_uuid, "status": status, "output": message})
+        with self._lock:
+            self._jobs.pop(job_uuid, None)
+            self._latest.pop(job_uuid, None)
+
+    def subscribe(self, job_uuid):
+        subscriber = queue.Queue(maxsize=256)
+        with self._lock:
+            self._subscribers.setdefault(job_uuid, set()).add(subscriber)
+            latest = self._latest.get(job_uuid)
+        if latest is not None:
+            subscriber.put_nowait(latest)
+        return subscriber
+
+    def unsubscribe(self, job_uuid, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(job_uuid)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_uuid]
+
+
+progress_hub = ProgressHub()
@@ -0,0 +1,55 @@
+import http.client
+import os
+import time
+from services.chunk_store import chunk_store
+from services.export_engine import export_engine
+from services.job_engine import JobError
+from services.progress import progress_hub
+from services.xapi_pool import xapi_pool
+
+
+class HttpRestoreEngine:
+    def __init__(self, retries=3, retry_backoff_seconds=5):
+        self.retries = retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+
+    def init_app(self, app):
+        self.retries = app.config.get('RESTORE_RETRIES', self.retries)
+        self.retry_backoff_seconds = app.config.get('RESTORE_RETRY_BACKOFF_SECONDS', self.retry_backoff_seconds)
+        app.extensions['restore_engine'] = self
+
+    def source(self, sr_uuid, vm_uuid, job_uuid):
+        manifest = chunk_store.manifest_path(sr_uuid, vm_uuid, job_uuid)
+        if os.path.exists(manifest):
+            return chunk_store.manifest_size(manifest), lambda: chunk_store.read(sr_uuid, manifest)
+
+        path = export_engine.artifact_path(sr_uuid, vm_uuid, job_uuid)
+        if not os.path.exists(path):
+            raise JobError(f"No backup archive found for job {job_uuid}")
+        return os.path.getsize(path), lambda: export_engine.read_file(path)
+
+    def restore(self, host, sr_uuid, vm_uuid, job_uuid, preserve, restore_job_uuid):
+        size, chunks = self.source(sr_uuid, vm_uuid, job_uuid)
+
+        # XAPI's import handler can't pick up mid-stream, and it discards a half-imported VM when
+        # the upload drops, so a broken connection retries the archive from the start.
+        for attempt in range(self.retries + 1):
+            progress_hub.start(restore_job_uuid, size)
+            try:
+                with xapi_pool.session(host) as session:
+                    sr_ref = session.xenapi.SR.get_by_uuid(sr_uuid)
+                    vm_refs = export_engine.import_vm(session, host, sr_ref, chunks(), size, preserve, restore_job_uuid)
+                    if not vm_refs:
+                        raise JobError("XAPI import finished without returning a VM")
+                    return session.xenapi.VM.get_uuid(vm_refs[0]), size
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == self.retries:
+                    raise JobError(f"Import failed after {attempt + 1} attempt(s): {e}")
+                time.sleep(self.retry_backoff_seconds * 2 ** attempt)
+
+    def power_on(self, host, vm_uuid):
+        with xapi_pool.session(host) as session:
+            session.xenapi.VM.start(session.xenapi.VM.get_by_uuid(vm_uuid), False, False)
+
+
+restore_engine = HttpRestoreEngine()
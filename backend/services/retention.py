@@ -0,0 +1,206 @@
+import os
+import shlex
+import shutil
+import threading
+import time
+from datetime import datetime
+from pytz import timezone, utc
+from models import db, Backup, Host, Job
+from services.chunk_store import chunk_store
+from services.delta_backup import delta_backup
+from services.export_engine import export_engine
+from services.job_engine import job_engine
+from services.ssh_pool import ssh_pool
+from services.tasks import dom0_artifact_path
+
+GFS_BUCKETS = [
+    ("keep_daily", lambda moment: moment.strftime("%Y-%m-%d")),
+    ("keep_weekly", lambda moment: moment.isocalendar()[:2]),
+    ("keep_monthly", lambda moment: moment.strftime("%Y-%m"))
+]
+
+
+class RetentionPruner:
+    def __init__(self, interval_seconds=3600, batch_size=200, chunk_grace_seconds=3600):
+        self.app = None
+        self.tz = utc
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.chunk_grace_seconds = chunk_grace_seconds
+        self._requested = set()
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, start=True):
+        self.app = app
+        self.tz = timezone(app.config.get('SCHEDULER_TIMEZONE', 'Asia/Jakarta'))
+        self.interval_seconds = app.config.get('RETENTION_INTERVAL_SECONDS', self.interval_seconds)
+        self.batch_size = app.config.get('RETENTION_BATCH_SIZE', self.batch_size)
+        self.chunk_grace_seconds = app.config.get('CHUNK_GC_GRACE_SECONDS', self.chunk_grace_seconds)
+        app.extensions['retention_pruner'] = self
+
+        if start and app.config.get('RETENTION_ENABLED', True):
+            job_engine.add_listener(self._on_job_finished)
+            self._thread = threading.Thread(target=self._loop, name="retention-pruner", daemon=True)
+            self._thread.start()
+
+    def request(self, backup_id):
+        with self._cond:
+            self._requested.add(backup_id)
+            self._cond.notify()
+
+    def _on_job_finished(self, job):
+        if job.type == "backup" and job.status == "Success" and job.backup_id is not None:
+            self.request(job.backup_id)
+
+    def plan(self, backup):
+        jobs = Job.query.filter(
+            Job.backup_id == backup.id,
+            Job.type == "backup",
+            Job.status == "Success",
+            Job.pruned_at.is_(None)
+        ).order_by(Job.completed_at.desc(), Job.id.desc()).all()
+
+        # The newest job always survives: it holds the snapshot the next delta is taken against.
+        keep = {job.id for job in jobs[:max(backup.retention or 0, 1)]}
+
+        for field, bucket_of in GFS_BUCKETS:
+            count = getattr(backup, field) or 0
+            buckets = set()
+            for job in jobs:
+                if len(buckets) >= count:
+                    break
+                bucket = bucket_of(utc.localize(job.completed_at or job.started_at).astimezone(self.tz))
+                if bucket not in buckets:
+                    buckets.add(bucket)
+                    keep.add(job.id)
+
+        by_id = {job.id: job for job in jobs}
+        for job_id in list(keep):
+            parent_id = by_id[job_id].parent_job_id
+            while parent_id is not None and parent_id not in keep:
+                keep.add(parent_id)
+                parent_id = by_id[parent_id].parent_job_id if parent_id in by_id else None
+
+        return [job for job in jobs if job.id in keep], [job for job in jobs if job.id not in keep]
+
+    def prune(self, backup_id, dry_run=False):
+        with self._lock:
+            backup = db.session.get(Backup, backup_id)
+            if backup is None:
+                return None
+
+            kept, expired = self.plan(backup)
+            result = {
+                "backup_id": backup.id,
+                "dry_run": dry_run,
+                "kept": [job.job_uuid for job in kept],
+                "pruned": [job.job_uuid for job in expired]
+            }
+            if dry_run or not expired:
+                return result
+
+            local, remote = [], []
+            for job in expired:
+                on_dom0, path = self.artifact(backup, job)
+                (remote if on_dom0 else local).append((job, path))
+
+            removed = [job for job, path in local if self._remove_local(path)]
+            error = None
+            if remote:
+                host = Host.query.filter_by(host_ip=backup.host_ip).first()
+                if host is None:
+                    error = ValueError(f"No host found with IP {backup.host_ip}")
+                else:
+                    try:
+                        self._remove_on_dom0(host, remote, removed)
+                    except Exception as e:
+                        error = e
+
+            # Only jobs whose artifact was actually found and deleted count as pruned; anything
+            # missing is left for an operator to look at rather than silently written off.
+            if removed:
+                Job.query.filter(Job.id.in_([job.id for job in removed])).update(
+                    {"pruned_at": datetime.utcnow()}, synchronize_session=False
+                )
+                db.session.commit()
+            if error is not None:
+                raise error
+
+            removed_ids = {job.id for job in removed}
+            result["pruned"] = [job.job_uuid for job in removed]
+            result["missing"] = [job.job_uuid for job in expired if job.id not in removed_ids]
+            if result["missing"]:
+                self.app.logger.warning("Backup %s: no artifact found for job(s) %s", backup.id,
+                                        ", ".join(result["missing"]))
+
+            result["chunks_removed"] = chunk_store.collect(backup.sr_uuid, self.chunk_grace_seconds)
+            return result
+
+    def artifact(self, backup, job):
+        # Each path comes from the module that wrote it. Returns (on_dom0, path): SSH-engine archives
+        # were written by xe on the host, everything else by this server under BACKUP_MOUNT_ROOT.
+        if job.mode == "delta":
+            return False, delta_backup.delta_dir(backup.sr_uuid, backup.vm_uuid, job.job_uuid)
+        if job.engine == "http":
+            manifest = chunk_store.manifest_path(backup.sr_uuid, backup.vm_uuid, job.job_uuid)
+            if os.path.exists(manifest):
+                return False, manifest
+            return False, export_engine.artifact_path(backup.sr_uuid, backup.vm_uuid, job.job_uuid)
+        return True, dom0_artifact_path(backup.sr_uuid, backup.vm_uuid, job.job_uuid)
+
+    def _remove_local(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            return True
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def _remove_on_dom0(self, host, artifacts, removed):
+        # rm -rf succeeds on missing paths, so each path is echoed back only once it existed and was removed.
+        for start in range(0, len(artifacts), self.batch_size):
+            batch = artifacts[start:start + self.batch_size]
+            script = "\n".join(
+                f"if [ -e {shlex.quote(path)} ]; then rm -rf -- {shlex.quote(path)} && echo {shlex.quote(path)}; fi"
+                for _, path in batch
+            )
+            exit_status, stdout, stderr = ssh_pool.run(host, script)
+            deleted = set(stdout.splitlines())
+            removed.extend(job for job, path in batch if path in deleted)
+            if exit_status != 0 or stderr.strip():
+                raise RuntimeError(stderr.strip() or f"rm exited with status {exit_status}")
+
+    def prune_all(self, backup_ids=None):
+        if backup_ids is None:
+            backup_ids = [row.id for row in db.session.query(Backup.id).all()]
+
+        for backup_id in backup_ids:
+            try:
+                self.prune(backup_id)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception("Failed to prune backup %s", backup_id)
+
+    def _loop(self):
+        next_sweep = time.time() + self.interval_seconds
+        while True:
+            with self._cond:
+                if not self._requested:
+                    self._cond.wait(timeout=max(next_sweep - time.time(), 0))
+                requested, self._requested = self._requested, set()
+
+            sweep = time.time() >= next_sweep
+            if sweep:
+                next_sweep = time.time() + self.interval_seconds
+
+            with self.app.app_context():
+                try:
+                    self.prune_all(None if sweep else sorted(requested))
+                finally:
+                    db.session.remove()
+
+
+retention_pruner = RetentionPruner()
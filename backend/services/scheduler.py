@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import threading
+import time
+import zlib
+from datetime import datetime
+from pytz import timezone, utc
+from models import db, Backup, Job
+from services.cron import CronSchedule, CronError
+from services.tasks import queue_backup_job
+
+
+class BackupScheduler:
+    def __init__(self):
+        self.app = None
+        self.tz = utc
+        self.spread_seconds = 0
+        self.resync_seconds = 300
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._resync = True
+        self._thread = None
+
+    def init_app(self, app, start=True):
+        self.app = app
+        self.tz = timezone(app.config.get('SCHEDULER_TIMEZONE', 'Asia/Jakarta'))
+        self.spread_seconds = app.config.get('SCHEDULER_SPREAD_SECONDS', 300)
+        self.resync_seconds = app.config.get('SCHEDULER_RESYNC_SECONDS', 300)
+        app.extensions['backup_scheduler'] = self
+
+        if start and app.config.get('SCHEDULER_ENABLED', True):
+            self._thread = threading.Thread(target=self._loop, name="backup-scheduler", daemon=True)
+            self._thread.start()
+
+    def reschedule(self):
+        with self._cond:
+            self._resync = True
+            self._cond.notify()
+
+    def upcoming(self):
+        with self._cond:
+            return sorted(
+                (fire_at, backup_id) for fire_at, _, backup_id, schedule in self._heap
+                if self._entries.get(backup_id) is schedule
+            )
+
+    def _offset(self, backup_id):
+        # Deterministic per-backup offset so a shared "nightly" slot is spread evenly and stays stable across restarts.
+        if not self.spread_seconds:
+            return 0
+        return zlib.crc32(str(backup_id).encode()) % self.spread_seconds
+
+    def _next_fire(self, schedule, after):
+        local_after = after.astimezone(self.tz).replace(tzinfo=None)
+        return self.tz.localize(schedule.next_after(local_after)).astimezone(utc)
+
+    def _push(self, backup_id, schedule, nominal):
+        fire_at = nominal.timestamp() + self._offset(backup_id)
+        heapq.heappush(self._heap, (fire_at, next(self._seq), backup_id, schedule))
+
+    def _sync(self):
+        with self.app.app_context():
+            rows = db.session.query(Backup.id, Backup.cron_schedule).filter_by(active=True).all()
+            db.session.remove()
+
+        now = datetime.now(utc)
+        with self._cond:
+            entries = {}
+            for backup_id, expression in rows:
+                current = self._entries.get(backup_id)
+                if current is not None and current.expression == expression:
+                    entries[backup_id] = current
+                    continue
+                # An expression can parse and still never fire (e.g. Feb 31st); either way only this backup is skipped.
+                try:
+                    schedule = CronSchedule(expression or "")
+                    nominal = self._next_fire(schedule, now)
+                except CronError as e:
+                    self.app.logger.warning("Skipping backup %s: %s", backup_id, e)
+                    continue
+                entries[backup_id] = schedule
+                self._push(backup_id, schedule, nominal)
+
+            self._entries = entries
+            # Drop heap entries for removed or re-parsed schedules in one pass instead of lazily.
+            self._heap = [entry for entry in self._heap if entries.get(entry[2]) is entry[3]]
+            heapq.heapify(self._heap)
+
+    def _loop(self):
+        next_resync = 0
+        while True:
+            if self._resync or time.time() >= next_resync:
+                self._resync = False
+                next_resync = time.time() + self.resync_seconds
+                try:
+                    self._sync()
+                except Exception:
+                    self.app.logger.exception("Failed to load backup schedules")
+
+            due = []
+            with self._cond:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    fire_at, _, backup_id, schedule = heapq.heappop(self._heap)
+                    if self._entries.get(backup_id) is not schedule:
+                        continue
+                    due.append(backup_id)
+                    nominal = datetime.fromtimestamp(fire_at - self._offset(backup_id), utc)
+                    self._push(backup_id, schedule, self._next_fire(schedule, max(nominal, datetime.now(utc))))
+
+                if not due and not self._resync:
+                    wake_at = min(self._heap[0][0] if self._heap else next_resync, next_resync)
+                    self._cond.wait(timeout=max(wake_at - now, 0))
+
+            for backup_id in due:
+                try:
+                    self._fire(backup_id)
+                except Exception:
+                    self.app.logger.exception("Failed to start scheduled backup %s", backup_id)
+
+    def _fire(self, backup_id):
+        with self.app.app_context():
+            try:
+                backup = db.session.get(Backup, backup_id)
+                if not backup or not backup.active:
+                    return
+
+                in_flight = Job.query.filter(
+                    Job.backup_id == backup_id,
+                    Job.type == "backup",
+                    Job.status.in_(["Queued", "Running"])
+                ).first()
+                if in_flight:
+                    self.app.logger.info("Backup %s still has job %s in flight, skipping run", backup_id, in_flight.job_uuid)
+                    return
+
+                queue_backup_job(backup.host_ip, backup.vm_uuid, backup.sr_uuid, backup.id, mode=backup.backup_mode)
+            finally:
+                db.session.remove()
+
+
+backup_scheduler = BackupScheduler()
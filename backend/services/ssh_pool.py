@@ -0,0 +1,212 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+import paramiko
+from services.metrics import ssh_connect_seconds
+
+
+class SSHConnection:
+    def __init__(self, client):
+        self.client = client
+        self.transport = client.get_transport()
+        self.channels = 0
+        self.last_used = time.monotonic()
+
+    def alive(self):
+        return self.transport is not None and self.transport.is_active()
+
+
+class HostConnections:
+    def __init__(self, host_ip, username, password):
+        self.host_ip = host_ip
+        self.username = username
+        self.password = password
+        self.connections = []
+        self.connecting = 0
+
+
+class SSHConnectionPool:
+    def __init__(self, transports_per_host=2, channels_per_transport=8, keepalive_seconds=30,
+                 connect_timeout=15, idle_seconds=600, checkout_timeout=60, port=22):
+        self.port = port
+        self.transports_per_host = transports_per_host
+        self.channels_per_transport = channels_per_transport
+        self.keepalive_seconds = keepalive_seconds
+        self.connect_timeout = connect_timeout
+        self.idle_seconds = idle_seconds
+        self.checkout_timeout = checkout_timeout
+        self._hosts = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+
+    def init_app(self, app, start=True):
+        self.transports_per_host = app.config.get('SSH_TRANSPORTS_PER_HOST', self.transports_per_host)
+        self.channels_per_transport = app.config.get('SSH_CHANNELS_PER_TRANSPORT', self.channels_per_transport)
+        self.keepalive_seconds = app.config.get('SSH_KEEPALIVE_SECONDS', self.keepalive_seconds)
+        self.port = app.config.get('SSH_PORT', self.port)
+        app.extensions['ssh_pool'] = self
+
+        if start and self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name="ssh-connection-reaper", daemon=True)
+            self._reaper.start()
+
+    @staticmethod
+    def _fingerprint(host):
+        return hashlib.sha256(f"{host.host_ip}\0{host.username}\0{host.password}".encode()).hexdigest()
+
+    def _connect(self, entry):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        started = time.perf_counter()
+        client.connect(
+            entry.host_ip.split(":")[0],
+            port=self.port,
+            username=entry.username,
+            password=entry.password,
+            timeout=self.connect_timeout,
+            look_for_keys=False,
+            allow_agent=False
+        )
+        ssh_connect_seconds.observe(time.perf_counter() - started)
+        client.get_transport().set_keepalive(self.keepalive_seconds)
+        return SSHConnection(client)
+
+    def _checkout(self, host):
+        key = (host.id, self._fingerprint(host))
+        deadline = time.monotonic() + self.checkout_timeout
+        stale = []
+
+        with self._cond:
+            for k in [k for k in self._hosts if k[0] == host.id and k != key]:
+                stale.extend(self._hosts.pop(k).connections)
+
+            entry = self._hosts.get(key)
+            if entry is None:
+                entry = self._hosts[key] = HostConnections(host.host_ip, host.username, host.password)
+
+            while True:
+                dead = [conn for conn in entry.connections if not conn.alive()]
+                for conn in dead:
+                    entry.connections.remove(conn)
+                stale.extend(dead)
+
+                free = [conn for conn in entry.connections if conn.channels < self.channels_per_transport]
+                if free:
+                    conn = min(free, key=lambda c: c.channels)
+                    conn.channels += 1
+                    break
+
+                if len(entry.connections) + entry.connecting < self.transports_per_host:
+                    entry.connecting += 1
+                    conn = None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free SSH channel for {host.host_ip}")
+                self._cond.wait(remaining)
+
+        for old in stale:
+            old.client.close()
+
+        if conn is None:
+            try:
+                conn = self._connect(entry)
+            finally:
+                with self._cond:
+                    entry.connecting -= 1
+                    self._cond.notify_all()
+
+            with self._cond:
+                conn.channels = 1
+                entry.connections.append(conn)
+
+        return entry, conn
+
+    def _checkin(self, entry, conn, broken=False):
+        with self._cond:
+            conn.channels -= 1
+            conn.last_used = time.monotonic()
+            if broken and conn in entry.connections:
+                entry.connections.remove(conn)
+            self._cond.notify_all()
+
+        if broken:
+            conn.client.close()
+
+    @contextmanager
+    def channel(self, host):
+        entry, conn = self._checkout(host)
+        try:
+            chan = conn.transport.open_session()
+        except (paramiko.SSHException, EOFError, OSError):
+            # The transport died between checks; reconnect once before giving up.
+            self._checkin(entry, conn, broken=True)
+            entry, conn = self._checkout(host)
+            try:
+                chan = conn.transport.open_session()
+            except Exception:
+                self._checkin(entry, conn, broken=True)
+                raise
+
+        try:
+            yield chan
+        finally:
+            chan.close()
+            self._checkin(entry, conn, broken=not conn.alive())
+
+    def run(self, host, command, timeout=None, on_line=None, stdin=None):
+        with self.channel(host) as chan:
+            if timeout:
+                chan.settimeout(timeout)
+            chan.exec_command(command)
+            if stdin is not None:
+                for data in stdin:
+                    chan.sendall(data)
+                chan.shutdown_write()
+            stdout = chan.makefile("rb")
+            stderr = chan.makefile_stderr("rb")
+            if on_line is None:
+                stdout_result = stdout.read().decode()
+            else:
+                lines = []
+                for raw in stdout:
+                    line = raw.decode()
+                    lines.append(line)
+                    on_line(line.rstrip("\n"))
+                stdout_result = "".join(lines)
+            stderr_result = stderr.read().decode()
+            exit_status = chan.recv_exit_status()
+
+        return exit_status, stdout_result, stderr_result
+
+    def discard(self, host_id):
+        with self._cond:
+            keys = [k for k in self._hosts if k[0] == host_id]
+            connections = [conn for k in keys for conn in self._hosts.pop(k).connections]
+            self._cond.notify_all()
+
+        for conn in connections:
+            conn.client.close()
+
+    def reap(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for entry in self._hosts.values():
+                for conn in list(entry.connections):
+                    if conn.channels == 0 and (now - conn.last_used > self.idle_seconds or not conn.alive()):
+                        entry.connections.remove(conn)
+                        expired.append(conn)
+
+        for conn in expired:
+            conn.client.close()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(60)
+            self.reap()
+
+
+ssh_pool = SSHConnectionPool()
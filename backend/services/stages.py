@@ -0,0 +1,24 @@
+import json
+import time
+from contextlib import contextmanager
+from services.status_writer import status_writer
+from services.tracing import tracer
+
+
+class StageClock:
+    # Timings go through the status writer so they survive the rollback a failed handler triggers;
+    # the job engine folds them into the final commit.
+    def __init__(self, job_uuid, timings=None):
+        self.job_uuid = job_uuid
+        self.timings = json.loads(timings) if isinstance(timings, str) else dict(timings or {})
+
+    @contextmanager
+    def stage(self, name):
+        status_writer.update(self.job_uuid, stage=name)
+        started = time.monotonic()
+        try:
+            with tracer.span(name, self.job_uuid):
+                yield
+        finally:
+            self.timings[name] = round(self.timings.get(name, 0) + time.monotonic() - started, 3)
+            status_writer.update(self.job_uuid, stage_timings=json.dumps(self.timings))
@@ -0,0 +1,81 @@
+import threading
+import time
+from models import db, Job
+
+
+class JobStatusWriter:
+    # Progress ticks arrive many times a second per job; buffering them per job_uuid means each
+    # flush writes only the latest state of every running job, all in one transaction.
+    def __init__(self, flush_ms=500):
+        self.app = None
+        self.flush_ms = flush_ms
+        self.flushes = 0
+        self.rows_written = 0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def init_app(self, app, start=True):
+        self.app = app
+        self.flush_ms = app.config.get('JOB_STATUS_FLUSH_MS', self.flush_ms)
+        app.extensions['status_writer'] = self
+
+        if start and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-status-writer", daemon=True)
+            self._thread.start()
+
+    def update(self, job_uuid, **fields):
+        if self._thread is None:
+            return
+        with self._cond:
+            self._pending.setdefault(job_uuid, {}).update(fields)
+
+    def take(self, job_uuid):
+        # The final state is written by the caller in its own commit, so whatever is still buffered
+        # for the job is handed over instead of flushed behind it.
+        with self._cond:
+            return self._pending.pop(job_uuid, {})
+
+    def on_progress(self, job_uuid, event):
+        if event.get("event") == "progress":
+            elapsed = event["elapsed_seconds"]
+            self.update(job_uuid, progress=event["percent"], bytes_transferred=event["bytes_written"],
+                        bytes_per_second=round(event["bytes_written"] / elapsed) if elapsed else None)
+
+    def flush(self):
+        with self._cond:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            for job_uuid, fields in pending.items():
+                # Only Running jobs take buffered updates, so a late flush can never overwrite a final status.
+                Job.query.filter(Job.job_uuid == job_uuid, Job.status == "Running").update(
+                    fields, synchronize_session=False
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._cond:
+                for job_uuid, fields in pending.items():
+                    self._pending[job_uuid] = {**fields, **self._pending.get(job_uuid, {})}
+            raise
+
+        self.flushes += 1
+        self.rows_written += len(pending)
+        return len(pending)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_ms / 1000)
+            with self.app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    self.app.logger.exception("Failed to flush job status updates")
+                finally:
+                    db.session.remove()
+
+
+status_writer = JobStatusWriter()
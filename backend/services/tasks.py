@@ -0,0 +1,256 @@
+import json
+import os
+import posixpath
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import uuid4
+from flask import current_app
+from models import db, Backup, Host, Job
+from services.job_engine import JobError, job_engine
+from services.ssh_pool import ssh_pool
+from services.inventory import inventory_cache
+from services.progress import progress_hub
+from services.export_engine import export_engine
+from services.delta_backup import delta_backup
+from services.chunk_store import chunk_store
+from services.restore_engine import restore_engine
+from services.throttle import throttle
+from services.stages import StageClock
+from services.tracing import tracer
+from services.compression import CODECS, XE_EXPORT_FLAGS
+from services.pipeline import snapshot_pipeline
+
+PROGRESS_PROBE_SECONDS = 5
+DOM0_MOUNT_ROOT = "/run/sr-mount"
+
+
+def _backup_job(host_ip, vm_uuid, sr_uuid, backup_id, weight=1, engine=None, mode=None, batch_uuid=None):
+    params = {
+        "host_ip": host_ip,
+        "vm_uuid": vm_uuid,
+        "sr_uuid": sr_uuid,
+        "weight": weight
+    }
+    if engine:
+        params["engine"] = engine
+    if mode:
+        params["mode"] = mode
+
+    return Job(
+        job_uuid=str(uuid4()),
+        type="backup",
+        status="Queued",
+        started_at=datetime.utcnow(),
+        output_message="Backup job queued...",
+        backup_id=backup_id,
+        batch_uuid=batch_uuid,
+        params=json.dumps(params)
+    )
+
+
+def queue_backup_job(host_ip, vm_uuid, sr_uuid, backup_id, weight=1, engine=None, mode=None):
+    job = _backup_job(host_ip, vm_uuid, sr_uuid, backup_id, weight, engine, mode)
+    db.session.add(job)
+    db.session.commit()
+
+    job_engine.submit(job)
+    return job
+
+
+def queue_backup_batch(backups, weight=1, engine=None, mode=None):
+    # Every job row lands in one commit; the engine's per-host and per-SR limits then pace the exports.
+    batch_uuid = str(uuid4())
+    jobs = [
+        _backup_job(backup.host_ip, backup.vm_uuid, backup.sr_uuid, backup.id, weight, engine,
+                    mode or backup.backup_mode, batch_uuid)
+        for backup in backups
+    ]
+    db.session.add_all(jobs)
+    db.session.commit()
+
+    # Snapshots for the whole batch are taken up front, so every VM is captured at about the same
+    # moment; each job joins the export queue as soon as its snapshot exists.
+    snapshot_pipeline.submit([job.id for job in jobs])
+    return batch_uuid, jobs
+
+
+def _get_host(host_ip):
+    host = Host.query.filter_by(host_ip=host_ip).first()
+    if not host:
+        raise JobError(f"No host found with IP {host_ip}")
+    return SimpleNamespace(id=host.id, host_ip=host.host_ip, username=host.username, password=host.password)
+
+
+def dom0_artifact_path(sr_uuid, vm_uuid, job_uuid):
+    # Where `xe vm-export` leaves an SSH-engine archive: on dom0's own mount of the SR.
+    return f"{DOM0_MOUNT_ROOT}/{sr_uuid}/xcp-backups/{vm_uuid}/{job_uuid}.xva"
+
+
+def _run_ssh(host, script, on_line=None, stdin=None):
+    exit_status, stdout_result, stderr_result = ssh_pool.run(host, script, on_line=on_line, stdin=stdin)
+    if stderr_result.strip():
+        raise JobError(stderr_result.strip())
+
+    return stdout_result.strip()
+
+
+@contextmanager
+def _tracked_task(host, job_uuid, marker, artifact_path=None):
+    # Percent comes from the host's shared XAPI event watcher. The artifact size is probed over SSH on
+    # a thread of its own, so a slow host or a busy SSH pool never stalls the watcher's event loop.
+    def on_task(task):
+        if marker in task.get("name_label", "") and task.get("status") == "pending":
+            progress_hub.report(job_uuid, percent=float(task.get("progress", 0)) * 100)
+
+    stop = threading.Event()
+
+    def probe():
+        while not stop.wait(PROGRESS_PROBE_SECONDS):
+            try:
+                _, size, _ = ssh_pool.run(host, f"stat -c %s {artifact_path}")
+                bytes_written = int(size.strip() or 0)
+            except Exception:
+                continue
+            progress_hub.report(job_uuid, bytes_written=bytes_written)
+
+    inventory_cache.track_tasks(host, job_uuid, on_task)
+    if artifact_path:
+        threading.Thread(target=probe, name=f"export-probe-{job_uuid}", daemon=True).start()
+    try:
+        yield
+    finally:
+        stop.set()
+        inventory_cache.untrack_tasks(host.id, job_uuid)
+
+
+def run_backup(job, params):
+    vm_uuid = params["vm_uuid"]
+    sr_uuid = params["sr_uuid"]
+    host = _get_host(params["host_ip"])
+    params = {**params, **_compression(job, params)}
+
+    if params.get("mode") == "delta":
+        return delta_backup.backup(job, host, params)
+
+    clock = StageClock(job.job_uuid, job.stage_timings)
+
+    # xe writes .xva files from dom0, so the chunk store target always goes through the HTTP engine.
+    engine = params.get("engine", current_app.config.get('EXPORT_ENGINE', "ssh"))
+    if engine == "http" or export_engine.target == "chunks":
+        output = export_engine.backup(host, vm_uuid, sr_uuid, job.job_uuid, job.snapshot_uuid, clock,
+                                      params["compression"], params["compression_level"])
+        job.snapshot_uuid = None
+        job.codec = export_engine.stream_codec(params["compression"])
+        job.engine = "http"
+        return output
+
+    backup_name = f"{job.job_uuid}"
+    export_path = dom0_artifact_path(sr_uuid, vm_uuid, job.job_uuid)
+    backup_dir = posixpath.dirname(export_path)
+
+    progress_hub.start(job.job_uuid)
+
+    snapshot_uuid = job.snapshot_uuid
+    if not snapshot_uuid:
+        with clock.stage("snapshot"):
+            snapshot_uuid = _run_ssh(host, f"xe vm-snapshot uuid={vm_uuid} new-name-label={backup_name}")
+            with tracer.span("template-param-set"):
+                _run_ssh(host, f"xe template-param-set is-a-template=false ha-always-run=false uuid={snapshot_uuid}")
+
+    # The snapshot is uninstalled even when the export fails, but an uninstall error never hides the export's.
+    try:
+        with clock.stage("export"):
+            # The export task is labelled with the snapshot uuid.
+            with _tracked_task(host, job.job_uuid, snapshot_uuid, export_path):
+                output = _run_ssh(host, f"mkdir -p {backup_dir}\n"
+                                        f"xe vm-export uuid={snapshot_uuid} filename={export_path} "
+                                        f"{XE_EXPORT_FLAGS[params['compression']]}".rstrip())
+    except BaseException:
+        with clock.stage("cleanup"), tracer.span("uninstall"):
+            try:
+                _run_ssh(host, f"xe snapshot-uninstall snapshot-uuid={snapshot_uuid} force=true")
+            except Exception:
+                pass
+        raise
+
+    with clock.stage("cleanup"), tracer.span("uninstall"):
+        cleanup = _run_ssh(host, f"xe snapshot-uninstall snapshot-uuid={snapshot_uuid} force=true")
+    job.snapshot_uuid = None
+    job.codec = params["compression"]
+    job.engine = "ssh"
+
+    return "\n".join(part for part in (snapshot_uuid, output, cleanup) if part)
+
+
+def _compression(job, params):
+    # An explicit codec on the job wins; otherwise the backup's current setting, then the server default.
+    codec, level = params.get("compression"), params.get("compression_level")
+    if codec is None and job.backup_id is not None:
+        row = db.session.query(Backup.compression, Backup.compression_level).filter_by(id=job.backup_id).first()
+        if row is not None:
+            codec, level = row.compression, level if level is not None else row.compression_level
+
+    codec = codec or export_engine.codec
+    if codec not in CODECS:
+        raise JobError(f"Unknown compression codec '{codec}'")
+    return {"compression": codec, "compression_level": level}
+
+
+def run_restore(job, params):
+    sr_uuid = params["sr_uuid"]
+    host = _get_host(params["host_ip"])
+
+    # A delta restores its chain's full base first, then replays each delta onto the imported disks.
+    source = Job.query.filter_by(job_uuid=params["job_uuid"]).first()
+    chain = delta_backup.chain(source) if source is not None else []
+    base_uuid = chain[0].job_uuid if chain else params["job_uuid"]
+
+    engine = params.get("engine", current_app.config.get('RESTORE_ENGINE', "ssh"))
+    if engine == "http":
+        vm_uuid, size = restore_engine.restore(host, sr_uuid, params["vm_uuid"], base_uuid, params["preserve"],
+                                               job.job_uuid)
+        output = f"{vm_uuid}\nImport succeeded: {size} bytes streamed to SR {sr_uuid}"
+    else:
+        output = _restore_over_ssh(job, host, params, base_uuid)
+
+    if len(chain) > 1:
+        output = f"{output}\n{delta_backup.apply(host, output.split()[0], chain[1:], job.job_uuid)}"
+
+    # Powered on last, so a delta chain is fully replayed before the VM boots.
+    if params.get("power_on"):
+        restore_engine.power_on(host, output.split()[0])
+        output = f"{output}\nVM started"
+    return output
+
+
+def _restore_over_ssh(job, host, params, base_uuid):
+    sr_uuid = params["sr_uuid"]
+    manifest = chunk_store.manifest_path(sr_uuid, params["vm_uuid"], base_uuid)
+    progress_hub.start(job.job_uuid)
+
+    if os.path.exists(manifest):
+        # Chunked backups have no .xva on the SR; the XVA is rebuilt here and piped into xe.
+        def stream():
+            sent = 0
+            for data in chunk_store.read(sr_uuid, manifest):
+                throttle.consume(job.job_uuid, len(data))
+                sent += len(data)
+                progress_hub.report(job.job_uuid, bytes_written=sent)
+                yield data
+
+        command = f"xe vm-import filename=/dev/stdin sr-uuid={sr_uuid} preserve={params['preserve']}"
+        return _run_ssh(host, command, stdin=stream())
+
+    xva_name = f"{base_uuid}.xva"
+    xva_path = dom0_artifact_path(sr_uuid, params['vm_uuid'], base_uuid)
+
+    # Like the HTTP restore engine, xe vm-import lets XAPI detect gzip and zstd archives itself.
+    command = (
+        f"xe vm-import filename={xva_path} "
+        f"sr-uuid={sr_uuid} preserve={params['preserve']}"
+    )
+
+    with _tracked_task(host, job.job_uuid, xva_name):
+        return _run_ssh(host, command)
@@ -0,0 +1,133 @@
+import threading
+import time
+from datetime import datetime
+from pytz import timezone, utc
+
+LIMIT_KEYS = ("global_bps", "host_bps", "sr_bps")
+
+
+class TokenBucket:
+    # Tokens may go negative: a caller takes a whole chunk and then sleeps off the debt, so chunks
+    # larger than one second's allowance still flow at the configured rate.
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            if rate != self.rate:
+                self.rate = rate
+                self.tokens = min(self.tokens, rate)
+
+    def consume(self, amount):
+        with self._lock:
+            if not self.rate:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate) - amount
+            self.updated = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class BandwidthThrottle:
+    def __init__(self):
+        self.tz = utc
+        self.base = {key: 0 for key in LIMIT_KEYS}
+        self.host_overrides = {}
+        self.sr_overrides = {}
+        self.schedule = []
+        self._global = TokenBucket()
+        self._hosts = {}
+        self._srs = {}
+        self._jobs = {}
+        self._minute = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.tz = timezone(app.config.get('SCHEDULER_TIMEZONE', 'Asia/Jakarta'))
+        self.base = {
+            "global_bps": app.config.get('THROTTLE_GLOBAL_BPS', 0),
+            "host_bps": app.config.get('THROTTLE_HOST_BPS', 0),
+            "sr_bps": app.config.get('THROTTLE_SR_BPS', 0)
+        }
+        self.host_overrides = app.config.get('THROTTLE_HOST_LIMITS') or {}
+        self.sr_overrides = app.config.get('THROTTLE_SR_LIMITS') or {}
+        self.schedule = [self._window(entry) for entry in app.config.get('THROTTLE_SCHEDULE') or []]
+        self._minute = None
+        app.extensions['throttle'] = self
+
+    def _window(self, entry):
+        start_hour, start_minute = map(int, entry["from"].split(":"))
+        end_hour, end_minute = map(int, entry["to"].split(":"))
+        limits = {key: entry[key] for key in LIMIT_KEYS if key in entry}
+        if entry.get("unlimited"):
+            limits = {key: 0 for key in LIMIT_KEYS}
+        return start_hour * 60 + start_minute, end_hour * 60 + end_minute, limits
+
+    def profile(self, moment=None):
+        # The first window covering the current minute wins; windows may wrap past midnight.
+        moment = moment or datetime.now(self.tz)
+        minute = moment.hour * 60 + moment.minute
+        for start, end, limits in self.schedule:
+            inside = start <= minute < end if start <= end else minute >= start or minute < end
+            if inside:
+                return limits
+        return {}
+
+    def _rates(self, profile, host_ip, sr_uuid):
+        host_rate = profile.get("host_bps", self.host_overrides.get(host_ip, self.base["host_bps"]))
+        sr_rate = profile.get("sr_bps", self.sr_overrides.get(sr_uuid, self.base["sr_bps"]))
+        return host_rate, sr_rate
+
+    def _refresh(self):
+        minute = int(time.time() // 60)
+        if minute == self._minute:
+            return
+        self._minute = minute
+
+        profile = self.profile()
+        self._global.set_rate(profile.get("global_bps", self.base["global_bps"]))
+        for host_ip, bucket in self._hosts.items():
+            bucket.set_rate(self._rates(profile, host_ip, None)[0])
+        for sr_uuid, bucket in self._srs.items():
+            bucket.set_rate(self._rates(profile, None, sr_uuid)[1])
+
+    def bind(self, job_uuid, host_ip=None, sr_uuid=None):
+        with self._lock:
+            self._refresh()
+            host_rate, sr_rate = self._rates(self.profile(), host_ip, sr_uuid)
+            buckets = [self._global]
+            if host_ip is not None:
+                buckets.append(self._hosts.setdefault(host_ip, TokenBucket(host_rate)))
+            if sr_uuid is not None:
+                buckets.append(self._srs.setdefault(sr_uuid, TokenBucket(sr_rate)))
+            self._jobs[job_uuid] = buckets
+
+    def release(self, job_uuid):
+        with self._lock:
+            self._jobs.pop(job_uuid, None)
+
+    def consume(self, job_uuid, amount):
+        with self._lock:
+            self._refresh()
+            buckets = self._jobs.get(job_uuid, [self._global])
+        return sum(bucket.consume(amount) for bucket in buckets)
+
+    def snapshot(self):
+        with self._lock:
+            self._refresh()
+            return {
+                "profile": self.profile(),
+                "global_bps": self._global.rate,
+                "hosts": {host_ip: bucket.rate for host_ip, bucket in self._hosts.items()},
+                "srs": {sr_uuid: bucket.rate for sr_uuid, bucket in self._srs.items()},
+                "active_jobs": len(self._jobs)
+            }
+
+
+throttle = BandwidthThrottle()
@@ -0,0 +1,110 @@
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from models import JobSpan
+
+SERVICE_NAME = "xcp-backup-lite"
+
+# OTLP status codes: STATUS_CODE_OK and STATUS_CODE_ERROR.
+OTLP_OK = 1
+OTLP_ERROR = 2
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+class JobTracer:
+    # Spans are buffered in memory per job_uuid and written once the job's final status is committed,
+    # so a handler's rollback can't lose them. Each thread keeps a stack of open spans; a span opened
+    # without a job_uuid nests under whatever job the calling thread is already tracing.
+    def __init__(self):
+        self.enabled = True
+        self._spans = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('TRACING_ENABLED', True)
+        app.extensions['tracer'] = self
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def span(self, name, job_uuid=None):
+        stack = self._stack()
+        if job_uuid is None and stack:
+            job_uuid = stack[-1][0]
+        if not self.enabled or job_uuid is None:
+            yield {}
+            return
+
+        parent_seq = stack[-1][1] if stack and stack[-1][0] == job_uuid else None
+        with self._lock:
+            spans = self._spans.setdefault(job_uuid, [])
+            entry = {"seq": len(spans), "parent_seq": parent_seq, "name": name, "start_us": _now_us(),
+                     "duration_us": 0, "error": False, "bytes": None}
+            # Reserve the slot up front so children opened inside get a later seq than their parent.
+            spans.append(entry)
+
+        stack.append((job_uuid, entry["seq"]))
+        started = time.perf_counter_ns()
+        try:
+            yield entry
+        except BaseException:
+            entry["error"] = True
+            raise
+        finally:
+            entry["duration_us"] = (time.perf_counter_ns() - started) // 1000
+            stack.pop()
+
+    def take(self, job_uuid):
+        with self._lock:
+            return self._spans.pop(job_uuid, [])
+
+    def rows(self, job):
+        return [JobSpan(job_id=job.id, **span) for span in self.take(job.job_uuid)]
+
+
+def otlp_spans(job, spans):
+    trace_id = uuid.UUID(job.job_uuid).hex
+
+    def span_id(seq):
+        return f"{job.id:08x}{seq:08x}"
+
+    result = []
+    for span in spans:
+        attributes = [
+            {"key": "job.uuid", "value": {"stringValue": job.job_uuid}},
+            {"key": "job.type", "value": {"stringValue": job.type}}
+        ]
+        if span.bytes is not None:
+            attributes.append({"key": "xcp.bytes", "value": {"intValue": str(span.bytes)}})
+
+        item = {
+            "traceId": trace_id,
+            "spanId": span_id(span.seq),
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_us * 1000),
+            "endTimeUnixNano": str((span.start_us + span.duration_us) * 1000),
+            "attributes": attributes,
+            "status": {"code": OTLP_ERROR if span.error else OTLP_OK}
+        }
+        if span.parent_seq is not None:
+            item["parentSpanId"] = span_id(span.parent_seq)
+        result.append(item)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": f"{SERVICE_NAME}.jobs"}, "spans": result}]
+        }]
+    }
+
+
+tracer = JobTracer()
@@ -0,0 +1,171 @@
+import hashlib
+import http.client
+import socket
+import threading
+import time
+import xmlrpc.client
+from contextlib import contextmanager
+import XenAPI
+from services.metrics import xapi_call_seconds
+
+CONNECTION_ERRORS = (socket.error, http.client.HTTPException, xmlrpc.client.ProtocolError)
+
+
+class TimedSession(XenAPI.Session):
+    def xenapi_request(self, methodname, params):
+        started = time.perf_counter()
+        try:
+            return super().xenapi_request(methodname, params)
+        finally:
+            xapi_call_seconds.observe(time.perf_counter() - started, method=methodname)
+
+
+class PooledSession:
+    def __init__(self, session):
+        self.session = session
+        self.last_used = time.monotonic()
+
+
+class HostSessions:
+    def __init__(self, host_ip, username, password):
+        self.host_ip = host_ip
+        self.username = username
+        self.password = password
+        self.idle = []
+        self.in_use = 0
+
+
+class XapiSessionPool:
+    def __init__(self, max_per_host=8, idle_seconds=300, health_check_seconds=60, checkout_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_seconds = idle_seconds
+        self.health_check_seconds = health_check_seconds
+        self.checkout_timeout = checkout_timeout
+        self._hosts = {}
+        self._cond = threading.Condition()
+        self._reaper = None
+
+    def init_app(self, app, start=True):
+        self.max_per_host = app.config.get('XAPI_SESSIONS_PER_HOST', self.max_per_host)
+        self.idle_seconds = app.config.get('XAPI_SESSION_IDLE_SECONDS', self.idle_seconds)
+        self.health_check_seconds = app.config.get('XAPI_HEALTH_CHECK_SECONDS', self.health_check_seconds)
+        app.extensions['xapi_pool'] = self
+
+        if start and self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name="xapi-session-reaper", daemon=True)
+            self._reaper.start()
+
+    @staticmethod
+    def _fingerprint(host):
+        return hashlib.sha256(f"{host.host_ip}\0{host.username}\0{host.password}".encode()).hexdigest()
+
+    def _login(self, entry):
+        session = TimedSession(f"http://{entry.host_ip}")
+        session.login_with_password(entry.username, entry.password, "1.0", "xcp-backup-lite")
+        return PooledSession(session)
+
+    def _logout(self, pooled):
+        try:
+            pooled.session.xenapi.session.logout()
+        except Exception:
+            pass
+
+    def _checkout(self, host):
+        key = (host.id, self._fingerprint(host))
+        deadline = time.monotonic() + self.checkout_timeout
+
+        with self._cond:
+            stale = [k for k in self._hosts if k[0] == host.id and k != key]
+            expired = []
+            for k in stale:
+                expired.extend(self._hosts[k].idle)
+                del self._hosts[k]
+
+            entry = self._hosts.get(key)
+            if entry is None:
+                entry = self._hosts[key] = HostSessions(host.host_ip, host.username, host.password)
+
+            while not entry.idle and entry.in_use >= self.max_per_host:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free XenAPI session for {host.host_ip}")
+                self._cond.wait(remaining)
+
+            pooled = entry.idle.pop() if entry.idle else None
+            entry.in_use += 1
+
+        for old in expired:
+            self._logout(old)
+
+        try:
+            if pooled is not None and time.monotonic() - pooled.last_used > self.health_check_seconds:
+                try:
+                    pooled.session.xenapi.session.get_this_host(pooled.session.handle)
+                except CONNECTION_ERRORS:
+                    pooled = None
+            if pooled is None:
+                pooled = self._login(entry)
+        except Exception:
+            self._checkin(key, None)
+            raise
+
+        return key, pooled
+
+    def _checkin(self, key, pooled):
+        with self._cond:
+            entry = self._hosts.get(key)
+            if entry is not None:
+                entry.in_use -= 1
+                if pooled is not None:
+                    pooled.last_used = time.monotonic()
+                    entry.idle.append(pooled)
+                    pooled = None
+            self._cond.notify_all()
+
+        if pooled is not None:
+            self._logout(pooled)
+
+    @contextmanager
+    def session(self, host):
+        key, pooled = self._checkout(host)
+        try:
+            yield pooled.session
+        except CONNECTION_ERRORS:
+            # The underlying connection is unusable; drop it rather than hand it out again.
+            self._checkin(key, None)
+            raise
+        except BaseException:
+            self._checkin(key, pooled)
+            raise
+        else:
+            self._checkin(key, pooled)
+
+    def discard(self, host_id):
+        with self._cond:
+            keys = [k for k in self._hosts if k[0] == host_id]
+            expired = [pooled for k in keys for pooled in self._hosts.pop(k).idle]
+            self._cond.notify_all()
+
+        for pooled in expired:
+            self._logout(pooled)
+
+    def reap(self):
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for entry in self._hosts.values():
+                keep = []
+                for pooled in entry.idle:
+                    (expired if now - pooled.last_used > self.idle_seconds else keep).append(pooled)
+                entry.idle = keep
+
+        for pooled in expired:
+            self._logout(pooled)
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(self.idle_seconds, 30))
+            self.reap()
+
+
+xapi_pool = XapiSessionPool()
@@ -0,0 +1,457 @@
+import glob
+import io
+import os
+import random
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+import zlib
+from datetime import datetime, timedelta
+from unittest import mock
+from pytz import utc
+
+from services.chunk_store import ChunkStore
+from services.cron import CronSchedule, CronError
+from services.fair_queue import FairQueue
+from services.job_engine import JobError
+from services.scheduler import BackupScheduler
+
+app = None
+tmp_dir = None
+
+
+def setUpModule():
+    # The app is built once against a throwaway SQLite file, never the committed instance database.
+    global app, tmp_dir
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'test.db')}"
+    os.environ["BACKUP_MOUNT_ROOT"] = os.path.join(tmp_dir, "sr-mount")
+
+    from app import create_app
+    app = create_app(start_workers=False)
+
+
+def tearDownModule():
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def add_backup(**fields):
+    from models import db, Backup
+    values = dict(name="nightly", description="", sr_uuid="sr-1", sr_name="nfs", vm_uuid="vm-1", vm_name="web",
+                  host_ip="10.0.0.1", active=True, retention=1, cron_schedule="0 2 * * *")
+    values.update(fields)
+    backup = Backup(**values)
+    db.session.add(backup)
+    db.session.commit()
+    return backup
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        from models import db, Backup, Job
+        db.session.rollback()
+        Job.query.delete()
+        Backup.query.delete()
+        db.session.commit()
+        db.session.remove()
+        self.context.pop()
+
+
+def add_job(backup, completed_at, status="Success", **fields):
+    from models import db, Job
+    values = dict(type="backup", status=status, backup_id=backup.id, mode="full", engine="http",
+                  started_at=completed_at - timedelta(minutes=5), completed_at=completed_at)
+    values.update(fields)
+    job = Job(**values)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+class CronScheduleTest(unittest.TestCase):
+    def test_next_after_steps_and_ranges(self):
+        schedule = CronSchedule("*/15 9-17 * * *")
+        self.assertEqual(schedule.next_after(datetime(2025, 1, 6, 9, 7)), datetime(2025, 1, 6, 9, 15))
+        self.assertEqual(schedule.next_after(datetime(2025, 1, 6, 17, 45)), datetime(2025, 1, 7, 9, 0))
+
+    def test_names_and_macros(self):
+        self.assertEqual(CronSchedule("@daily").expression, "0 0 * * *")
+        schedule = CronSchedule("30 1 * JAN-FEB MON")
+        self.assertEqual(schedule.next_after(datetime(2025, 1, 1)), datetime(2025, 1, 6, 1, 30))
+        self.assertEqual(schedule.next_after(datetime(2025, 2, 28)), datetime(2026, 1, 5, 1, 30))
+
+    def test_sunday_is_zero_and_seven(self):
+        self.assertEqual(CronSchedule("0 0 * * 7").weekdays, {0})
+        self.assertEqual(CronSchedule("0 0 * * 0").weekdays, {0})
+
+    def test_day_fields_match_either_when_both_restricted(self):
+        # 2025-01-03 is a Friday; the 13th is a Monday.
+        schedule = CronSchedule("0 0 13 * FRI")
+        self.assertEqual(schedule.next_after(datetime(2025, 1, 1)), datetime(2025, 1, 3))
+        self.assertEqual(schedule.next_after(datetime(2025, 1, 10)), datetime(2025, 1, 13))
+
+    def test_invalid_expressions(self):
+        for expression in ["", "* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *", "x * * * *"]:
+            with self.assertRaises(CronError, msg=expression):
+                CronSchedule(expression)
+
+    def test_impossible_date_never_fires(self):
+        with self.assertRaises(CronError):
+            CronSchedule("0 0 30 2 *").next_after(datetime(2025, 1, 1))
+
+
+class BackupSchedulerTest(DatabaseTestCase):
+    def scheduler(self, spread_seconds=300):
+        scheduler = BackupScheduler()
+        scheduler.init_app(app, start=False)
+        scheduler.spread_seconds = spread_seconds
+        return scheduler
+
+    def test_spread_is_stable_and_bounded(self):
+        scheduler = self.scheduler()
+        offsets = [scheduler._offset(backup_id) for backup_id in range(1, 101)]
+        self.assertTrue(all(0 <= offset < 300 for offset in offsets))
+        self.assertEqual(offsets, [self.scheduler()._offset(backup_id) for backup_id in range(1, 101)])
+        # A shared slot should not collapse onto a handful of seconds.
+        self.assertGreater(len(set(offsets)), 50)
+        self.assertEqual(self.scheduler(spread_seconds=0)._offset(7), 0)
+
+    def test_sync_pushes_spread_fire_times(self):
+        backups = [add_backup(cron_schedule="0 2 * * *") for _ in range(3)]
+        scheduler = self.scheduler()
+        scheduler._sync()
+
+        nominal = scheduler._next_fire(CronSchedule("0 2 * * *"), datetime.now(utc)).timestamp()
+        upcoming = dict((backup_id, fire_at) for fire_at, backup_id in scheduler.upcoming())
+        self.assertEqual(set(upcoming), {backup.id for backup in backups})
+        for backup in backups:
+            self.assertEqual(upcoming[backup.id], nominal + scheduler._offset(backup.id))
+
+    def test_sync_skips_invalid_inactive_and_replaced_schedules(self):
+        from models import db
+        kept = add_backup(cron_schedule="0 2 * * *")
+        changed = add_backup(cron_schedule="0 2 * * *")
+        paused = add_backup(cron_schedule="0 2 * * *")
+        add_backup(cron_schedule="not a cron")
+        scheduler = self.scheduler(spread_seconds=0)
+        scheduler._sync()
+
+        changed.cron_schedule = "0 3 * * *"
+        paused.active = False
+        db.session.commit()
+        scheduler._sync()
+
+        upcoming = scheduler.upcoming()
+        self.assertEqual(sorted(backup_id for _, backup_id in upcoming), sorted([kept.id, changed.id]))
+        # The old 02:00 entry of the changed backup is dropped, not left to fire alongside the new one.
+        self.assertEqual(len(scheduler._heap), 2)
+        fire_hour = {backup_id: datetime.fromtimestamp(fire_at, scheduler.tz).hour for fire_at, backup_id in upcoming}
+        self.assertEqual(fire_hour, {kept.id: 2, changed.id: 3})
+
+    def test_sync_skips_schedule_that_never_fires(self):
+        # One backup whose expression parses but never matches must not stop every other backup firing.
+        broken = add_backup(cron_schedule="0 0 31 2 *")
+        kept = add_backup(cron_schedule="0 2 * * *")
+        scheduler = self.scheduler()
+        scheduler._sync()
+        self.assertEqual([backup_id for _, backup_id in scheduler.upcoming()], [kept.id])
+        self.assertNotIn(broken.id, scheduler._entries)
+
+    def test_add_and_update_reject_schedule_that_never_fires(self):
+        backup = add_backup()
+        client = app.test_client()
+        response = client.patch(f"/api/backup/update/{backup.id}", json={"cron_schedule": "0 0 31 2 *"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("never fires", response.json["error"])
+
+        response = client.post("/api/backup/add", json={
+            "name": "n", "description": "", "sr_uuid": "sr-1", "sr_name": "nfs", "vm_uuid": "vm-1",
+            "vm_name": "web", "host_ip": "10.0.0.1", "active": True, "retention": 1, "cron_schedule": "0 0 31 2 *"
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_fire_skips_backup_with_job_in_flight(self):
+        from models import db, Job
+        backup = add_backup()
+        scheduler = self.scheduler()
+
+        with mock.patch("services.scheduler.queue_backup_job") as queue_backup_job:
+            db.session.add(Job(type="backup", status="Running", backup_id=backup.id))
+            db.session.commit()
+            scheduler._fire(backup.id)
+            queue_backup_job.assert_not_called()
+
+            Job.query.update({"status": "Success"})
+            db.session.commit()
+            scheduler._fire(backup.id)
+            queue_backup_job.assert_called_once_with(backup.host_ip, backup.vm_uuid, backup.sr_uuid, backup.id,
+                                                     mode=backup.backup_mode)
+
+    def test_fire_skips_inactive_backup(self):
+        backup = add_backup(active=False)
+        with mock.patch("services.scheduler.queue_backup_job") as queue_backup_job:
+            self.scheduler()._fire(backup.id)
+            queue_backup_job.assert_not_called()
+
+
+class FairQueueTest(unittest.TestCase):
+    def drain(self, queue, count):
+        values = []
+        for _ in range(count):
+            item = queue.get()
+            values.append(item.value)
+            queue.release(item)
+        return values
+
+    def test_flows_are_interleaved(self):
+        queue = FairQueue(host_limit=10, sr_limit=10)
+        for i in range(3):
+            queue.put(f"a{i}", flow="a")
+        for i in range(3):
+            queue.put(f"b{i}", flow="b")
+        self.assertEqual(self.drain(queue, 6), ["a0", "b0", "a1", "b1", "a2", "b2"])
+
+    def test_weight_sets_share(self):
+        queue = FairQueue(host_limit=10, sr_limit=10)
+        for i in range(4):
+            queue.put(f"heavy{i}", flow="heavy", weight=2)
+            queue.put(f"light{i}", flow="light")
+        self.assertEqual(self.drain(queue, 3), ["heavy0", "heavy1", "light0"])
+
+    def test_new_flow_does_not_jump_ahead_of_served_work(self):
+        queue = FairQueue(host_limit=10, sr_limit=10)
+        for i in range(3):
+            queue.put(f"a{i}", flow="a")
+        self.assertEqual(self.drain(queue, 2), ["a0", "a1"])
+        # A late arrival starts at the current virtual time rather than 0, so it gets its fair turn, not a burst.
+        queue.put("b0", flow="b")
+        queue.put("b1", flow="b")
+        self.assertEqual(self.drain(queue, 3), ["a2", "b0", "b1"])
+
+    def test_busy_host_and_sr_are_skipped(self):
+        queue = FairQueue(host_limit=1, sr_limit=2)
+        queue.put("h1-first", flow="a", host="h1", sr="sr1")
+        queue.put("h1-second", flow="b", host="h1", sr="sr2")
+        queue.put("h2", flow="c", host="h2", sr="sr1")
+        queue.put("h3", flow="d", host="h3", sr="sr1")
+
+        first = queue.get()
+        second = queue.get()
+        self.assertEqual((first.value, second.value), ("h1-first", "h2"))
+        # h1 is at its limit and sr1 now runs two exports, so nothing else is eligible.
+        self.assertIsNone(queue._pick())
+        self.assertEqual(queue.snapshot()["running_per_host"], {"h1": 1, "h2": 1})
+
+        queue.release(first)
+        self.assertEqual([queue.get().value, queue.get().value], ["h1-second", "h3"])
+
+    def test_overrides_replace_default_limits(self):
+        queue = FairQueue(host_limit=1, sr_limit=10, host_overrides={"big": 2})
+        for i in range(3):
+            queue.put(f"big{i}", flow=("backup", i), host="big")
+        self.assertEqual([queue.get().value, queue.get().value], ["big0", "big1"])
+        self.assertIsNone(queue._pick())
+
+    def test_drained_flows_are_forgotten(self):
+        queue = FairQueue(host_limit=10, sr_limit=10)
+        for i in range(100):
+            queue.put(i, flow=("backup", "job", i))
+        self.assertEqual(self.drain(queue, 100), list(range(100)))
+        self.assertEqual(queue._last_finish, {})
+
+        queue.put("a0", flow="a")
+        queue.put("a1", flow="a")
+        self.drain(queue, 1)
+        self.assertIn("a", queue._last_finish)
+
+    def test_close_wakes_getters(self):
+        queue = FairQueue()
+        queue.close()
+        self.assertIsNone(queue.get())
+
+
+class ChunkStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ChunkStore(mount_root=self.root, min_chunk=8 * 1024, avg_chunk=32 * 1024,
+                                max_chunk=128 * 1024, workers=2)
+        self.random = random.Random(42)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def xva(self, *members):
+        # Same layout as an XVA: a tar of fixed-size disk blocks.
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as archive:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return buffer.getvalue()
+
+    def write(self, job_uuid, data, piece=10000):
+        writer = self.store.writer("sr", "vm", job_uuid)
+        for offset in range(0, len(data), piece):
+            writer.write(data[offset:offset + piece])
+        new_bytes = writer.commit()
+        return writer.path, new_bytes
+
+    def read(self, manifest):
+        return b"".join(self.store.read("sr", manifest))
+
+    def test_tar_round_trip_dedups_identical_blocks(self):
+        block = self.random.randbytes(64 * 1024)
+        data = self.xva(("ova.xml", b"<value/>"), ("Ref:1/00000000", block), ("Ref:1/00000001", block),
+                        ("Ref:1/00000002", self.random.randbytes(64 * 1024)))
+        manifest, new_bytes = self.write("job-1", data)
+
+        self.assertEqual(self.read(manifest), data)
+        self.assertEqual(self.store.manifest_size(manifest), len(data))
+        # Two distinct blocks are stored once each, whatever the order they arrived in.
+        self.assertEqual(len(glob.glob(os.path.join(self.store.chunk_dir("sr"), "*", "*", "*"))), 2)
+
+        manifest, new_bytes = self.write("job-2", data, piece=4096)
+        self.assertEqual(new_bytes, 0)
+        self.assertEqual(self.read(manifest), data)
+
+    def test_non_tar_round_trip(self):
+        data = self.random.randbytes(600 * 1024)
+        manifest, new_bytes = self.write("job-1", data)
+        self.assertEqual(self.read(manifest), data)
+        self.assertGreater(new_bytes, 0)
+
+    def test_corrupt_chunk_is_detected(self):
+        manifest, _ = self.write("job-1", self.xva(("Ref:1/00000000", self.random.randbytes(64 * 1024))))
+        chunk = glob.glob(os.path.join(self.store.chunk_dir("sr"), "*", "*", "*"))[0]
+        with open(chunk, "wb") as out:
+            out.write(zlib.compress(b"not the original block"))
+        with self.assertRaises(JobError):
+            self.read(manifest)
+
+    def age(self, path, seconds=7200):
+        stamp = time.time() - seconds
+        os.utime(path, (stamp, stamp))
+
+    def test_collect_keeps_chunks_of_uncommitted_backup(self):
+        data = self.xva(("Ref:1/00000000", self.random.randbytes(64 * 1024)))
+        writer = self.store.writer("sr", "vm", "job-1")
+        writer.write(data)
+        writer._drain(final=False)
+        for kind, value in writer._pending:
+            if kind == "c":
+                value.result()
+
+        chunk = glob.glob(os.path.join(self.store.chunk_dir("sr"), "*", "*", "*"))[0]
+        self.age(chunk)
+        # An export older than the grace period hasn't written its manifest yet; its chunks must survive.
+        self.assertEqual(self.store.collect("sr", grace_seconds=3600), 0)
+        self.assertTrue(os.path.exists(chunk))
+
+        writer.commit()
+        self.assertFalse(os.path.exists(writer.lease_path))
+        self.assertEqual(self.read(writer.path), data)
+
+    def test_collect_drops_lease_of_dead_writer(self):
+        writer = self.store.writer("sr", "vm", "job-1")
+        writer.write(self.xva(("Ref:1/00000000", self.random.randbytes(64 * 1024))))
+        writer._drain(final=False)
+        writer._pool.shutdown()
+        writer._lease.close()
+
+        chunk = glob.glob(os.path.join(self.store.chunk_dir("sr"), "*", "*", "*"))[0]
+        self.age(chunk)
+        self.age(writer.lease_path)
+        self.assertEqual(self.store.collect("sr", grace_seconds=3600), 1)
+        self.assertFalse(os.path.exists(writer.lease_path))
+
+    def test_abort_leaves_no_manifest(self):
+        writer = self.store.writer("sr", "vm", "job-1")
+        writer.write(self.random.randbytes(200 * 1024))
+        writer.abort()
+        self.assertFalse(os.path.exists(writer.path))
+        self.assertFalse(os.path.exists(f"{writer.path}.partial"))
+        self.assertFalse(os.path.exists(writer.lease_path))
+
+
+class RetentionPlanTest(DatabaseTestCase):
+    def plan(self, backup):
+        from services.retention import retention_pruner
+        kept, expired = retention_pruner.plan(backup)
+        return [job.id for job in kept], [job.id for job in expired]
+
+    def test_keeps_newest_by_count(self):
+        backup = add_backup(retention=2)
+        jobs = [add_job(backup, datetime(2025, 3, 1, 5) + timedelta(days=i)) for i in range(5)]
+        self.assertEqual(self.plan(backup), ([jobs[4].id, jobs[3].id], [jobs[2].id, jobs[1].id, jobs[0].id]))
+
+    def test_newest_survives_zero_retention(self):
+        backup = add_backup(retention=0)
+        older = add_job(backup, datetime(2025, 3, 1, 5))
+        newest = add_job(backup, datetime(2025, 3, 2, 5))
+        self.assertEqual(self.plan(backup), ([newest.id], [older.id]))
+
+    def test_gfs_keeps_newest_job_per_bucket(self):
+        backup = add_backup(retention=1, keep_daily=2, keep_monthly=2)
+        jan_30 = add_job(backup, datetime(2025, 1, 30, 5))
+        jan_31_early = add_job(backup, datetime(2025, 1, 31, 2))
+        jan_31_late = add_job(backup, datetime(2025, 1, 31, 9))
+        feb_1 = add_job(backup, datetime(2025, 2, 1, 5))
+        feb_2 = add_job(backup, datetime(2025, 2, 2, 5))
+
+        kept, expired = self.plan(backup)
+        self.assertEqual(kept, [feb_2.id, feb_1.id, jan_31_late.id])
+        self.assertEqual(expired, [jan_31_early.id, jan_30.id])
+
+    def test_days_are_bucketed_in_scheduler_timezone(self):
+        # 18:00 UTC is already the next day in Asia/Jakarta (UTC+7), so these land in different daily buckets.
+        backup = add_backup(retention=1, keep_daily=2)
+        evening = add_job(backup, datetime(2025, 3, 1, 16))
+        late = add_job(backup, datetime(2025, 3, 1, 18))
+        self.assertEqual(self.plan(backup), ([late.id, evening.id], []))
+
+    def test_delta_chain_of_kept_job_is_kept(self):
+        backup = add_backup(retention=1)
+        unrelated = add_job(backup, datetime(2025, 3, 1, 5))
+        base = add_job(backup, datetime(2025, 3, 2, 5))
+        middle = add_job(backup, datetime(2025, 3, 3, 5), mode="delta", parent_job_id=base.id)
+        newest = add_job(backup, datetime(2025, 3, 4, 5), mode="delta", parent_job_id=middle.id)
+        self.assertEqual(self.plan(backup), ([newest.id, middle.id, base.id], [unrelated.id]))
+
+    def test_failed_and_pruned_jobs_are_ignored(self):
+        backup = add_backup(retention=1)
+        kept = add_job(backup, datetime(2025, 3, 1, 5))
+        add_job(backup, datetime(2025, 3, 2, 5), status="Failed")
+        add_job(backup, datetime(2025, 2, 1, 5), pruned_at=datetime(2025, 2, 10))
+        self.assertEqual(self.plan(backup), ([kept.id], []))
+
+    def test_prune_marks_only_removed_artifacts(self):
+        from models import db, Job
+        from services.export_engine import export_engine
+        from services.retention import retention_pruner
+        backup = add_backup(retention=1)
+        present = add_job(backup, datetime(2025, 3, 1, 5))
+        missing = add_job(backup, datetime(2025, 3, 2, 5))
+        add_job(backup, datetime(2025, 3, 3, 5))
+
+        path = export_engine.artifact_path(backup.sr_uuid, backup.vm_uuid, present.job_uuid)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "wb").close()
+
+        result = retention_pruner.prune(backup.id)
+        self.assertEqual(result["pruned"], [present.job_uuid])
+        self.assertEqual(result["missing"], [missing.job_uuid])
+        self.assertFalse(os.path.exists(path))
+        db.session.expire_all()
+        self.assertIsNotNone(db.session.get(Job, present.id).pruned_at)
+        self.assertIsNone(db.session.get(Job, missing.id).pruned_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,9 +2,11 @@ import axios from 'axios'
 const BASE_URL = import.meta.env.VITE_BACKEND_API
 
 
-export async function get_backup_jobs_by_id(backup_id) {
+export async function get_backup_jobs_by_id(backup_id, cursor = null) {
     try {
-        const response = await axios.get(`${BASE_URL}/api/job/list/backup/${backup_id}`)
+        const response = await axios.get(`${BASE_URL}/api/job/list/backup/${backup_id}`, {
+            params: cursor ? { cursor } : {}
+        })
         return {
             success: true,
             data: response.data
@@ -18,9 +20,11 @@ export async function get_backup_jobs_by_id(backup_id) {
     }
 }
 
-export async function get_restore_jobs_by_id(restore_id) {
+export async function get_restore_jobs_by_id(restore_id, cursor = null) {
     try {
-        const response = await axios.get(`${BASE_URL}/api/job/list/restore/${restore_id}`)
+        const response = await axios.get(`${BASE_URL}/api/job/list/restore/${restore_id}`, {
+            params: cursor ? { cursor } : {}
+        })
         return {
             success: true,
             data: response.data
@@ -34,6 +38,46 @@ export async function get_restore_jobs_by_id(restore_id) {
     }
 }
 
+export async function get_job_by_uuid(job_uuid) {
+    try {
+        const response = await axios.get(`${BASE_URL}/api/job/${job_uuid}`)
+        return {
+            success: true,
+            data: response.data
+        }
+    } catch (error) {
+        console.error('Failed to fetch job:', error)
+        return {
+            success: false,
+            error: error.response?.data || error.message
+        }
+    }
+}
+
+export function subscribe_job_events(job_uuid, onEvent) {
+    const source = new EventSource(`${BASE_URL}/api/jobs/${job_uuid}/events`)
+
+    source.onmessage = (message) => {
+        const event = JSON.parse(message.data)
+        onEvent(event)
+        if (event.event === 'done') source.close()
+    }
+    source.onerror = (error) => {
+        console.error('Job event stream interrupted:', error)
+    }
+
+    return () => source.close()
+}
+
+export function apply_job_event(jobs, event) {
+    return jobs.map((job) => {
+        if (job.uuid !== event.job_uuid) return job
+        if (event.event === 'progress') return { ...job, status: 'Running', progress: event }
+        if (event.event === 'status') return { ...job, status: event.status }
+        return job
+    })
+}
+
 
 export async function runBackupJob({
     host_ip,
@@ -49,11 +93,12 @@ export async function runBackupJob({
             backup_id
         })
 
-        const { job_id, job_status, output, backup_path } = response.data
+        const { job_id, job_uuid, job_status, output, backup_path } = response.data
 
         return {
             success: true,
             job_id,
+            job_uuid,
             status: job_status,
             output,
             backup_path
@@ -68,6 +113,45 @@ export async function runBackupJob({
     }
 }
 
+export async function runBackupBatch({ backup_ids, tag, host_ip }) {
+    try {
+        const response = await axios.post(`${BASE_URL}/api/xapi/backup_batch`, {
+            backup_ids,
+            tag,
+            host_ip
+        })
+
+        const { batch_uuid, jobs, missing_backup_ids } = response.data
+
+        return {
+            success: true,
+            batch_uuid,
+            jobs,
+            missing_backup_ids
+        }
+    } catch (error) {
+        return {
+            success: false,
+            message: error.response?.data?.message || 'Batch backup failed'
+        }
+    }
+}
+
+export async function get_backup_batch(batch_uuid) {
+    try {
+        const response = await axios.get(`${BASE_URL}/api/xapi/backup_batch/${batch_uuid}`)
+        return {
+            success: true,
+            data: response.data
+        }
+    } catch (error) {
+        return {
+            success: false,
+            message: error.response?.data?.message || 'Failed to fetch batch status'
+        }
+    }
+}
+
 export async function runRestoreJob({
     host_ip,
     sr_uuid,
@@ -91,11 +175,12 @@ export async function runRestoreJob({
         const response = await axios.post(`${BASE_URL}/api/xapi/restore`, payload)
         console.log(response)
 
-        const { job_id, job_status, output } = response.data
+        const { job_id, job_uuid, job_status, output } = response.data
 
         return {
             success: true,
             job_id,
+            job_uuid,
             status: job_status,
             output
         }
@@ -2,9 +2,11 @@ import axios from 'axios'
 const BASE_URL = import.meta.env.VITE_BACKEND_API
 
 
-export async function get_all_restores() {
+export async function get_all_restores(cursor = null) {
     try {
-        const response = await axios.get(`${BASE_URL}/api/restore/list`)
+        const response = await axios.get(`${BASE_URL}/api/restore/list`, {
+            params: cursor ? { cursor } : {}
+        })
         return {
             success: true,
             data: response.data
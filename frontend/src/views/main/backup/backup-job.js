@@ -17,7 +17,7 @@ import {
 import { cilMediaPlay, cilPencil, cilTrash } from '@coreui/icons';
 import CIcon from '@coreui/icons-react';
 import { fetch_backup_by_id, update_backup } from '../../../api/backup/backup_api';
-import { get_backup_jobs_by_id, runBackupJob } from '../../../api/jobs/jobs';
+import { get_backup_jobs_by_id, get_job_by_uuid, runBackupJob, subscribe_job_events, apply_job_event } from '../../../api/jobs/jobs';
 // import { update_backup_by_id } from '../../../api/backup/backup_api';
 
 const BackupJob = () => {
@@ -30,6 +30,8 @@ const BackupJob = () => {
   const [jobs, setJobs] = useState([]);
   const [runningJob, setRunningJob] = useState(false);
   const [openJobId, setOpenJobId] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const pad = (num) => String(num).padStart(2, '0');
   const formatDuration = (ms) => {
@@ -48,7 +50,10 @@ const BackupJob = () => {
       ]);
       setBackup(backupData);
       setFormData(backupData);
-      if (jobData.success) setJobs(jobData.data.jobs);
+      if (jobData.success) {
+        setJobs(jobData.data.jobs);
+        setNextCursor(jobData.data.next_cursor);
+      }
       else console.error(jobData.message);
     } catch (err) {
       setError(err.message);
@@ -57,6 +62,27 @@ const BackupJob = () => {
     }
   };
 
+  const loadMoreJobs = async () => {
+    setLoadingMore(true);
+    const jobData = await get_backup_jobs_by_id(backup_id, nextCursor);
+    if (jobData.success) {
+      setJobs((prev) => [...prev, ...jobData.data.jobs]);
+      setNextCursor(jobData.data.next_cursor);
+    }
+    setLoadingMore(false);
+  };
+
+  // The list omits output_message; fetch it the first time a row is expanded.
+  const toggleJob = async (job) => {
+    const isOpen = openJobId === job.id;
+    setOpenJobId(isOpen ? null : job.id);
+    if (isOpen || job.output_message !== undefined) return;
+    const detail = await get_job_by_uuid(job.uuid);
+    if (detail.success) {
+      setJobs((prev) => prev.map((j) => (j.id === job.id ? { ...j, output_message: detail.data.output_message } : j)));
+    }
+  };
+
   useEffect(() => {
     fetchData();
   }, [backup_id]);
@@ -64,16 +90,21 @@ const BackupJob = () => {
   const handleRunBackup = async () => {
     setRunningJob(true);
     try {
-      [1000, 3000].forEach(delay => {
-        setTimeout(() => fetchData(), delay);
-      });
       const result = await runBackupJob({
         host_ip: backup.host_ip,
         vm_uuid: backup.vm_uuid,
         sr_uuid: backup.sr_uuid,
         backup_id: parseInt(backup_id),
       });
-      alert(result.success ? '✅ Backup finished successfully.' : `❌ Backup failed: ${result.output}`);
+      if (!result.success) {
+        alert(`❌ Backup failed: ${result.output}`);
+        return;
+      }
+      await fetchData();
+      subscribe_job_events(result.job_uuid, (event) => {
+        if (event.event === 'done') fetchData();
+        else setJobs((prev) => apply_job_event(prev, event));
+      });
     } catch (err) {
       alert(`❌ Unexpected error: ${err.message}`);
     } finally {
@@ -219,7 +250,7 @@ const BackupJob = () => {
                   </tr>
                 </thead>
                 <tbody>
-                {[...jobs].reverse().map((job) => {
+                {jobs.map((job) => {
                     const started = new Date(job.started_at);
                     const ended = job.completed_at ? new Date(job.completed_at) : null;
                     const duration = ended ? formatDuration(ended - started) : '-';
@@ -228,9 +259,12 @@ const BackupJob = () => {
 
                     return (
                       <Fragment key={job.id}>
-                        <tr onClick={() => setOpenJobId(isOpen ? null : job.id)} style={{ cursor: 'pointer' }}>
+                        <tr onClick={() => toggleJob(job)} style={{ cursor: 'pointer' }}>
                           <td><strong>{job.id}</strong></td>
-                          <td><CBadge color={badgeColor}>{job.status}</CBadge></td>
+                          <td>
+                            <CBadge color={badgeColor}>{job.status}</CBadge>
+                            {job.status === 'Running' && job.progress ? ` ${job.progress.percent}%` : ''}
+                          </td>
                           <td>{started.toLocaleString()}</td>
                           <td>{ended ? ended.toLocaleString() : '-'}</td>
                           <td>{duration}</td>
@@ -253,6 +287,13 @@ const BackupJob = () => {
               </table>
             </div>
           )}
+          {nextCursor && (
+            <div className="text-center p-2">
+              <CButton color="secondary" variant="outline" size="sm" disabled={loadingMore} onClick={loadMoreJobs}>
+                {loadingMore ? <CSpinner size="sm" /> : 'Load more'}
+              </CButton>
+            </div>
+          )}
         </CCardBody>
       </CCard>
     </>
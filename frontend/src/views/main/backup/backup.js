@@ -21,13 +21,14 @@ import { cilTrash, cilPlus, cilPencil, cilMediaPlay } from '@coreui/icons';
 import BackupModal from './backup-modal.js';
 import { add_backup, fetch_backups } from '../../../api/backup/backup_api.js';
 import { useNavigate } from 'react-router-dom';
-import { runBackupJob } from '../../../api/jobs/jobs.js';
+import { runBackupJob, runBackupBatch } from '../../../api/jobs/jobs.js';
 
 const Backup = () => {
   const [backups, setBackups] = useState([]);
   const [modalVisible, setModalVisible] = useState(false);
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
+  const [runningAll, setRunningAll] = useState(false)
 
   const navigate = useNavigate();
 
@@ -72,6 +73,21 @@ const Backup = () => {
     }
   };
 
+  const handleRunAll = async () => {
+    const activeIds = backups.filter((backup) => backup.active).map((backup) => parseInt(backup.id));
+    if (activeIds.length === 0) return;
+
+    setRunningAll(true);
+    try {
+      const result = await runBackupBatch({ backup_ids: activeIds });
+      if (!result.success) {
+        alert(`❌ ${result.message}`);
+      }
+    } finally {
+      setRunningAll(false);
+    }
+  };
+
   const handleEdit = (backupObject) => {
     console.log('Editing backup:', backupObject);
     navigate(`/main/backup/${backupObject.id}`)
@@ -94,7 +110,10 @@ const Backup = () => {
 
   return (
     <>
-      <div className="d-flex justify-content-end mb-4">
+      <div className="d-flex justify-content-end gap-2 mb-4">
+        <CButton color="success" variant="outline" onClick={handleRunAll} disabled={runningAll || loading}>
+          {runningAll ? <CSpinner size="sm" /> : <CIcon icon={cilMediaPlay} />} Run All Active
+        </CButton>
         <CButton color="primary" variant="outline" onClick={handleModalOpen}>
           <CIcon icon={cilPlus} /> Add New Backup
         </CButton>
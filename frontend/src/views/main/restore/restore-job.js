@@ -20,7 +20,7 @@ import {
 import { cilMediaPlay, cilPencil, cilTrash, cilSave } from '@coreui/icons';
 import CIcon from '@coreui/icons-react';
 import { get_restore_by_id, update_restore_by_id } from '../../../api/restore/restore_api';
-import { runRestoreJob, get_restore_jobs_by_id } from '../../../api/jobs/jobs';
+import { runRestoreJob, get_restore_jobs_by_id, get_job_by_uuid, subscribe_job_events, apply_job_event } from '../../../api/jobs/jobs';
 import { fetch_backup_versions_by_backup_id } from '../../../api/backup/backup_api';
 
 const RestoreJob = () => {
@@ -31,6 +31,8 @@ const RestoreJob = () => {
     const [jobs, setJobs] = useState([]);
     const [runningJob, setRunningJob] = useState(false);
     const [openJobId, setOpenJobId] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [backupVersions, setBackupVersions] = useState([]);
     const [latestToggle, setLatestToggle] = useState(true);
     const [selectedBackupVersion, setSelectedBackupVersion] = useState(null);
@@ -66,7 +68,10 @@ const RestoreJob = () => {
                 power_on_after_restore: restoreData.data.power_on_after_restore,
             });
 
-            if (jobData.success) setJobs(jobData.data.jobs);
+            if (jobData.success) {
+                setJobs(jobData.data.jobs);
+                setNextCursor(jobData.data.next_cursor);
+            }
             else console.error(jobData.message);
         } catch (err) {
             setError(err.message);
@@ -92,6 +97,27 @@ const RestoreJob = () => {
         }
     }
 
+    const loadMoreJobs = async () => {
+        setLoadingMore(true);
+        const jobData = await get_restore_jobs_by_id(restore_id, nextCursor);
+        if (jobData.success) {
+            setJobs((prev) => [...prev, ...jobData.data.jobs]);
+            setNextCursor(jobData.data.next_cursor);
+        }
+        setLoadingMore(false);
+    };
+
+    // The list omits output_message; fetch it the first time a row is expanded.
+    const toggleJob = async (job) => {
+        const isOpen = openJobId === job.id;
+        setOpenJobId(isOpen ? null : job.id);
+        if (isOpen || job.output_message !== undefined) return;
+        const detail = await get_job_by_uuid(job.uuid);
+        if (detail.success) {
+            setJobs((prev) => prev.map((j) => (j.id === job.id ? { ...j, output_message: detail.data.output_message } : j)));
+        }
+    };
+
     useEffect(() => {
         fetchData();
     }, [restore_id]);
@@ -122,7 +148,15 @@ const RestoreJob = () => {
                 backup_id: restore.backup_id,
                 is_latest_backup: latestToggle,
             });
-            alert(result.success ? '✅ Restore finished successfully.' : `❌ Restore failed: ${result.output}`);
+            if (!result.success) {
+                alert(`❌ Restore failed: ${result.output}`);
+                return;
+            }
+            await fetchData();
+            subscribe_job_events(result.job_uuid, (event) => {
+                if (event.event === 'done') fetchData();
+                else setJobs((prev) => apply_job_event(prev, event));
+            });
         } catch (err) {
             alert(`❌ Unexpected error: ${err.message}`);
         } finally {
@@ -302,7 +336,7 @@ const RestoreJob = () => {
                                     </tr>
                                 </thead>
                                 <tbody>
-                                {[...jobs].reverse().map((job) => {
+                                {jobs.map((job) => {
                                         const started = new Date(job.started_at);
                                         const ended = job.completed_at ? new Date(job.completed_at) : null;
                                         const duration = ended ? formatDuration(ended - started) : '-';
@@ -311,9 +345,12 @@ const RestoreJob = () => {
 
                                         return (
                                             <Fragment key={job.id}>
-                                                <tr onClick={() => setOpenJobId(isOpen ? null : job.id)} style={{ cursor: 'pointer' }}>
+                                                <tr onClick={() => toggleJob(job)} style={{ cursor: 'pointer' }}>
                                                     <td><strong>{job.id}</strong></td>
-                                                    <td><CBadge color={badgeColor}>{job.status}</CBadge></td>
+                                                    <td>
+                                                        <CBadge color={badgeColor}>{job.status}</CBadge>
+                                                        {job.status === 'Running' && job.progress ? ` ${job.progress.percent}%` : ''}
+                                                    </td>
                                                     <td>{started.toLocaleString()}</td>
                                                     <td>{ended ? ended.toLocaleString() : '-'}</td>
                                                     <td>{duration}</td>
@@ -336,6 +373,13 @@ const RestoreJob = () => {
                             </table>
                         </div>
                     )}
+                    {nextCursor && (
+                        <div className="text-center p-2">
+                            <CButton color="secondary" variant="outline" size="sm" disabled={loadingMore} onClick={loadMoreJobs}>
+                                {loadingMore ? <CSpinner size="sm" /> : 'Load more'}
+                            </CButton>
+                        </div>
+                    )}
                 </CCardBody>
             </CCard>
         </>
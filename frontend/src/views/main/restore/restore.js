@@ -16,6 +16,8 @@ const Restore = () => {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [modalVisible, setModalVisible] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   const handleModalClose = () => setModalVisible(false);
   const handleModalOpen = () => setModalVisible(true);
@@ -26,7 +28,8 @@ const Restore = () => {
       try {
         const result = await get_all_restores()
         if (result.success) {
-          setRestores(result.data)
+          setRestores(result.data.restores)
+          setNextCursor(result.data.next_cursor)
         } else {
           throw new Error(result.message)
         }
@@ -40,10 +43,20 @@ const Restore = () => {
     fetchRestores()
   }, [])
 
+  const loadMoreRestores = async () => {
+    setLoadingMore(true)
+    const result = await get_all_restores(nextCursor)
+    if (result.success) {
+      setRestores((prev) => [...prev, ...result.data.restores])
+      setNextCursor(result.data.next_cursor)
+    }
+    setLoadingMore(false)
+  }
+
   function handleSaveRestore(restore) {
     setRestores((prevRestore) => [
-      ...prevRestore,
       { id: prevRestore.length + 1, ...restore },
+      ...prevRestore,
     ]);
   }
 
@@ -135,6 +148,13 @@ const Restore = () => {
               </CTable>
             </div>
           )}
+          {nextCursor && (
+            <div className="text-center p-2">
+              <CButton color="secondary" variant="outline" size="sm" disabled={loadingMore} onClick={loadMoreRestores}>
+                {loadingMore ? <CSpinner size="sm" /> : 'Load more'}
+              </CButton>
+            </div>
+          )}
         </CCardBody>
       </CCard>
     </>